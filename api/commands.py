@@ -2,14 +2,17 @@ import base64
 import json
 import logging
 import secrets
+import time
 from typing import Optional
 
 import click
 from flask import current_app
+from sqlalchemy import func, update
 from werkzeug.exceptions import NotFound
 
 from configs import dify_config
 from constants.languages import languages
+from core.helper.provider_configurations_cache import invalidate_provider_configurations
 from core.rag.datasource.vdb.vector_factory import Vector
 from core.rag.datasource.vdb.vector_type import VectorType
 from core.rag.models.document import Document
@@ -20,7 +23,7 @@ from libs.helper import email as email_validate
 from libs.password import hash_password, password_pattern, valid_password
 from libs.rsa import generate_key_pair
 from models import Tenant
-from models.dataset import Dataset, DatasetCollectionBinding, DocumentSegment
+from models.dataset import Dataset, DatasetCollectionBinding, DatasetKeywordTable, DocumentSegment, Embedding
 from models.dataset import Document as DatasetDocument
 from models.model import Account, App, AppAnnotationSetting, AppMode, Conversation, MessageAnnotation
 from models.provider import Provider, ProviderModel
@@ -128,6 +131,7 @@ def reset_encrypt_key_pair():
         db.session.query(Provider).filter(Provider.provider_type == "custom", Provider.tenant_id == tenant.id).delete()
         db.session.query(ProviderModel).filter(ProviderModel.tenant_id == tenant.id).delete()
         db.session.commit()
+        invalidate_provider_configurations([tenant.id])
 
         click.echo(
             click.style(
@@ -649,3 +653,141 @@ where sites.id is null limit 1000"""
                 break
 
     click.echo(click.style("Fix for missing app-related sites completed successfully!", fg="green"))
+
+
+@click.command("migrate-embedding-format", help="Convert cached embeddings to the compact binary format.")
+@click.option("--batch-size", default=1000, prompt=False, help="Number of embeddings converted per transaction.")
+@click.option("--sleep", default=0.0, prompt=False, help="Seconds to sleep between batches to limit database load.")
+def migrate_embedding_format(batch_size: int, sleep: float):
+    """
+    Rewrite pickled rows of the embeddings table in the versioned float32 format.
+    Rows are walked by primary key, so the command can be interrupted and resumed safely.
+    """
+    click.echo(click.style("Starting embedding format migration.", fg="green"))
+
+    magic = Embedding.EMBEDDING_FORMAT_MAGIC
+    converted_count = 0
+    failed_count = 0
+    last_id = None
+    while True:
+        query = db.session.query(Embedding.id, Embedding.embedding).filter(
+            func.substring(Embedding.embedding, 1, len(magic)) != magic
+        )
+        if last_id is not None:
+            query = query.filter(Embedding.id > last_id)
+        rows = query.order_by(Embedding.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        params = []
+        for row in rows:
+            try:
+                embedding = Embedding.encode_embedding(Embedding.decode_embedding(row.embedding))
+                params.append({"id": row.id, "embedding": embedding})
+            except Exception:
+                failed_count += 1
+                logging.exception(f"Failed to convert embedding, id: {row.id}")
+        if params:
+            db.session.execute(update(Embedding), params)
+            db.session.commit()
+        converted_count += len(params)
+        click.echo(f"Converted {converted_count} embeddings.")
+        if sleep:
+            time.sleep(sleep)
+
+    click.echo(
+        click.style(
+            f"Embedding format migration complete. Converted {converted_count} embeddings, {failed_count} failed.",
+            fg="green",
+        )
+    )
+
+
+@click.command(
+    "migrate-keyword-inverted-index", help="Copy the keyword tables of datasets into the inverted keyword index."
+)
+def migrate_keyword_inverted_index():
+    """
+    Fill the inverted keyword index used by the `jieba_inverted_index` keyword store from the keyword tables,
+    and add the segment lengths used by BM25 ranking to keyword tables saved before they were stored.
+    Postings are inserted idempotently, so the command can be run again after an interruption.
+    """
+    from core.rag.datasource.keyword.jieba.jieba import Jieba
+    from core.rag.datasource.keyword.jieba.jieba_inverted_index import JiebaInvertedIndex
+
+    click.echo(click.style("Starting keyword inverted index migration.", fg="green"))
+
+    dataset_keyword_table_ids = [row.id for row in db.session.query(DatasetKeywordTable.id).all()]
+    migrated_count = 0
+    failed_count = 0
+    for dataset_keyword_table_id in dataset_keyword_table_ids:
+        dataset_keyword_table = db.session.get(DatasetKeywordTable, dataset_keyword_table_id)
+        if not dataset_keyword_table:
+            continue
+        try:
+            dataset = db.session.get(Dataset, dataset_keyword_table.dataset_id)
+            keyword_table_dict = dataset_keyword_table.keyword_table_dict
+            if not dataset or not keyword_table_dict:
+                continue
+
+            node_keywords: dict[str, list[str]] = {}
+            for keyword, node_ids in keyword_table_dict["__data__"]["table"].items():
+                for node_id in node_ids:
+                    node_keywords.setdefault(node_id, []).append(keyword)
+            JiebaInvertedIndex(dataset)._add_postings(node_keywords)
+            if "segment_lengths" not in keyword_table_dict["__data__"]:
+                Jieba(dataset)._add_segment_lengths()
+            migrated_count += 1
+            click.echo(f"Migrated keyword table of dataset {dataset.id}, {len(node_keywords)} segments.")
+        except Exception:
+            db.session.rollback()
+            failed_count += 1
+            logging.exception(f"Failed to migrate keyword table of dataset {dataset_keyword_table.dataset_id}")
+
+    click.echo(
+        click.style(
+            f"Keyword inverted index migration complete. Migrated {migrated_count} datasets, {failed_count} failed.",
+            fg="green",
+        )
+    )
+
+
+@click.command("compile-yaml-bundle", help="Compile the YAML files of model providers and builtin tools.")
+def compile_yaml_bundle():
+    """
+    Compile the bundle loaded by every process instead of parsing the YAML files of model providers and
+    builtin tools, e.g. when building an image. Processes compile it themselves if it is missing.
+    """
+    from core.tools.utils.yaml_utils import compile_yaml_bundle as compile_bundle
+
+    bundle_path = compile_bundle()
+    click.echo(click.style(f"YAML bundle compiled to {bundle_path}.", fg="green"))
+
+
+@click.command("clean-messages", help="Clean the messages older than the retention of sandbox plans.")
+@click.option("--dry-run", is_flag=True, default=False, help="Count the rows to delete without deleting them.")
+def clean_messages(dry_run: bool):
+    """
+    Run the message retention of the `clean_messages` task once, batch by batch.
+    """
+    from services.retention_service import RetentionService
+
+    stats = RetentionService.clean_messages(dry_run=dry_run)
+    for table_name, count in stats.items():
+        click.echo(f"{table_name}: {count} rows {'to delete' if dry_run else 'deleted'}.")
+    click.echo(click.style("Message retention complete.", fg="green"))
+
+
+@click.command("clean-embedding-cache", help="Clean the cached embeddings older than the retention of sandbox plans.")
+@click.option("--dry-run", is_flag=True, default=False, help="Count the rows to delete without deleting them.")
+def clean_embedding_cache(dry_run: bool):
+    """
+    Run the embedding cache retention of the `clean_embedding_cache_task` task once, batch by batch.
+    """
+    from services.retention_service import RetentionService
+
+    stats = RetentionService.clean_embedding_cache(dry_run=dry_run)
+    for table_name, count in stats.items():
+        click.echo(f"{table_name}: {count} rows {'to delete' if dry_run else 'deleted'}.")
+    click.echo(click.style("Embedding cache retention complete.", fg="green"))
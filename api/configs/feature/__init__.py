@@ -61,6 +61,14 @@ class AppExecutionConfig(BaseSettings):
         description="Maximum number of concurrent active requests per app (0 for unlimited)",
         default=0,
     )
+    APP_STOP_SIGNAL_PUBSUB_ENABLED: bool = Field(
+        description="Deliver task stop signals through Redis pub/sub instead of polling Redis every second",
+        default=True,
+    )
+    APP_STOP_SIGNAL_POLLING_INTERVAL: PositiveInt = Field(
+        description="Interval in seconds for polling task stop flags while stop signals are delivered by pub/sub",
+        default=10,
+    )
 
 
 class CodeExecutionSandboxConfig(BaseSettings):
@@ -133,6 +141,21 @@ class CodeExecutionSandboxConfig(BaseSettings):
         default=1000,
     )
 
+    CODE_EXECUTION_POOL_MAX_CONNECTIONS: PositiveInt = Field(
+        description="Maximum number of concurrent connections to the code execution service",
+        default=100,
+    )
+
+    CODE_EXECUTION_POOL_MAX_KEEPALIVE_CONNECTIONS: PositiveInt = Field(
+        description="Maximum number of idle keep-alive connections to the code execution service",
+        default=20,
+    )
+
+    CODE_EXECUTION_POOL_KEEPALIVE_EXPIRY: PositiveFloat = Field(
+        description="Time in seconds after which idle keep-alive connections to the code execution service are closed",
+        default=5.0,
+    )
+
 
 class EndpointConfig(BaseSettings):
     """
@@ -314,6 +337,26 @@ class HttpConfig(BaseSettings):
         default=5,
     )
 
+    SSRF_POOL_MAX_CONNECTIONS: PositiveInt = Field(
+        description="Maximum number of concurrent connections of the pooled client for network requests (SSRF)",
+        default=100,
+    )
+
+    SSRF_POOL_MAX_KEEPALIVE_CONNECTIONS: PositiveInt = Field(
+        description="Maximum number of idle keep-alive connections of the pooled client for network requests (SSRF)",
+        default=20,
+    )
+
+    SSRF_POOL_KEEPALIVE_EXPIRY: PositiveFloat = Field(
+        description="Time in seconds after which idle keep-alive connections are closed (SSRF)",
+        default=5.0,
+    )
+
+    SSRF_POOL_HTTP2_ENABLED: bool = Field(
+        description="Enable HTTP/2 for network requests (SSRF), requires the h2 package",
+        default=False,
+    )
+
     RESPECT_XFORWARD_HEADERS_ENABLED: bool = Field(
         description="Enable handling of X-Forwarded-For, X-Forwarded-Proto, and X-Forwarded-Port headers"
         " when the app is behind a single trusted reverse proxy.",
@@ -389,6 +432,46 @@ class ModelLoadBalanceConfig(BaseSettings):
     )
 
 
+class ProviderConfigurationsCacheConfig(BaseSettings):
+    """
+    Configuration for the cache of the provider configurations of workspaces
+    """
+
+    PROVIDER_CONFIGURATIONS_CACHE_ENABLED: bool = Field(
+        description="Cache the provider configurations of workspaces in process and in Redis instead of building them"
+        " from the database on every call, the cache is invalidated on every change of providers or credentials",
+        default=True,
+    )
+
+    PROVIDER_CONFIGURATIONS_CACHE_TTL: PositiveInt = Field(
+        description="Maximum time in seconds cached provider configurations are used, it also bounds how long"
+        " the used quota of hosted providers shown by the cache can be behind",
+        default=300,
+    )
+
+    PROVIDER_CONFIGURATIONS_CACHE_LOCAL_SIZE: PositiveInt = Field(
+        description="Maximum number of workspaces whose provider configurations are cached in each process",
+        default=1000,
+    )
+
+
+class ProviderUsageConfig(BaseSettings):
+    """
+    Configuration for system provider usage accounting
+    """
+
+    PROVIDER_USAGE_BATCH_ACCOUNTING_ENABLED: bool = Field(
+        description="Accumulate the quota usage and last used time of providers in Redis and write them to the"
+        " database from a Celery beat task instead of on every call",
+        default=False,
+    )
+
+    PROVIDER_USAGE_FLUSH_INTERVAL: PositiveInt = Field(
+        description="Interval in seconds between writes of the accumulated provider usage to the database",
+        default=30,
+    )
+
+
 class BillingConfig(BaseSettings):
     """
     Configuration for platform billing features
@@ -452,6 +535,49 @@ class WorkflowNodeExecutionConfig(BaseSettings):
         default=100,
     )
 
+    WORKFLOW_THREAD_POOL_MAX_WORKERS: PositiveInt = Field(
+        description="Maximum number of worker threads shared by all workflow runs of a process",
+        default=200,
+    )
+
+    WORKFLOW_THREAD_POOL_MAX_WORKERS_PER_TENANT: PositiveInt = Field(
+        description="Maximum number of shared workflow worker threads a single tenant can hold",
+        default=50,
+    )
+
+    WORKFLOW_THREAD_POOL_MAX_QUEUE_SIZE: PositiveInt = Field(
+        description="Maximum number of tasks waiting for a shared workflow worker thread, more are rejected",
+        default=10000,
+    )
+
+    WORKFLOW_THREAD_POOL_MAX_NESTED_WORKERS: PositiveInt = Field(
+        description="Maximum number of threads running tasks submitted from workflow worker threads,"
+        " e.g. nested parallel branches, more run on the submitting thread",
+        default=100,
+    )
+
+    WORKFLOW_NODE_EXECUTION_PERSISTENCE_MODE: Literal["sync", "buffered"] = Field(
+        description="How workflow node executions are persisted: 'sync' writes every node event in its own"
+        " transaction, 'buffered' journals them to Redis and writes them to the database in batches",
+        default="sync",
+    )
+
+    WORKFLOW_NODE_EXECUTION_FLUSH_BATCH_SIZE: PositiveInt = Field(
+        description="Number of buffered node executions that triggers a write to the database",
+        default=50,
+    )
+
+    WORKFLOW_NODE_EXECUTION_FLUSH_INTERVAL_MS: PositiveInt = Field(
+        description="Maximum time in milliseconds buffered node executions wait before being written to the database",
+        default=500,
+    )
+
+    WORKFLOW_NODE_EXECUTION_JOURNAL_RECOVERY_SECONDS: PositiveInt = Field(
+        description="Seconds without heartbeat after which the node execution journal of a run is considered"
+        " orphaned by a crashed process and replayed to the database",
+        default=300,
+    )
+
 
 class AuthConfig(BaseSettings):
     """
@@ -514,6 +640,40 @@ class ModerationConfig(BaseSettings):
         default=300,
     )
 
+    MODERATION_MAX_LATENCY_MS: NonNegativeInt = Field(
+        description="Maximum time in milliseconds streamed output waits for a full buffer before it is moderated,"
+        " 0 to only moderate full buffers",
+        default=0,
+    )
+
+    MODERATION_INCREMENTAL_ENABLED: bool = Field(
+        description="Only send the streamed output added since the previous check to the moderation provider,"
+        " instead of the whole output every time",
+        default=True,
+    )
+
+    MODERATION_WINDOW_OVERLAP: NonNegativeInt = Field(
+        description="Number of characters of already moderated output sent again as context with the new output",
+        default=100,
+    )
+
+
+class YamlBundleConfig(BaseSettings):
+    """
+    Configuration for the bundle of the model provider and builtin tool YAML files
+    """
+
+    YAML_BUNDLE_ENABLED: bool = Field(
+        description="Load the YAML files of model providers and builtin tools from one precompiled bundle,"
+        " compiled by the first process which needs it",
+        default=True,
+    )
+
+    YAML_BUNDLE_DIR: Optional[str] = Field(
+        description="Directory of the YAML bundle, defaults to the temporary directory of the system",
+        default=None,
+    )
+
 
 class ToolConfig(BaseSettings):
     """
@@ -525,6 +685,16 @@ class ToolConfig(BaseSettings):
         default=3600,
     )
 
+    AGENT_TOOL_CALL_MAX_WORKERS: PositiveInt = Field(
+        description="Maximum number of tool calls of a function calling agent round invoked concurrently",
+        default=5,
+    )
+
+    AGENT_TOOL_CALL_TIMEOUT: PositiveInt = Field(
+        description="Timeout in seconds for a tool call of a function calling agent invoked concurrently with others",
+        default=120,
+    )
+
 
 class MailConfig(BaseSettings):
     """
@@ -655,6 +825,16 @@ class DataSetConfig(BaseSettings):
         default=30,
     )
 
+    RETENTION_BATCH_SIZE: PositiveInt = Field(
+        description="Number of rows deleted per transaction by the message and embedding cache cleanup tasks",
+        default=1000,
+    )
+
+    RETENTION_BATCH_SLEEP_MS: NonNegativeInt = Field(
+        description="Time in milliseconds the cleanup tasks sleep between two batches, to limit replication lag",
+        default=100,
+    )
+
 
 class WorkspaceConfig(BaseSettings):
     """
@@ -682,6 +862,49 @@ class IndexingConfig(BaseSettings):
         default=50,
     )
 
+    INDEXING_EXTRACT_BATCH_SIZE: NonNegativeInt = Field(
+        description="Number of extracted documents, like PDF pages or spreadsheet rows, split and indexed together"
+        " while the rest of the file is still being extracted, 0 to extract whole files before splitting them",
+        default=100,
+    )
+
+    EMBEDDING_BATCH_MAX_TOKENS: PositiveInt = Field(
+        description="Maximum number of tokens of the texts sent in one embedding request while indexing,"
+        " on top of the maximum number of texts of the embedding model",
+        default=100000,
+    )
+
+    EMBEDDING_MAX_CONCURRENT_REQUESTS: PositiveInt = Field(
+        description="Maximum number of embedding requests in flight per provider credential,"
+        " shared by all workers through Redis and lowered temporarily on rate limit errors",
+        default=10,
+    )
+
+    EMBEDDING_RATE_LIMIT_MAX_RETRIES: NonNegativeInt = Field(
+        description="Maximum number of retries of an embedding request failing with a rate limit error",
+        default=5,
+    )
+
+    EMBEDDING_CACHE_LOOKUP_BATCH_SIZE: PositiveInt = Field(
+        description="Number of rows per query when looking up or inserting cached document embeddings",
+        default=1000,
+    )
+
+    EMBEDDING_CACHE_LOCAL_MAX_SIZE: NonNegativeInt = Field(
+        description="Maximum number of document embeddings kept in the in-process LRU cache, 0 to disable",
+        default=0,
+    )
+
+    EMBEDDING_CACHE_REDIS_ENABLED: bool = Field(
+        description="Enable caching document embeddings in Redis in front of the embeddings table",
+        default=False,
+    )
+
+    EMBEDDING_CACHE_REDIS_TTL: PositiveInt = Field(
+        description="Expiration time in seconds for document embeddings cached in Redis",
+        default=600,
+    )
+
 
 class MultiModalTransferConfig(BaseSettings):
     MULTIMODAL_SEND_FORMAT: Literal["base64", "url"] = Field(
@@ -806,6 +1029,8 @@ class FeatureConfig(
     ModerationConfig,
     MultiModalTransferConfig,
     PositionConfig,
+    ProviderConfigurationsCacheConfig,
+    ProviderUsageConfig,
     RagEtlConfig,
     SecurityConfig,
     ToolConfig,
@@ -813,6 +1038,7 @@ class FeatureConfig(
     WorkflowConfig,
     WorkflowNodeExecutionConfig,
     WorkspaceConfig,
+    YamlBundleConfig,
     LoginConfig,
     AccountConfig,
     # hosted services config
@@ -83,7 +83,8 @@ class VectorStoreConfig(BaseSettings):
 class KeywordStoreConfig(BaseSettings):
     KEYWORD_STORE: str = Field(
         description="Method for keyword extraction and storage."
-        " Default is 'jieba', a Chinese text segmentation library.",
+        " Default is 'jieba', a Chinese text segmentation library."
+        " 'jieba_inverted_index' stores the jieba keywords in an inverted index table.",
         default="jieba",
     )
 
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Literal, Optional
 
 from pydantic import Field, PositiveInt
 from pydantic_settings import BaseSettings
@@ -43,3 +43,26 @@ class PGVectorConfig(BaseSettings):
         description="Max connection of the PostgreSQL database",
         default=5,
     )
+
+    PGVECTOR_VECTOR_TYPE: Literal["vector", "halfvec"] = Field(
+        description="Column type of the embeddings of new collections, existing collections keep theirs,"
+        " 'vector' stores single precision floats,"
+        " 'halfvec' stores half precision floats in half the space and indexes up to 4000 dimensions",
+        default="vector",
+    )
+
+    PGVECTOR_HNSW_M: PositiveInt = Field(
+        description="Max number of connections per layer of the HNSW indexes of new datasets",
+        default=16,
+    )
+
+    PGVECTOR_HNSW_EF_CONSTRUCTION: PositiveInt = Field(
+        description="Size of the candidate list used to build the HNSW indexes of new datasets",
+        default=64,
+    )
+
+    PGVECTOR_HNSW_EF_SEARCH: PositiveInt = Field(
+        description="Size of the candidate list of HNSW searches, raised to the number of results requested,"
+        " higher values trade latency for recall",
+        default=40,
+    )
@@ -1,9 +1,14 @@
 import json
 import logging
+import time
 from collections.abc import Generator
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from typing import Any, Optional, Union
 
+from flask import Flask, current_app
+
+from configs import dify_config
 from core.agent.base_agent_runner import BaseAgentRunner
 from core.app.apps.base_app_queue_manager import PublishFrom
 from core.app.entities.queue_entities import QueueAgentThoughtEvent, QueueMessageEndEvent, QueueMessageFileEvent
@@ -23,10 +28,12 @@ from core.model_runtime.entities import (
     UserPromptMessage,
 )
 from core.model_runtime.entities.message_entities import ImagePromptMessageContent
+from core.ops.ops_trace_manager import TraceQueueManager
 from core.prompt.agent_history_prompt_transform import AgentHistoryPromptTransform
 from core.tools.entities.tool_entities import ToolInvokeMeta
+from core.tools.tool.tool import Tool
 from core.tools.tool_engine import ToolEngine
-from models.model import Message
+from models.model import Message, MessageFile
 
 logger = logging.getLogger(__name__)
 
@@ -221,11 +228,12 @@ class FunctionCallAgentRunner(BaseAgentRunner):
 
             final_answer += response + "\n"
 
-            # call tools
+            # call tools, concurrently if the model asked for several of them
+            tool_invoke_results = self._invoke_tools(tool_calls, tool_instances, trace_manager)
+
             tool_responses = []
-            for tool_call_id, tool_call_name, tool_call_args in tool_calls:
-                tool_instance = tool_instances.get(tool_call_name)
-                if not tool_instance:
+            for (tool_call_id, tool_call_name, _), tool_invoke_result in zip(tool_calls, tool_invoke_results):
+                if not tool_invoke_result:
                     tool_response = {
                         "tool_call_id": tool_call_id,
                         "tool_call_name": tool_call_name,
@@ -233,17 +241,7 @@ class FunctionCallAgentRunner(BaseAgentRunner):
                         "meta": ToolInvokeMeta.error_instance(f"there is not a tool named {tool_call_name}").to_dict(),
                     }
                 else:
-                    # invoke tool
-                    tool_invoke_response, message_files, tool_invoke_meta = ToolEngine.agent_invoke(
-                        tool=tool_instance,
-                        tool_parameters=tool_call_args,
-                        user_id=self.user_id,
-                        tenant_id=self.tenant_id,
-                        message=self.message,
-                        invoke_from=self.application_generate_entity.invoke_from,
-                        agent_tool_callback=self.agent_callback,
-                        trace_manager=trace_manager,
-                    )
+                    tool_invoke_response, message_files, tool_invoke_meta = tool_invoke_result
                     # publish files
                     for message_file_id, save_as in message_files:
                         if save_as:
@@ -319,6 +317,92 @@ class FunctionCallAgentRunner(BaseAgentRunner):
             PublishFrom.APPLICATION_MANAGER,
         )
 
+    def _invoke_tools(
+        self,
+        tool_calls: list[tuple[str, str, dict[str, Any]]],
+        tool_instances: dict[str, Tool],
+        trace_manager: Optional[TraceQueueManager] = None,
+    ) -> list[Optional[tuple[str, list[tuple[MessageFile, str]], ToolInvokeMeta]]]:
+        """
+        Invoke the tool calls of a round, results are in the order of the tool calls and None for unknown tools.
+
+        Several tool calls run concurrently on up to AGENT_TOOL_CALL_MAX_WORKERS threads, each is given
+        AGENT_TOOL_CALL_TIMEOUT seconds after its turn to run comes.
+        """
+        known_tool_calls = [
+            (index, tool_instances[tool_call_name], tool_call_args)
+            for index, (_, tool_call_name, tool_call_args) in enumerate(tool_calls)
+            if tool_call_name in tool_instances
+        ]
+        results: list[Optional[tuple[str, list[tuple[MessageFile, str]], ToolInvokeMeta]]] = [None] * len(tool_calls)
+        if len(known_tool_calls) <= 1:
+            for index, tool_instance, tool_call_args in known_tool_calls:
+                results[index] = self._invoke_tool(tool_instance, tool_call_args, trace_manager)
+            return results
+
+        # load the attributes read by the tool threads, so they don't refresh the message from another thread
+        _ = self.message.id, self.message.conversation_id
+
+        max_workers = min(len(known_tool_calls), dify_config.AGENT_TOOL_CALL_MAX_WORKERS)
+        timeout = dify_config.AGENT_TOOL_CALL_TIMEOUT
+        flask_app = current_app._get_current_object()  # type: ignore
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agent_tool_call")
+        try:
+            submitted_at = time.perf_counter()
+            futures = [
+                executor.submit(
+                    self._invoke_tool_in_app_context,
+                    flask_app,
+                    tool_instance,
+                    tool_call_args,
+                    trace_manager,
+                )
+                for _, tool_instance, tool_call_args in known_tool_calls
+            ]
+            for position, ((index, tool_instance, _), future) in enumerate(zip(known_tool_calls, futures)):
+                # tool calls beyond the first max_workers wait for a thread, one timeout per round of threads
+                deadline = submitted_at + timeout * (position // max_workers + 1)
+                try:
+                    results[index] = future.result(timeout=max(deadline - time.perf_counter(), 0))
+                except TimeoutError:
+                    error_response = f"tool invoke error: timed out after {timeout} seconds"
+                    logger.warning(
+                        f"{error_response}, tool: {tool_instance.identity.name if tool_instance.identity else ''}"
+                    )
+                    results[index] = (error_response, [], ToolInvokeMeta.error_instance(error_response))
+        finally:
+            # timed out tools can't be interrupted, leave them running without waiting for them
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        return results
+
+    def _invoke_tool_in_app_context(
+        self,
+        flask_app: Flask,
+        tool_instance: Tool,
+        tool_call_args: dict[str, Any],
+        trace_manager: Optional[TraceQueueManager] = None,
+    ) -> tuple[str, list[tuple[MessageFile, str]], ToolInvokeMeta]:
+        with flask_app.app_context():
+            return self._invoke_tool(tool_instance, tool_call_args, trace_manager)
+
+    def _invoke_tool(
+        self,
+        tool_instance: Tool,
+        tool_call_args: dict[str, Any],
+        trace_manager: Optional[TraceQueueManager] = None,
+    ) -> tuple[str, list[tuple[MessageFile, str]], ToolInvokeMeta]:
+        return ToolEngine.agent_invoke(
+            tool=tool_instance,
+            tool_parameters=tool_call_args,
+            user_id=self.user_id,
+            tenant_id=self.tenant_id,
+            message=self.message,
+            invoke_from=self.application_generate_entity.invoke_from,
+            agent_tool_callback=self.agent_callback,
+            trace_manager=trace_manager,
+        )
+
     def check_tool_calls(self, llm_result_chunk: LLMResultChunk) -> bool:
         """
         Check if there is any tool call in llm result chunk
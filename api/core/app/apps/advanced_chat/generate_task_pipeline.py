@@ -221,14 +221,22 @@ class AdvancedChatAppGenerateTaskPipeline:
         ):
             tts_publisher = AppGeneratorTTSPublisher(tenant_id, features_dict["text_to_speech"].get("voice"))
 
-        for response in self._process_stream_response(tts_publisher=tts_publisher, trace_manager=trace_manager):
-            while True:
-                audio_response = self._listen_audio_msg(publisher=tts_publisher, task_id=task_id)
-                if audio_response:
-                    yield audio_response
-                else:
-                    break
-            yield response
+        try:
+            for response in self._process_stream_response(tts_publisher=tts_publisher, trace_manager=trace_manager):
+                while True:
+                    audio_response = self._listen_audio_msg(publisher=tts_publisher, task_id=task_id)
+                    if audio_response:
+                        yield audio_response
+                    else:
+                        break
+                yield response
+        finally:
+            # write the buffered node executions when the run errors out or the client disconnects,
+            # without hiding the error of the run
+            try:
+                self._workflow_cycle_manager._close_node_execution_buffer()
+            except Exception:
+                logger.exception("Failed to close the node execution buffer")
 
         start_listener_time = time.time()
         # timeout
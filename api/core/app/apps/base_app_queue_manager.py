@@ -1,8 +1,12 @@
+import logging
+import os
 import queue
+import threading
 import time
+import weakref
 from abc import abstractmethod
 from enum import Enum
-from typing import Any
+from typing import Any, Optional
 
 from sqlalchemy.orm import DeclarativeMeta
 
@@ -18,6 +22,8 @@ from core.app.entities.queue_entities import (
 )
 from extensions.ext_redis import redis_client
 
+logger = logging.getLogger(__name__)
+
 
 class PublishFrom(Enum):
     APPLICATION_MANAGER = 1
@@ -41,6 +47,9 @@ class AppQueueManager:
         q: queue.Queue[WorkflowQueueMessage | MessageQueueMessage | None] = queue.Queue()
 
         self._q = q
+        self._stopped = threading.Event()
+        self._last_stopped_poll_time = float("-inf")
+        stop_signal_subscriber.register(self._task_id, self)
 
     def listen(self):
         """
@@ -73,6 +82,8 @@ class AppQueueManager:
                     self.publish(QueuePingEvent(), PublishFrom.TASK_PIPELINE)
                     last_ping_time = elapsed_time // 10
 
+        stop_signal_subscriber.unregister(self._task_id)
+
     def stop_listen(self) -> None:
         """
         Stop listen to queue
@@ -125,15 +136,39 @@ class AppQueueManager:
 
         stopped_cache_key = cls._generate_stopped_cache_key(task_id)
         redis_client.setex(stopped_cache_key, 600, 1)
+        if dify_config.APP_STOP_SIGNAL_PUBSUB_ENABLED:
+            redis_client.publish(AppStopSignalSubscriber.CHANNEL, task_id)
+
+    def on_stop_signal(self) -> None:
+        """
+        Handle the stop signal received by the stop signal subscriber
+        :return:
+        """
+        self._stopped.set()
+        # wake up the listener so the stop event is published without waiting for the next poll
+        self.publish(QueuePingEvent(), PublishFrom.TASK_PIPELINE)
 
     def _is_stopped(self) -> bool:
         """
-        Check if task is stopped
+        Check if task is stopped.
+        Stop signals are pushed in by the stop signal subscriber, the stopped cache key is still polled
+        as a fallback, every second when the subscriber is down and every APP_STOP_SIGNAL_POLLING_INTERVAL
+        seconds otherwise.
         :return:
         """
+        if self._stopped.is_set():
+            return True
+
+        poll_interval = dify_config.APP_STOP_SIGNAL_POLLING_INTERVAL if stop_signal_subscriber.healthy else 1
+        now = time.monotonic()
+        if now - self._last_stopped_poll_time < poll_interval:
+            return False
+        self._last_stopped_poll_time = now
+
         stopped_cache_key = AppQueueManager._generate_stopped_cache_key(self._task_id)
         result = redis_client.get(stopped_cache_key)
         if result is not None:
+            self._stopped.set()
             return True
 
         return False
@@ -173,3 +208,77 @@ class AppQueueManager:
 
 class GenerateTaskStoppedError(Exception):
     pass
+
+
+class AppStopSignalSubscriber:
+    """
+    Process-wide subscriber of task stop signals.
+    A single Redis pub/sub connection per process fans stop signals out to the queue managers
+    of the tasks running in this process.
+    """
+
+    CHANNEL = "generate_task_stopped"
+
+    def __init__(self) -> None:
+        self._managers: weakref.WeakValueDictionary[str, AppQueueManager] = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._healthy = False
+
+    @property
+    def healthy(self) -> bool:
+        """
+        Whether stop signals are currently being received
+        """
+        return self._healthy and self._pid == os.getpid()
+
+    def register(self, task_id: str, queue_manager: AppQueueManager) -> None:
+        if not dify_config.APP_STOP_SIGNAL_PUBSUB_ENABLED:
+            return
+
+        with self._lock:
+            self._managers[task_id] = queue_manager
+            # the listener thread doesn't survive a fork, start one per process
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._healthy = False
+                self._thread = threading.Thread(target=self._run, name="app-stop-signal-subscriber", daemon=True)
+                self._thread.start()
+
+    def unregister(self, task_id: str) -> None:
+        with self._lock:
+            self._managers.pop(task_id, None)
+
+    def _run(self) -> None:
+        retry_interval = 1
+        while True:
+            pubsub = None
+            try:
+                pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.CHANNEL)
+                self._healthy = True
+                retry_interval = 1
+                for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    task_id = message["data"].decode("utf-8")
+                    with self._lock:
+                        queue_manager = self._managers.get(task_id)
+                    if queue_manager is not None:
+                        queue_manager.on_stop_signal()
+            except Exception:
+                logger.exception("Stop signal subscriber disconnected, falling back to polling")
+            finally:
+                self._healthy = False
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+            time.sleep(retry_interval)
+            retry_interval = min(retry_interval * 2, 30)
+
+
+stop_signal_subscriber = AppStopSignalSubscriber()
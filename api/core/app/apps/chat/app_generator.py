@@ -18,6 +18,7 @@ from core.app.apps.chat.generate_response_converter import ChatAppGenerateRespon
 from core.app.apps.message_based_app_generator import MessageBasedAppGenerator
 from core.app.apps.message_based_app_queue_manager import MessageBasedAppQueueManager
 from core.app.entities.app_invoke_entities import ChatAppGenerateEntity, InvokeFrom
+from core.helper.provider_configurations_cache import provider_configurations_memo
 from core.model_runtime.errors.invoke import InvokeAuthorizationError
 from core.ops.ops_trace_manager import TraceQueueManager
 from extensions.ext_database import db
@@ -210,7 +211,7 @@ class ChatAppGenerator(MessageBasedAppGenerator):
         :param message_id: message ID
         :return:
         """
-        with flask_app.app_context():
+        with flask_app.app_context(), provider_configurations_memo():
             try:
                 # get conversation and message
                 conversation = self._get_conversation(conversation_id)
@@ -17,6 +17,7 @@ from core.app.apps.completion.generate_response_converter import CompletionAppGe
 from core.app.apps.message_based_app_generator import MessageBasedAppGenerator
 from core.app.apps.message_based_app_queue_manager import MessageBasedAppQueueManager
 from core.app.entities.app_invoke_entities import CompletionAppGenerateEntity, InvokeFrom
+from core.helper.provider_configurations_cache import provider_configurations_memo
 from core.model_runtime.errors.invoke import InvokeAuthorizationError
 from core.ops.ops_trace_manager import TraceQueueManager
 from extensions.ext_database import db
@@ -191,7 +192,7 @@ class CompletionAppGenerator(MessageBasedAppGenerator):
         :param message_id: message ID
         :return:
         """
-        with flask_app.app_context():
+        with flask_app.app_context(), provider_configurations_memo():
             try:
                 # get message
                 message = self._get_message(message_id)
@@ -5,9 +5,10 @@ from datetime import UTC, datetime
 from typing import Any, Optional, Union, cast
 from uuid import uuid4
 
-from sqlalchemy import func, select
-from sqlalchemy.orm import Session
+from sqlalchemy import func, inspect, select
+from sqlalchemy.orm import InstanceState, Session
 
+from configs import dify_config
 from core.app.entities.app_invoke_entities import AdvancedChatAppGenerateEntity, InvokeFrom, WorkflowAppGenerateEntity
 from core.app.entities.queue_entities import (
     QueueIterationCompletedEvent,
@@ -35,6 +36,7 @@ from core.app.entities.task_entities import (
     WorkflowFinishStreamResponse,
     WorkflowStartStreamResponse,
 )
+from core.app.task_pipeline.workflow_node_execution_buffer import WorkflowNodeExecutionBuffer
 from core.file import FILE_MODEL_IDENTITY, File
 from core.model_runtime.utils.encoders import jsonable_encoder
 from core.ops.entities.trace_entity import TraceTaskName
@@ -45,6 +47,7 @@ from core.workflow.enums import SystemVariableKey
 from core.workflow.nodes import NodeType
 from core.workflow.nodes.tool.entities import ToolNodeData
 from core.workflow.workflow_entry import WorkflowEntry
+from extensions.ext_database import db
 from models.account import Account
 from models.enums import CreatedByRole, WorkflowRunTriggeredFrom
 from models.model import EndUser
@@ -69,6 +72,8 @@ class WorkflowCycleManage:
     ) -> None:
         self._workflow_run: WorkflowRun | None = None
         self._workflow_node_executions: dict[str, WorkflowNodeExecution] = {}
+        # set in buffered persistence mode once the workflow run is created
+        self._node_execution_buffer: WorkflowNodeExecutionBuffer | None = None
         self._application_generate_entity = application_generate_entity
         self._workflow_system_variables = workflow_system_variables
 
@@ -129,6 +134,9 @@ class WorkflowCycleManage:
 
         session.add(workflow_run)
 
+        if dify_config.WORKFLOW_NODE_EXECUTION_PERSISTENCE_MODE == "buffered":
+            self._node_execution_buffer = WorkflowNodeExecutionBuffer(workflow_run_id=workflow_run_id, engine=db.engine)
+
         return workflow_run
 
     def _handle_workflow_run_success(
@@ -153,6 +161,7 @@ class WorkflowCycleManage:
         :param conversation_id: conversation id
         :return:
         """
+        self._close_node_execution_buffer()
         workflow_run = self._get_workflow_run(session=session, workflow_run_id=workflow_run_id)
 
         outputs = WorkflowEntry.handle_special_values(outputs)
@@ -189,6 +198,7 @@ class WorkflowCycleManage:
         conversation_id: Optional[str] = None,
         trace_manager: Optional[TraceQueueManager] = None,
     ) -> WorkflowRun:
+        self._close_node_execution_buffer()
         workflow_run = self._get_workflow_run(session=session, workflow_run_id=workflow_run_id)
         outputs = WorkflowEntry.handle_special_values(dict(outputs) if outputs else None)
 
@@ -246,19 +256,27 @@ class WorkflowCycleManage:
         workflow_run.finished_at = datetime.now(UTC).replace(tzinfo=None)
         workflow_run.exceptions_count = exceptions_count
 
-        stmt = select(WorkflowNodeExecution.node_execution_id).where(
-            WorkflowNodeExecution.tenant_id == workflow_run.tenant_id,
-            WorkflowNodeExecution.app_id == workflow_run.app_id,
-            WorkflowNodeExecution.workflow_id == workflow_run.workflow_id,
-            WorkflowNodeExecution.triggered_from == WorkflowNodeExecutionTriggeredFrom.WORKFLOW_RUN.value,
-            WorkflowNodeExecution.workflow_run_id == workflow_run.id,
-            WorkflowNodeExecution.status == WorkflowNodeExecutionStatus.RUNNING.value,
-        )
-        ids = session.scalars(stmt).all()
-        # Use self._get_workflow_node_execution here to make sure the cache is updated
-        running_workflow_node_executions = [
-            self._get_workflow_node_execution(session=session, node_execution_id=id) for id in ids if id
-        ]
+        if self._node_execution_buffer:
+            # buffered node executions may not be written yet, the cached ones hold their latest state
+            running_workflow_node_executions = [
+                workflow_node_execution
+                for workflow_node_execution in self._workflow_node_executions.values()
+                if workflow_node_execution.status == WorkflowNodeExecutionStatus.RUNNING.value
+            ]
+        else:
+            stmt = select(WorkflowNodeExecution.node_execution_id).where(
+                WorkflowNodeExecution.tenant_id == workflow_run.tenant_id,
+                WorkflowNodeExecution.app_id == workflow_run.app_id,
+                WorkflowNodeExecution.workflow_id == workflow_run.workflow_id,
+                WorkflowNodeExecution.triggered_from == WorkflowNodeExecutionTriggeredFrom.WORKFLOW_RUN.value,
+                WorkflowNodeExecution.workflow_run_id == workflow_run.id,
+                WorkflowNodeExecution.status == WorkflowNodeExecutionStatus.RUNNING.value,
+            )
+            ids = session.scalars(stmt).all()
+            # Use self._get_workflow_node_execution here to make sure the cache is updated
+            running_workflow_node_executions = [
+                self._get_workflow_node_execution(session=session, node_execution_id=id) for id in ids if id
+            ]
 
         for workflow_node_execution in running_workflow_node_executions:
             now = datetime.now(UTC).replace(tzinfo=None)
@@ -266,6 +284,9 @@ class WorkflowCycleManage:
             workflow_node_execution.error = error
             workflow_node_execution.finished_at = now
             workflow_node_execution.elapsed_time = (now - workflow_node_execution.created_at).total_seconds()
+            if self._node_execution_buffer:
+                self._node_execution_buffer.add(workflow_node_execution)
+        self._close_node_execution_buffer()
 
         if trace_manager:
             trace_manager.add_trace_task(
@@ -306,7 +327,10 @@ class WorkflowCycleManage:
         )
         workflow_node_execution.created_at = datetime.now(UTC).replace(tzinfo=None)
 
-        session.add(workflow_node_execution)
+        if self._node_execution_buffer:
+            self._node_execution_buffer.add(workflow_node_execution)
+        else:
+            session.add(workflow_node_execution)
 
         self._workflow_node_executions[event.node_execution_id] = workflow_node_execution
         return workflow_node_execution
@@ -336,8 +360,7 @@ class WorkflowCycleManage:
         workflow_node_execution.finished_at = finished_at
         workflow_node_execution.elapsed_time = elapsed_time
 
-        workflow_node_execution = session.merge(workflow_node_execution)
-        return workflow_node_execution
+        return self._save_workflow_node_execution(session=session, workflow_node_execution=workflow_node_execution)
 
     def _handle_workflow_node_execution_failed(
         self,
@@ -376,8 +399,7 @@ class WorkflowCycleManage:
         workflow_node_execution.elapsed_time = elapsed_time
         workflow_node_execution.execution_metadata = execution_metadata
 
-        workflow_node_execution = session.merge(workflow_node_execution)
-        return workflow_node_execution
+        return self._save_workflow_node_execution(session=session, workflow_node_execution=workflow_node_execution)
 
     def _handle_workflow_node_execution_retried(
         self, *, session: Session, workflow_run: WorkflowRun, event: QueueNodeRetryEvent
@@ -427,7 +449,10 @@ class WorkflowCycleManage:
         workflow_node_execution.execution_metadata = execution_metadata
         workflow_node_execution.index = event.node_run_index
 
-        session.add(workflow_node_execution)
+        if self._node_execution_buffer:
+            self._node_execution_buffer.add(workflow_node_execution)
+        else:
+            session.add(workflow_node_execution)
 
         self._workflow_node_executions[event.node_execution_id] = workflow_node_execution
         return workflow_node_execution
@@ -828,7 +853,12 @@ class WorkflowCycleManage:
     def _get_workflow_run(self, *, session: Session, workflow_run_id: str) -> WorkflowRun:
         if self._workflow_run and self._workflow_run.id == workflow_run_id:
             cached_workflow_run = self._workflow_run
-            cached_workflow_run = session.merge(cached_workflow_run)
+            # only this pipeline writes the workflow run until it finishes, so in buffered mode the cached state
+            # is attached as is instead of being reloaded for every node event,
+            # unless it has changes that were not flushed, which can only be merged by loading the row
+            state: InstanceState[WorkflowRun] = inspect(cached_workflow_run)
+            load = self._node_execution_buffer is None or not state.has_identity or state.modified
+            cached_workflow_run = session.merge(cached_workflow_run, load=load)
             return cached_workflow_run
         stmt = select(WorkflowRun).where(WorkflowRun.id == workflow_run_id)
         workflow_run = session.scalar(stmt)
@@ -842,4 +872,22 @@ class WorkflowCycleManage:
         if node_execution_id not in self._workflow_node_executions:
             raise ValueError(f"Workflow node execution not found: {node_execution_id}")
         cached_workflow_node_execution = self._workflow_node_executions[node_execution_id]
+        if self._node_execution_buffer:
+            # buffered node executions are never attached to a session
+            return cached_workflow_node_execution
         return session.merge(cached_workflow_node_execution)
+
+    def _save_workflow_node_execution(
+        self, *, session: Session, workflow_node_execution: WorkflowNodeExecution
+    ) -> WorkflowNodeExecution:
+        if self._node_execution_buffer:
+            self._node_execution_buffer.add(workflow_node_execution)
+            return workflow_node_execution
+        return session.merge(workflow_node_execution)
+
+    def _close_node_execution_buffer(self) -> None:
+        """
+        Write the buffered node executions, the workflow run must not finish before its node executions are saved
+        """
+        if self._node_execution_buffer:
+            self._node_execution_buffer.close()
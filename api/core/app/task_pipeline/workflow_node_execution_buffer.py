@@ -0,0 +1,199 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, cast
+
+from sqlalchemy import DateTime
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from configs import dify_config
+from extensions.ext_database import db
+from extensions.ext_redis import redis_client
+from models.workflow import WorkflowNodeExecution
+
+logger = logging.getLogger(__name__)
+
+# hash of the node executions of a workflow run which are not written to the database yet, by node execution id
+JOURNAL_KEY_PREFIX = "workflow_node_execution_journal:"
+# sorted set of the workflow runs with a journal, scored by the last heartbeat of the process running them
+JOURNAL_HEARTBEATS_KEY = "workflow_node_execution_journals"
+
+
+class WorkflowNodeExecutionBuffer:
+    """
+    Write-behind buffer of the node executions of a workflow run.
+
+    Every version of a node execution is journaled to Redis when it is added, and a background thread writes the
+    buffered node executions to the database once `batch_size` of them are pending or every `flush_interval`,
+    so the streaming thread never waits for the database. Newer versions of a node execution replace the buffered
+    one, so a node which starts and finishes between two flushes is written once.
+
+    Journal entries are only removed once written. If the process dies before that, the journal stops receiving
+    heartbeats and is replayed by `schedule.recover_workflow_node_executions_task`.
+    """
+
+    def __init__(
+        self,
+        *,
+        workflow_run_id: str,
+        engine: Engine,
+        batch_size: int = dify_config.WORKFLOW_NODE_EXECUTION_FLUSH_BATCH_SIZE,
+        flush_interval: float = dify_config.WORKFLOW_NODE_EXECUTION_FLUSH_INTERVAL_MS / 1000,
+    ) -> None:
+        self._workflow_run_id = workflow_run_id
+        self._journal_key = f"{JOURNAL_KEY_PREFIX}{workflow_run_id}"
+        self._engine = engine
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._pending: dict[str, dict[str, Any]] = {}
+        # guards the pending node executions and their journal entries
+        self._condition = threading.Condition()
+        # serializes the writes of the background thread and of explicit flushes
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread: threading.Thread | None = None
+
+    def add(self, workflow_node_execution: WorkflowNodeExecution) -> None:
+        row = node_execution_to_row(workflow_node_execution)
+        with self._condition:
+            pipeline = redis_client.pipeline(transaction=False)
+            pipeline.hset(self._journal_key, row["id"], json.dumps(row, default=_json_default))
+            pipeline.zadd(JOURNAL_HEARTBEATS_KEY, {self._workflow_run_id: time.time()})
+            pipeline.execute()
+
+            self._pending[row["id"]] = row
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            if len(self._pending) >= self._batch_size:
+                self._condition.notify()
+
+    def flush(self) -> None:
+        """
+        Write the pending node executions to the database, they are kept pending if the write fails
+        """
+        with self._flush_lock:
+            with self._condition:
+                rows, self._pending = self._pending, {}
+            if not rows:
+                return
+
+            try:
+                with Session(self._engine) as session:
+                    write_node_executions(session, list(rows.values()))
+                    session.commit()
+            except Exception:
+                with self._condition:
+                    self._pending = {**rows, **self._pending}
+                raise
+
+            with self._condition:
+                # node executions added again during the write keep their newer journal entry
+                written_ids = [execution_id for execution_id in rows if execution_id not in self._pending]
+                if written_ids:
+                    redis_client.hdel(self._journal_key, *written_ids)
+
+    def close(self) -> None:
+        """
+        Stop the background thread and write the pending node executions, can be called more than once
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread:
+            self._thread.join()
+
+        self.flush()
+        pipeline = redis_client.pipeline(transaction=False)
+        pipeline.delete(self._journal_key)
+        pipeline.zrem(JOURNAL_HEARTBEATS_KEY, self._workflow_run_id)
+        pipeline.execute()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                if not self._closed and len(self._pending) < self._batch_size:
+                    self._condition.wait(self._flush_interval)
+                if self._closed:
+                    return
+
+            try:
+                redis_client.zadd(JOURNAL_HEARTBEATS_KEY, {self._workflow_run_id: time.time()})
+                self.flush()
+            except Exception:
+                logger.exception(f"Failed to write buffered node executions of workflow run {self._workflow_run_id}")
+
+
+def node_execution_to_row(workflow_node_execution: WorkflowNodeExecution) -> dict[str, Any]:
+    return {
+        column.key: getattr(workflow_node_execution, column.key) for column in WorkflowNodeExecution.__table__.columns
+    }
+
+
+def write_node_executions(session: Session, rows: list[dict[str, Any]]) -> None:
+    """
+    Insert node execution rows, or overwrite them if they were written before
+    """
+    table = WorkflowNodeExecution.__table__
+    values = []
+    for row in rows:
+        values.append(
+            {
+                key: table.c[key].server_default.arg
+                # columns not set yet are written with their server default, like the ORM does
+                if value is None and not table.c[key].nullable and table.c[key].server_default is not None
+                else value
+                for key, value in row.items()
+            }
+        )
+
+    stmt = insert(table).values(values)
+    session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["id"],
+            set_={column.key: stmt.excluded[column.key] for column in table.columns if column.key != "id"},
+        )
+    )
+
+
+def recover_orphaned_journals() -> int:
+    """
+    Write the journaled node executions of workflow runs whose process stopped sending heartbeats
+    :return: number of recovered workflow runs
+    """
+    deadline = time.time() - dify_config.WORKFLOW_NODE_EXECUTION_JOURNAL_RECOVERY_SECONDS
+    recovered = 0
+    for workflow_run_id in redis_client.zrangebyscore(JOURNAL_HEARTBEATS_KEY, 0, deadline):
+        workflow_run_id = workflow_run_id.decode()
+        journal_key = f"{JOURNAL_KEY_PREFIX}{workflow_run_id}"
+        rows = [_row_from_json(value) for value in redis_client.hgetall(journal_key).values()]
+        if rows:
+            with Session(db.engine) as session:
+                write_node_executions(session, rows)
+                session.commit()
+
+        pipeline = redis_client.pipeline(transaction=False)
+        pipeline.delete(journal_key)
+        pipeline.zrem(JOURNAL_HEARTBEATS_KEY, workflow_run_id)
+        pipeline.execute()
+        recovered += 1
+
+    return recovered
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _row_from_json(value: bytes | str) -> dict[str, Any]:
+    row = cast(dict[str, Any], json.loads(value))
+    for column in WorkflowNodeExecution.__table__.columns:
+        if isinstance(column.type, DateTime) and row.get(column.key):
+            row[column.key] = datetime.fromisoformat(row[column.key])
+    return row
@@ -1,10 +1,12 @@
 import logging
+import os
 from collections.abc import Mapping
 from enum import StrEnum
 from threading import Lock
-from typing import Any, Optional
+from typing import Any, Optional, cast
 
-from httpx import Timeout, post
+import httpx
+from httpx import Timeout
 from pydantic import BaseModel
 from yarl import URL
 
@@ -55,27 +57,41 @@ class CodeExecutor:
 
     supported_dependencies_languages: set[CodeLanguage] = {CodeLanguage.PYTHON3}
 
+    _client: Optional[httpx.Client] = None
+    _client_pid: Optional[int] = None
+    _client_lock = Lock()
+
     @classmethod
-    def execute_code(cls, language: CodeLanguage, preload: str, code: str) -> str:
+    def _get_client(cls) -> httpx.Client:
         """
-        Execute code
-        :param language: code language
-        :param code: code
-        :return:
+        Get the pooled client shared by all code executions of this process
         """
-        url = URL(str(dify_config.CODE_EXECUTION_ENDPOINT)) / "v1" / "sandbox" / "run"
+        with cls._client_lock:
+            if cls._client is None or cls._client_pid != os.getpid():
+                cls._client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=dify_config.CODE_EXECUTION_POOL_MAX_CONNECTIONS,
+                        max_keepalive_connections=dify_config.CODE_EXECUTION_POOL_MAX_KEEPALIVE_CONNECTIONS,
+                        keepalive_expiry=dify_config.CODE_EXECUTION_POOL_KEEPALIVE_EXPIRY,
+                    ),
+                )
+                cls._client_pid = os.getpid()
+            return cls._client
 
-        headers = {"X-Api-Key": dify_config.CODE_EXECUTION_API_KEY}
+    @classmethod
+    def _post(cls, path: str, data: Mapping[str, Any]) -> dict[str, Any]:
+        """
+        Post a request to the sandbox service
+        :param path: endpoint path relative to /v1/sandbox
+        :param data: request body
+        :return: response body
+        """
+        url = URL(str(dify_config.CODE_EXECUTION_ENDPOINT)) / "v1" / "sandbox" / path
 
-        data = {
-            "language": cls.code_language_to_running_language.get(language),
-            "code": code,
-            "preload": preload,
-            "enable_network": True,
-        }
+        headers = {"X-Api-Key": dify_config.CODE_EXECUTION_API_KEY}
 
         try:
-            response = post(
+            response = cls._get_client().post(
                 str(url),
                 json=data,
                 headers=headers,
@@ -110,7 +126,24 @@ class CodeExecutor:
         if (code := response_data.get("code")) != 0:
             raise CodeExecutionError(f"Got error code: {code}. Got error msg: {response_data.get('message')}")
 
-        response_code = CodeExecutionResponse(**response_data)
+        return cast(dict[str, Any], response_data)
+
+    @classmethod
+    def execute_code(cls, language: CodeLanguage, preload: str, code: str) -> str:
+        """
+        Execute code
+        :param language: code language
+        :param code: code
+        :return:
+        """
+        data = {
+            "language": cls.code_language_to_running_language.get(language),
+            "code": code,
+            "preload": preload,
+            "enable_network": True,
+        }
+
+        response_code = CodeExecutionResponse(**cls._post("run", data))
 
         if response_code.data.error:
             raise CodeExecutionError(response_code.data.error)
@@ -0,0 +1,278 @@
+import json
+import logging
+import threading
+import time
+from collections.abc import Callable, Generator, Iterable
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from cachetools import LRUCache
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from configs import dify_config
+from core.entities.provider_configuration import ProviderConfiguration, ProviderConfigurations
+from core.entities.provider_entities import CustomConfiguration, ModelSettings, SystemConfiguration
+from core.model_runtime.model_providers import model_provider_factory
+from extensions.ext_redis import redis_client
+from models.provider import (
+    LoadBalancingModelConfig,
+    Provider,
+    ProviderModel,
+    ProviderModelSetting,
+    ProviderType,
+    TenantPreferredModelProvider,
+)
+
+logger = logging.getLogger(__name__)
+
+# counter bumped on every change of the providers of a tenant, cached configurations of older versions are ignored
+VERSION_KEY_PREFIX = "provider_configurations_version:"
+CACHE_KEY_PREFIX = "provider_configurations:"
+# models whose rows make up the provider configurations of a tenant
+PROVIDER_MODELS = (
+    Provider,
+    ProviderModel,
+    TenantPreferredModelProvider,
+    ProviderModelSetting,
+    LoadBalancingModelConfig,
+)
+# session info key of the tenants whose providers changed in the current transaction
+CHANGED_TENANTS_INFO_KEY = "provider_configurations_changed_tenants"
+
+# configurations built or loaded by this process, keyed by tenant id, as (version, expires_at, configurations)
+_local_cache: LRUCache = LRUCache(maxsize=dify_config.PROVIDER_CONFIGURATIONS_CACHE_LOCAL_SIZE)
+_local_cache_lock = threading.Lock()
+
+
+class ProviderConfigurationsMemo:
+    """
+    Provider configurations used by one app run, shared by all threads of the run.
+
+    Every model instance of a run gets the configurations of the same tenant, the memo loads them once per run
+    instead of once per call. It also counts the database queries of the run to show what it saves.
+    """
+
+    def __init__(self) -> None:
+        self._configurations: dict[str, ProviderConfigurations] = {}
+        self._lock = threading.Lock()
+        self.load_count = 0
+        self.query_count = 0
+
+    def get(self, tenant_id: str, load: Callable[[], ProviderConfigurations]) -> ProviderConfigurations:
+        with self._lock:
+            configurations = self._configurations.get(tenant_id)
+        if configurations is None:
+            configurations = load()
+            with self._lock:
+                self._configurations[tenant_id] = configurations
+                self.load_count += 1
+        return configurations
+
+    def invalidate(self, tenant_id: str) -> None:
+        with self._lock:
+            self._configurations.pop(tenant_id, None)
+
+    def count_query(self) -> None:
+        with self._lock:
+            self.query_count += 1
+
+
+_memo: ContextVar[ProviderConfigurationsMemo | None] = ContextVar("provider_configurations_memo", default=None)
+
+
+@contextmanager
+def provider_configurations_memo() -> Generator[ProviderConfigurationsMemo, None, None]:
+    """
+    Memoize the provider configurations loaded in this context, e.g. by an app run and the threads it starts
+    """
+    memo = ProviderConfigurationsMemo()
+    token = _memo.set(memo)
+    try:
+        yield memo
+    finally:
+        _memo.reset(token)
+        logger.debug(
+            f"App run executed {memo.query_count} database queries and loaded provider configurations"
+            f" {memo.load_count} times"
+        )
+
+
+def get_provider_configurations(tenant_id: str, build: Callable[[], ProviderConfigurations]) -> ProviderConfigurations:
+    """
+    Get the provider configurations of a tenant, from the memo of the current app run if there is one.
+
+    Configurations memoized for the run are shared by its callers.
+    """
+    memo = _memo.get()
+    if memo is None:
+        return _get_cached_configurations(tenant_id, build)
+    return memo.get(tenant_id, lambda: _get_cached_configurations(tenant_id, build))
+
+
+def _get_cached_configurations(tenant_id: str, build: Callable[[], ProviderConfigurations]) -> ProviderConfigurations:
+    """
+    Get the provider configurations of a tenant from the process cache, then from Redis, and build them on a miss.
+
+    Both tiers are keyed by the version of the tenant, so a change of its providers or credentials made by any
+    process is seen by the next call. The version is read before building, a change during the build bumps it
+    and leaves the built configurations unused.
+    Cached configurations are shared, the caller gets a copy of the parts specific to the tenant.
+    """
+    if not dify_config.PROVIDER_CONFIGURATIONS_CACHE_ENABLED:
+        return build()
+
+    try:
+        version = _get_version(tenant_id)
+    except Exception:
+        logger.exception("Failed to get the provider configurations version from redis")
+        return build()
+
+    now = time.monotonic()
+    with _local_cache_lock:
+        cached = _local_cache.get(tenant_id)
+    if cached and cached[0] == version and cached[1] > now:
+        return _copy_configurations(cached[2])
+
+    cache_key = f"{CACHE_KEY_PREFIX}{tenant_id}:{version}"
+    configurations = None
+    try:
+        cached_configurations = redis_client.get(cache_key)
+        if cached_configurations:
+            configurations = _loads(tenant_id, cached_configurations)
+    except Exception:
+        logger.exception("Failed to load cached provider configurations")
+
+    if configurations is None:
+        configurations = build()
+        try:
+            redis_client.setex(cache_key, dify_config.PROVIDER_CONFIGURATIONS_CACHE_TTL, _dumps(configurations))
+        except Exception:
+            logger.exception("Failed to cache provider configurations")
+
+    with _local_cache_lock:
+        _local_cache[tenant_id] = (version, now + dify_config.PROVIDER_CONFIGURATIONS_CACHE_TTL, configurations)
+    return _copy_configurations(configurations)
+
+
+def invalidate_provider_configurations(tenant_ids: Iterable[str]) -> None:
+    """
+    Bump the version of the provider configurations of tenants, for changes not made through the ORM,
+    and drop them from the memo of the current app run
+    """
+    tenant_ids = set(tenant_ids)
+    if not tenant_ids:
+        return
+
+    memo = _memo.get()
+    if memo is not None:
+        for tenant_id in tenant_ids:
+            memo.invalidate(tenant_id)
+
+    with _local_cache_lock:
+        for tenant_id in tenant_ids:
+            _local_cache.pop(tenant_id, None)
+    try:
+        pipeline = redis_client.pipeline(transaction=False)
+        for tenant_id in tenant_ids:
+            pipeline.incr(f"{VERSION_KEY_PREFIX}{tenant_id}")
+        pipeline.execute()
+    except Exception:
+        logger.exception("Failed to invalidate cached provider configurations")
+
+
+def _get_version(tenant_id: str) -> int:
+    version_key = f"{VERSION_KEY_PREFIX}{tenant_id}"
+    version = redis_client.get(version_key)
+    if version is None:
+        # start from the current time so a version key evicted by redis never comes back with an old value
+        redis_client.set(version_key, time.time_ns(), nx=True)
+        version = redis_client.get(version_key)
+    return int(version)
+
+
+def _copy_configurations(configurations: ProviderConfigurations) -> ProviderConfigurations:
+    copied = ProviderConfigurations(tenant_id=configurations.tenant_id)
+    for provider_name, provider_configuration in configurations.configurations.items():
+        # the provider entity is shared process wide anyway, copying it would be the costliest part
+        copied[provider_name] = provider_configuration.model_copy(
+            update={
+                "system_configuration": provider_configuration.system_configuration.model_copy(deep=True),
+                "custom_configuration": provider_configuration.custom_configuration.model_copy(deep=True),
+                "model_settings": [
+                    settings.model_copy(deep=True) for settings in provider_configuration.model_settings
+                ],
+            }
+        )
+    return copied
+
+
+def _dumps(configurations: ProviderConfigurations) -> str:
+    return json.dumps(
+        [
+            {
+                "provider": provider_configuration.provider.provider,
+                "preferred_provider_type": provider_configuration.preferred_provider_type.value,
+                "using_provider_type": provider_configuration.using_provider_type.value,
+                "system_configuration": provider_configuration.system_configuration.model_dump(mode="json"),
+                "custom_configuration": provider_configuration.custom_configuration.model_dump(mode="json"),
+                "model_settings": [
+                    settings.model_dump(mode="json") for settings in provider_configuration.model_settings
+                ],
+            }
+            for provider_configuration in configurations.values()
+        ]
+    )
+
+
+def _loads(tenant_id: str, value: bytes | str) -> ProviderConfigurations | None:
+    """
+    Rebuild configurations cached in Redis with the provider entities of this process,
+    or return None if a cached provider is not installed in this process
+    """
+    provider_entities = {
+        provider_entity.provider: provider_entity for provider_entity in model_provider_factory.get_providers()
+    }
+    configurations = ProviderConfigurations(tenant_id=tenant_id)
+    for item in json.loads(value):
+        provider_entity = provider_entities.get(item["provider"])
+        if provider_entity is None:
+            return None
+
+        configurations[item["provider"]] = ProviderConfiguration(
+            tenant_id=tenant_id,
+            provider=provider_entity,
+            preferred_provider_type=ProviderType.value_of(item["preferred_provider_type"]),
+            using_provider_type=ProviderType.value_of(item["using_provider_type"]),
+            system_configuration=SystemConfiguration.model_validate(item["system_configuration"]),
+            custom_configuration=CustomConfiguration.model_validate(item["custom_configuration"]),
+            model_settings=[ModelSettings.model_validate(settings) for settings in item["model_settings"]],
+        )
+    return configurations
+
+
+def _collect_changed_tenants(session: Session, flush_context) -> None:
+    changed_tenants = session.info.setdefault(CHANGED_TENANTS_INFO_KEY, set())
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, PROVIDER_MODELS) and instance.tenant_id:
+            changed_tenants.add(str(instance.tenant_id))
+
+
+def _invalidate_changed_tenants(session: Session) -> None:
+    changed_tenants = session.info.pop(CHANGED_TENANTS_INFO_KEY, None)
+    if changed_tenants:
+        invalidate_provider_configurations(changed_tenants)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany) -> None:
+    memo = _memo.get()
+    if memo is not None:
+        memo.count_query()
+
+
+# provider rows are written from many places, track them on every session instead of at each write.
+# tenants collected by a flush which is rolled back are invalidated by the next commit, which is only a cache miss
+event.listen(Session, "after_flush", _collect_changed_tenants)
+event.listen(Session, "after_commit", _invalidate_changed_tenants)
+event.listen(Engine, "before_cursor_execute", _count_query)
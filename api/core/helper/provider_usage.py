@@ -0,0 +1,232 @@
+import logging
+from datetime import UTC, datetime
+
+from sqlalchemy import update
+
+from configs import dify_config
+from core.helper.provider_configurations_cache import invalidate_provider_configurations
+from extensions.ext_database import db
+from extensions.ext_redis import redis_client
+from models.provider import Provider, ProviderType
+
+logger = logging.getLogger(__name__)
+
+# hashes of the usage of system providers not written to the database yet, the hash tag keeps the pending
+# and the flushing hashes in the same cluster slot so they can be renamed
+PENDING_QUOTA_USED_KEY = "{provider_usage}:quota_used"
+PENDING_LAST_USED_KEY = "{provider_usage}:last_used"
+# quota used written to the providers and quota limits, loaded from the database once per provider and flush
+PERSISTED_QUOTA_USED_KEY = "{provider_usage}:persisted_quota_used"
+QUOTA_LIMIT_KEY = "{provider_usage}:quota_limit"
+FLUSHING_KEY_SUFFIX = ":flushing"
+FLUSH_LOCK_KEY = "provider_usage_flush_lock"
+
+# KEYS: pending, flushing, persisted quota used, quota limit. ARGV: field, used quota, and the persisted quota used
+# and quota limit loaded from the database when they are not cached.
+# usage is only recorded while the quota is not exhausted, as the update of the provider does, and the remaining
+# quota is returned. Returns false if the persisted quota used is not cached
+ACCUMULATE_QUOTA_USED_SCRIPT = """
+if ARGV[3] then
+    redis.call('HSETNX', KEYS[3], ARGV[1], ARGV[3])
+    redis.call('HSETNX', KEYS[4], ARGV[1], ARGV[4])
+end
+local persisted = redis.call('HGET', KEYS[3], ARGV[1])
+local limit = redis.call('HGET', KEYS[4], ARGV[1])
+if not persisted or not limit then
+    return false
+end
+local used = tonumber(persisted) + tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or 0)
+    + tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or 0)
+if tonumber(limit) > used then
+    redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+    used = used + tonumber(ARGV[2])
+end
+return tonumber(limit) - used
+"""
+
+
+def deduct_provider_quota(*, tenant_id: str, provider_name: str, quota_type: str, used_quota: int) -> None:
+    """
+    Add used quota to a system provider.
+
+    With PROVIDER_USAGE_BATCH_ACCOUNTING_ENABLED the usage is accumulated in Redis and written by
+    `flush_provider_usage`, otherwise the provider row is updated right away.
+    Either way, cached provider configurations are invalidated once the quota is exhausted.
+    """
+    if dify_config.PROVIDER_USAGE_BATCH_ACCOUNTING_ENABLED:
+        try:
+            remaining_quota = _accumulate_quota_used(tenant_id, provider_name, quota_type, used_quota)
+        except Exception:
+            logger.exception("Failed to accumulate provider quota usage in redis, updating the provider instead")
+        else:
+            if remaining_quota is not None and remaining_quota <= 0:
+                invalidate_provider_configurations([tenant_id])
+            return
+
+    quotas = db.session.execute(
+        update(Provider)
+        .where(
+            Provider.tenant_id == tenant_id,
+            Provider.provider_name == provider_name,
+            Provider.provider_type == ProviderType.SYSTEM.value,
+            Provider.quota_type == quota_type,
+            Provider.quota_limit > Provider.quota_used,
+        )
+        .values(quota_used=Provider.quota_used + used_quota)
+        .returning(Provider.quota_used, Provider.quota_limit)
+    ).all()
+    db.session.commit()
+
+    # cached provider configurations only need to be rebuilt once the quota is exhausted
+    if any(quota.quota_used >= quota.quota_limit for quota in quotas):
+        invalidate_provider_configurations([tenant_id])
+
+
+def _accumulate_quota_used(tenant_id: str, provider_name: str, quota_type: str, used_quota: int) -> int | None:
+    """
+    Add used quota to the pending usage, checking the quota of the provider in the same script.
+    :return: remaining quota including all pending usage, or None if there is no such provider
+    """
+    field = _field(tenant_id, provider_name, quota_type)
+    keys = [
+        PENDING_QUOTA_USED_KEY,
+        PENDING_QUOTA_USED_KEY + FLUSHING_KEY_SUFFIX,
+        PERSISTED_QUOTA_USED_KEY,
+        QUOTA_LIMIT_KEY,
+    ]
+    accumulate = redis_client.register_script(ACCUMULATE_QUOTA_USED_SCRIPT)
+    remaining_quota = accumulate(keys=keys, args=[field, used_quota])
+    if remaining_quota is not None:
+        return int(remaining_quota)
+
+    quota = (
+        db.session.query(Provider.quota_used, Provider.quota_limit)
+        .filter(
+            Provider.tenant_id == tenant_id,
+            Provider.provider_name == provider_name,
+            Provider.provider_type == ProviderType.SYSTEM.value,
+            Provider.quota_type == quota_type,
+        )
+        .first()
+    )
+    if quota is None:
+        return None
+    return int(accumulate(keys=keys, args=[field, used_quota, quota.quota_used, quota.quota_limit]))
+
+
+def update_provider_last_used(*, tenant_id: str, provider_name: str) -> None:
+    last_used = datetime.now(UTC).replace(tzinfo=None)
+    if dify_config.PROVIDER_USAGE_BATCH_ACCOUNTING_ENABLED:
+        try:
+            redis_client.hset(PENDING_LAST_USED_KEY, _field(tenant_id, provider_name), last_used.isoformat())
+            return
+        except Exception:
+            logger.exception("Failed to record provider last used time in redis, updating the provider instead")
+
+    db.session.query(Provider).filter(
+        Provider.tenant_id == tenant_id,
+        Provider.provider_name == provider_name,
+    ).update({"last_used": last_used})
+    db.session.commit()
+
+
+def get_pending_quota_used(*, tenant_id: str, provider_name: str, quota_types: list[str]) -> dict[str, int]:
+    """
+    Get the used quota of system providers not written to the database yet, by quota type.
+
+    Adding it to `quota_used` of the providers keeps the quota check exact between two flushes. A snapshot
+    being flushed is counted until it is deleted, which can count it twice for the duration of a flush.
+    """
+    if not dify_config.PROVIDER_USAGE_BATCH_ACCOUNTING_ENABLED or not quota_types:
+        return {}
+
+    fields = [_field(tenant_id, provider_name, quota_type) for quota_type in quota_types]
+    try:
+        pipeline = redis_client.pipeline(transaction=False)
+        pipeline.hmget(PENDING_QUOTA_USED_KEY, fields)
+        pipeline.hmget(PENDING_QUOTA_USED_KEY + FLUSHING_KEY_SUFFIX, fields)
+        pending, flushing = pipeline.execute()
+    except Exception:
+        logger.exception("Failed to get pending provider quota usage from redis")
+        return {}
+
+    return {
+        quota_type: int(pending_used or 0) + int(flushing_used or 0)
+        for quota_type, pending_used, flushing_used in zip(quota_types, pending, flushing)
+    }
+
+
+def flush_provider_usage() -> int:
+    """
+    Write the usage accumulated in Redis to the providers, one update per provider.
+
+    The pending usage is renamed to a snapshot which is only deleted once written, so usage is never lost.
+    If the process dies between the commit and the deletion, the snapshot is written again by the next flush.
+    :return: number of updated providers
+    """
+    lock = redis_client.lock(FLUSH_LOCK_KEY, timeout=600, blocking_timeout=0)
+    if not lock.acquire():
+        return 0
+
+    try:
+        quota_used_key = _take_pending(PENDING_QUOTA_USED_KEY)
+        last_used_key = _take_pending(PENDING_LAST_USED_KEY)
+        quota_deltas = redis_client.hgetall(quota_used_key) if quota_used_key else {}
+        last_used_times = redis_client.hgetall(last_used_key) if last_used_key else {}
+
+        for field, used_quota in quota_deltas.items():
+            tenant_id, provider_name, quota_type = _parse_field(field.decode(), with_quota_type=True)
+            db.session.query(Provider).filter(
+                Provider.tenant_id == tenant_id,
+                Provider.provider_name == provider_name,
+                Provider.provider_type == ProviderType.SYSTEM.value,
+                Provider.quota_type == quota_type,
+                Provider.quota_limit > Provider.quota_used,
+            ).update({"quota_used": Provider.quota_used + int(used_quota)})
+        for field, last_used in last_used_times.items():
+            tenant_id, provider_name, _ = _parse_field(field.decode(), with_quota_type=False)
+            db.session.query(Provider).filter(
+                Provider.tenant_id == tenant_id,
+                Provider.provider_name == provider_name,
+            ).update({"last_used": datetime.fromisoformat(last_used.decode())})
+        db.session.commit()
+        # cached provider configurations include the used quota of the time they were built
+        invalidate_provider_configurations(
+            _parse_field(field.decode(), with_quota_type=True)[0] for field in quota_deltas
+        )
+
+        # the cached persisted usage is dropped before the snapshot is deleted, so the snapshot is never missing
+        # from the quota check, only counted twice in between. Usage loaded before the commit and cached after
+        # this deletion is stale until the next flush. Reloading on every flush also picks up changed quota limits
+        redis_client.delete(PERSISTED_QUOTA_USED_KEY, QUOTA_LIMIT_KEY)
+        if quota_used_key or last_used_key:
+            redis_client.delete(*[key for key in (quota_used_key, last_used_key) if key])
+        return len(quota_deltas) + len(last_used_times)
+    finally:
+        lock.release()
+
+
+def _take_pending(key: str) -> str | None:
+    """
+    Rename the pending usage to its flushing snapshot, or return the snapshot left by a failed flush
+    """
+    flushing_key = key + FLUSHING_KEY_SUFFIX
+    if redis_client.exists(flushing_key):
+        return flushing_key
+    if not redis_client.exists(key):
+        return None
+    redis_client.rename(key, flushing_key)
+    return flushing_key
+
+
+def _field(tenant_id: str, provider_name: str, quota_type: str | None = None) -> str:
+    return f"{tenant_id}:{provider_name}:{quota_type}" if quota_type is not None else f"{tenant_id}:{provider_name}"
+
+
+def _parse_field(field: str, with_quota_type: bool) -> tuple[str, str, str | None]:
+    # tenant ids and quota types never contain colons, provider names may
+    tenant_id, provider_name = field.split(":", 1)
+    if not with_quota_type:
+        return tenant_id, provider_name, None
+    provider_name, quota_type = provider_name.rsplit(":", 1)
+    return tenant_id, provider_name, quota_type
@@ -2,8 +2,14 @@
 Proxy requests to avoid SSRF
 """
 
+import asyncio
 import logging
+import os
+import threading
 import time
+import weakref
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Any, Optional
 
 import httpx
 
@@ -21,7 +27,175 @@ class MaxRetriesExceededError(ValueError):
     pass
 
 
-def make_request(method, url, max_retries=SSRF_DEFAULT_MAX_RETRIES, **kwargs):
+class _PoolMetrics:
+    """Request counters and connection wait time of a pooled client."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def request_started(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+
+    def request_finished(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def connection_acquired(self, wait_time: float):
+        with self._lock:
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def trace(self) -> Any:
+        """
+        Build a httpcore trace callback measuring the time a request waits for a pooled connection,
+        i.e. the time until the first connection level event of the request.
+        """
+        started_at = time.perf_counter()
+        acquired = False
+
+        def _trace(event_name: str, info: dict):
+            nonlocal acquired
+            if not acquired and event_name.startswith(("connection.", "http11.", "http2.")):
+                acquired = True
+                self.connection_acquired(time.perf_counter() - started_at)
+
+        return _trace
+
+    def async_trace(self) -> Any:
+        trace = self.trace()
+
+        async def _trace(event_name: str, info: dict):
+            trace(event_name, info)
+
+        return _trace
+
+    def to_dict(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "in_flight": self.in_flight,
+                "total_wait_time": self.total_wait_time,
+                "max_wait_time": self.max_wait_time,
+                "avg_wait_time": self.total_wait_time / self.requests if self.requests else 0.0,
+            }
+
+
+_clients_lock = threading.Lock()
+_clients: dict[tuple, httpx.Client] = {}
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[tuple, httpx.AsyncClient]]" = (
+    weakref.WeakKeyDictionary()
+)
+_clients_pid: Optional[int] = None
+_pool_metrics: dict[tuple, _PoolMetrics] = {}
+
+
+def _get_proxy_key() -> tuple:
+    if dify_config.SSRF_PROXY_ALL_URL:
+        return (dify_config.SSRF_PROXY_ALL_URL,)
+    elif dify_config.SSRF_PROXY_HTTP_URL and dify_config.SSRF_PROXY_HTTPS_URL:
+        return (dify_config.SSRF_PROXY_HTTP_URL, dify_config.SSRF_PROXY_HTTPS_URL)
+    return ()
+
+
+def _get_client_kwargs(proxy_key: tuple, transport_class: type) -> dict[str, Any]:
+    limits = httpx.Limits(
+        max_connections=dify_config.SSRF_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=dify_config.SSRF_POOL_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=dify_config.SSRF_POOL_KEEPALIVE_EXPIRY,
+    )
+    http2 = dify_config.SSRF_POOL_HTTP2_ENABLED
+    kwargs: dict[str, Any] = {
+        "limits": limits,
+        "http2": http2,
+        # pooled clients are shared by all tenants, never persist cookies between requests,
+        # redirects are followed with a cookie jar of the request instead
+        "cookies": CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+    }
+    if len(proxy_key) == 1:
+        kwargs["proxy"] = proxy_key[0]
+    elif len(proxy_key) == 2:
+        kwargs["mounts"] = {
+            "http://": transport_class(proxy=proxy_key[0], limits=limits, http2=http2),
+            "https://": transport_class(proxy=proxy_key[1], limits=limits, http2=http2),
+        }
+    return kwargs
+
+
+def _check_pid():
+    """Drop clients inherited from a parent process, their connections can't be shared after fork."""
+    global _clients_pid
+    pid = os.getpid()
+    if _clients_pid != pid:
+        _clients.clear()
+        _async_clients.clear()
+        _pool_metrics.clear()
+        _clients_pid = pid
+
+
+def get_client() -> httpx.Client:
+    """
+    Get the process-wide pooled client for the current proxy configuration.
+    """
+    proxy_key = _get_proxy_key()
+    with _clients_lock:
+        _check_pid()
+        client = _clients.get(proxy_key)
+        if client is None:
+            client = httpx.Client(**_get_client_kwargs(proxy_key, httpx.HTTPTransport))
+            _clients[proxy_key] = client
+            _pool_metrics.setdefault(proxy_key, _PoolMetrics())
+        return client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Get the pooled async client for the current proxy configuration and running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    proxy_key = _get_proxy_key()
+    with _clients_lock:
+        _check_pid()
+        loop_clients = _async_clients.setdefault(loop, {})
+        client = loop_clients.get(proxy_key)
+        if client is None:
+            client = httpx.AsyncClient(**_get_client_kwargs(proxy_key, httpx.AsyncHTTPTransport))
+            loop_clients[proxy_key] = client
+            _pool_metrics.setdefault(proxy_key, _PoolMetrics())
+        return client
+
+
+def get_pool_metrics() -> list[dict[str, Any]]:
+    """
+    Get connection pool metrics of the pooled sync clients in this process.
+    """
+    metrics = []
+    with _clients_lock:
+        for proxy_key, client in _clients.items():
+            connections = []
+            for transport in [client._transport, *client._mounts.values()]:
+                pool = getattr(transport, "_pool", None)
+                if pool is not None:
+                    connections.extend(pool.connections)
+            idle = sum(1 for connection in connections if connection.is_idle())
+            metrics.append(
+                {
+                    "proxy": bool(proxy_key),
+                    "connections": len(connections),
+                    "in_use": len(connections) - idle,
+                    "idle": idle,
+                    **_pool_metrics[proxy_key].to_dict(),
+                }
+            )
+    return metrics
+
+
+def _prepare_kwargs(kwargs: dict[str, Any]) -> dict[str, Any]:
     if "allow_redirects" in kwargs:
         allow_redirects = kwargs.pop("allow_redirects")
         if "follow_redirects" not in kwargs:
@@ -35,23 +209,66 @@ def make_request(method, url, max_retries=SSRF_DEFAULT_MAX_RETRIES, **kwargs):
             write=dify_config.SSRF_DEFAULT_WRITE_TIME_OUT,
         )
 
+    kwargs.pop("stream", False)
+    return kwargs
+
+
+def _next_request(
+    client: httpx.Client | httpx.AsyncClient, response: httpx.Response, cookies: httpx.Cookies, history: list
+) -> Optional[httpx.Request]:
+    """
+    Get the redirect request of a response, with the cookies set by the responses of the request so far.
+    """
+    next_request = response.next_request
+    if next_request is None:
+        return None
+    if len(history) >= client.max_redirects:
+        raise httpx.TooManyRedirects("Exceeded maximum allowed redirects.", request=next_request)
+    cookies.extract_cookies(response)
+    cookies.set_cookie_header(next_request)
+    history.append(response)
+    return next_request
+
+
+def _send(client: httpx.Client, method, url, trace, **kwargs) -> httpx.Response:
+    follow_redirects = kwargs.pop("follow_redirects", client.follow_redirects)
+    cookies = httpx.Cookies(kwargs.get("cookies"))
+    response = client.request(method=method, url=url, extensions={"trace": trace}, follow_redirects=False, **kwargs)
+    history: list[httpx.Response] = []
+    while follow_redirects and (next_request := _next_request(client, response, cookies, history)):
+        response = client.send(next_request, follow_redirects=False)
+    if history:
+        response.history = history
+    return response
+
+
+async def _send_async(client: httpx.AsyncClient, method, url, trace, **kwargs) -> httpx.Response:
+    follow_redirects = kwargs.pop("follow_redirects", client.follow_redirects)
+    cookies = httpx.Cookies(kwargs.get("cookies"))
+    response = await client.request(
+        method=method, url=url, extensions={"trace": trace}, follow_redirects=False, **kwargs
+    )
+    history: list[httpx.Response] = []
+    while follow_redirects and (next_request := _next_request(client, response, cookies, history)):
+        response = await client.send(next_request, follow_redirects=False)
+    if history:
+        response.history = history
+    return response
+
+
+def make_request(method, url, max_retries=SSRF_DEFAULT_MAX_RETRIES, **kwargs):
+    kwargs = _prepare_kwargs(kwargs)
+
     retries = 0
-    stream = kwargs.pop("stream", False)
     while retries <= max_retries:
         try:
-            if dify_config.SSRF_PROXY_ALL_URL:
-                with httpx.Client(proxy=dify_config.SSRF_PROXY_ALL_URL) as client:
-                    response = client.request(method=method, url=url, **kwargs)
-            elif dify_config.SSRF_PROXY_HTTP_URL and dify_config.SSRF_PROXY_HTTPS_URL:
-                proxy_mounts = {
-                    "http://": httpx.HTTPTransport(proxy=dify_config.SSRF_PROXY_HTTP_URL),
-                    "https://": httpx.HTTPTransport(proxy=dify_config.SSRF_PROXY_HTTPS_URL),
-                }
-                with httpx.Client(mounts=proxy_mounts) as client:
-                    response = client.request(method=method, url=url, **kwargs)
-            else:
-                with httpx.Client() as client:
-                    response = client.request(method=method, url=url, **kwargs)
+            client = get_client()
+            metrics = _pool_metrics[_get_proxy_key()]
+            metrics.request_started()
+            try:
+                response = _send(client, method, url, metrics.trace(), **kwargs)
+            finally:
+                metrics.request_finished()
 
             if response.status_code not in STATUS_FORCELIST:
                 return response
@@ -69,6 +286,36 @@ def make_request(method, url, max_retries=SSRF_DEFAULT_MAX_RETRIES, **kwargs):
     raise MaxRetriesExceededError(f"Reached maximum retries ({max_retries}) for URL {url}")
 
 
+async def make_request_async(method, url, max_retries=SSRF_DEFAULT_MAX_RETRIES, **kwargs):
+    kwargs = _prepare_kwargs(kwargs)
+
+    retries = 0
+    while retries <= max_retries:
+        try:
+            client = get_async_client()
+            metrics = _pool_metrics[_get_proxy_key()]
+            metrics.request_started()
+            try:
+                response = await _send_async(client, method, url, metrics.async_trace(), **kwargs)
+            finally:
+                metrics.request_finished()
+
+            if response.status_code not in STATUS_FORCELIST:
+                return response
+            else:
+                logging.warning(f"Received status code {response.status_code} for URL {url} which is in the force list")
+
+        except httpx.RequestError as e:
+            logging.warning(f"Request to URL {url} failed on attempt {retries + 1}: {e}")
+            if max_retries == 0:
+                raise
+
+        retries += 1
+        if retries <= max_retries:
+            await asyncio.sleep(BACKOFF_FACTOR * (2 ** (retries - 1)))
+    raise MaxRetriesExceededError(f"Reached maximum retries ({max_retries}) for URL {url}")
+
+
 def get(url, max_retries=SSRF_DEFAULT_MAX_RETRIES, **kwargs):
     return make_request("GET", url, max_retries=max_retries, **kwargs)
 
@@ -1,11 +1,14 @@
 import concurrent.futures
+import contextlib
 import datetime
+import itertools
 import json
 import logging
 import re
 import threading
 import time
 import uuid
+from collections.abc import Generator
 from typing import Any, Optional, cast
 
 from flask import current_app
@@ -66,23 +69,8 @@ class IndexingRunner:
                     raise ValueError("no process rule found")
                 index_type = dataset_document.doc_form
                 index_processor = IndexProcessorFactory(index_type).init_index_processor()
-                # extract
-                text_docs = self._extract(index_processor, dataset_document, processing_rule.to_dict())
-
-                # transform
-                documents = self._transform(
-                    index_processor, dataset, text_docs, dataset_document.doc_language, processing_rule.to_dict()
-                )
-                # save segment
-                self._load_segments(dataset, dataset_document, documents)
-
-                # load
-                self._load(
-                    index_processor=index_processor,
-                    dataset=dataset,
-                    dataset_document=dataset_document,
-                    documents=documents,
-                )
+                # extract, transform, save segments and load
+                self._extract_transform_load(index_processor, dataset, dataset_document, processing_rule.to_dict())
             except DocumentIsPausedError:
                 raise DocumentIsPausedError("Document paused, document id: {}".format(dataset_document.id))
             except ProviderTokenNotInitError as e:
@@ -108,11 +96,18 @@ class IndexingRunner:
             if not dataset:
                 raise ValueError("no dataset found")
 
+            index_type = dataset_document.doc_form
+            index_processor = IndexProcessorFactory(index_type).init_index_processor()
+
             # get exist document_segment list and delete
             document_segments = DocumentSegment.query.filter_by(
                 dataset_id=dataset.id, document_id=dataset_document.id
             ).all()
 
+            if document_segments:
+                # a file indexed batch by batch has loaded segments while it is still splitting, unload them too
+                index_node_ids = [document_segment.index_node_id for document_segment in document_segments]
+                index_processor.clean(dataset, index_node_ids, with_keywords=True, delete_child_chunks=True)
             for document_segment in document_segments:
                 db.session.delete(document_segment)
                 if dataset_document.doc_form == IndexType.PARENT_CHILD_INDEX:
@@ -128,22 +123,8 @@ class IndexingRunner:
             if not processing_rule:
                 raise ValueError("no process rule found")
 
-            index_type = dataset_document.doc_form
-            index_processor = IndexProcessorFactory(index_type).init_index_processor()
-            # extract
-            text_docs = self._extract(index_processor, dataset_document, processing_rule.to_dict())
-
-            # transform
-            documents = self._transform(
-                index_processor, dataset, text_docs, dataset_document.doc_language, processing_rule.to_dict()
-            )
-            # save segment
-            self._load_segments(dataset, dataset_document, documents)
-
-            # load
-            self._load(
-                index_processor=index_processor, dataset=dataset, dataset_document=dataset_document, documents=documents
-            )
+            # extract, transform, save segments and load
+            self._extract_transform_load(index_processor, dataset, dataset_document, processing_rule.to_dict())
         except DocumentIsPausedError:
             raise DocumentIsPausedError("Document paused, document id: {}".format(dataset_document.id))
         except ProviderTokenNotInitError as e:
@@ -327,6 +308,107 @@ class IndexingRunner:
             return IndexingEstimate(total_segments=total_segments * 20, qa_preview=preview_texts, preview=[])
         return IndexingEstimate(total_segments=total_segments, preview=preview_texts)  # type: ignore
 
+    def _extract_transform_load(
+        self,
+        index_processor: BaseIndexProcessor,
+        dataset: Dataset,
+        dataset_document: DatasetDocument,
+        process_rule: dict,
+    ) -> None:
+        batch_size = dify_config.INDEXING_EXTRACT_BATCH_SIZE
+        if not batch_size or not index_processor.supports_incremental_transform(process_rule):
+            # extract
+            text_docs = self._extract(index_processor, dataset_document, process_rule)
+
+            # transform
+            documents = self._transform(
+                index_processor, dataset, text_docs, dataset_document.doc_language, process_rule
+            )
+            # save segment
+            self._load_segments(dataset, dataset_document, documents)
+
+            # load
+            self._load(
+                index_processor=index_processor, dataset=dataset, dataset_document=dataset_document, documents=documents
+            )
+            return
+
+        self._run_pipeline(index_processor, dataset, dataset_document, process_rule, batch_size)
+
+    def _run_pipeline(
+        self,
+        index_processor: BaseIndexProcessor,
+        dataset: Dataset,
+        dataset_document: DatasetDocument,
+        process_rule: dict,
+        batch_size: int,
+    ) -> None:
+        """
+        Split, save and load the extracted documents batch by batch while the file is still being extracted,
+        so only one batch is held in memory and the first segments are embedded long before a large file is
+        fully extracted. The document stays in the splitting status until the last batch is loaded, so a paused
+        or interrupted document is recovered by extracting it again, and its statistics are written at the end.
+        """
+        doc_store = DatasetDocumentStore(
+            dataset=dataset, user_id=dataset_document.created_by, document_id=dataset_document.id
+        )
+        word_count = 0
+        tokens = 0
+        indexing_latency = 0.0
+        # closing the extraction removes the downloaded file right away if a batch fails
+        with contextlib.closing(self._extract_iter(index_processor, dataset_document, process_rule)) as text_docs:
+            while batch := list(itertools.islice(text_docs, batch_size)):
+                word_count += sum(len(text_doc.page_content) for text_doc in batch)
+                self._set_document_ids(dataset_document, batch)
+
+                # transform
+                documents = self._transform(
+                    index_processor, dataset, batch, dataset_document.doc_language, process_rule
+                )
+                if not documents:
+                    continue
+
+                # update document status to splitting, or stop here if it is paused
+                self._update_document_index_status(document_id=dataset_document.id, after_indexing_status="splitting")
+
+                # save segments
+                doc_store.add_documents(
+                    docs=documents, save_child=dataset_document.doc_form == IndexType.PARENT_CHILD_INDEX
+                )
+                document_ids = [document.metadata["doc_id"] for document in documents]
+                DocumentSegment.query.filter(
+                    DocumentSegment.document_id == dataset_document.id, DocumentSegment.index_node_id.in_(document_ids)
+                ).update(
+                    {
+                        DocumentSegment.status: "indexing",
+                        DocumentSegment.indexing_at: datetime.datetime.now(datetime.UTC).replace(tzinfo=None),
+                    },
+                    synchronize_session=False,
+                )
+                db.session.commit()
+
+                # load
+                indexing_start_at = time.perf_counter()
+                tokens += self._index_documents(index_processor, dataset, dataset_document, documents)
+                indexing_latency += time.perf_counter() - indexing_start_at
+
+        # update document status to completed
+        cur_time = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+        self._update_document_index_status(
+            document_id=dataset_document.id,
+            after_indexing_status="completed",
+            extra_update_params={
+                DatasetDocument.word_count: word_count,
+                DatasetDocument.parsing_completed_at: cur_time,
+                DatasetDocument.cleaning_completed_at: cur_time,
+                DatasetDocument.splitting_completed_at: cur_time,
+                DatasetDocument.tokens: tokens,
+                DatasetDocument.completed_at: cur_time,
+                DatasetDocument.indexing_latency: indexing_latency,
+                DatasetDocument.error: None,
+            },
+        )
+
     def _extract(
         self, index_processor: BaseIndexProcessor, dataset_document: DatasetDocument, process_rule: dict
     ) -> list[Document]:
@@ -334,8 +416,39 @@ class IndexingRunner:
         if dataset_document.data_source_type not in {"upload_file", "notion_import", "website_crawl"}:
             return []
 
-        data_source_info = dataset_document.data_source_info_dict
+        extract_setting = self._get_extract_setting(dataset_document)
         text_docs = []
+        if extract_setting:
+            text_docs = index_processor.extract(extract_setting, process_rule_mode=process_rule["mode"])
+        # update document status to splitting
+        self._update_document_index_status(
+            document_id=dataset_document.id,
+            after_indexing_status="splitting",
+            extra_update_params={
+                DatasetDocument.word_count: sum(len(text_doc.page_content) for text_doc in text_docs),
+                DatasetDocument.parsing_completed_at: datetime.datetime.now(datetime.UTC).replace(tzinfo=None),
+            },
+        )
+
+        # replace doc id to document model id
+        text_docs = cast(list[Document], text_docs)
+        self._set_document_ids(dataset_document, text_docs)
+
+        return text_docs
+
+    def _extract_iter(
+        self, index_processor: BaseIndexProcessor, dataset_document: DatasetDocument, process_rule: dict
+    ) -> Generator[Document, None, None]:
+        if dataset_document.data_source_type not in {"upload_file", "notion_import", "website_crawl"}:
+            return
+
+        extract_setting = self._get_extract_setting(dataset_document)
+        if extract_setting:
+            yield from index_processor.extract_iter(extract_setting, process_rule_mode=process_rule["mode"])
+
+    @staticmethod
+    def _get_extract_setting(dataset_document: DatasetDocument) -> Optional[ExtractSetting]:
+        data_source_info = dataset_document.data_source_info_dict
         if dataset_document.data_source_type == "upload_file":
             if not data_source_info or "upload_file_id" not in data_source_info:
                 raise ValueError("no upload file found")
@@ -345,10 +458,9 @@ class IndexingRunner:
             )
 
             if file_detail:
-                extract_setting = ExtractSetting(
+                return ExtractSetting(
                     datasource_type="upload_file", upload_file=file_detail, document_model=dataset_document.doc_form
                 )
-                text_docs = index_processor.extract(extract_setting, process_rule_mode=process_rule["mode"])
         elif dataset_document.data_source_type == "notion_import":
             if (
                 not data_source_info
@@ -356,7 +468,7 @@ class IndexingRunner:
                 or "notion_page_id" not in data_source_info
             ):
                 raise ValueError("no notion import info found")
-            extract_setting = ExtractSetting(
+            return ExtractSetting(
                 datasource_type="notion_import",
                 notion_info={
                     "notion_workspace_id": data_source_info["notion_workspace_id"],
@@ -367,7 +479,6 @@ class IndexingRunner:
                 },
                 document_model=dataset_document.doc_form,
             )
-            text_docs = index_processor.extract(extract_setting, process_rule_mode=process_rule["mode"])
         elif dataset_document.data_source_type == "website_crawl":
             if (
                 not data_source_info
@@ -376,7 +487,7 @@ class IndexingRunner:
                 or "job_id" not in data_source_info
             ):
                 raise ValueError("no website import info found")
-            extract_setting = ExtractSetting(
+            return ExtractSetting(
                 datasource_type="website_crawl",
                 website_info={
                     "provider": data_source_info["provider"],
@@ -388,26 +499,15 @@ class IndexingRunner:
                 },
                 document_model=dataset_document.doc_form,
             )
-            text_docs = index_processor.extract(extract_setting, process_rule_mode=process_rule["mode"])
-        # update document status to splitting
-        self._update_document_index_status(
-            document_id=dataset_document.id,
-            after_indexing_status="splitting",
-            extra_update_params={
-                DatasetDocument.word_count: sum(len(text_doc.page_content) for text_doc in text_docs),
-                DatasetDocument.parsing_completed_at: datetime.datetime.now(datetime.UTC).replace(tzinfo=None),
-            },
-        )
+        return None
 
-        # replace doc id to document model id
-        text_docs = cast(list[Document], text_docs)
+    @staticmethod
+    def _set_document_ids(dataset_document: DatasetDocument, text_docs: list[Document]) -> None:
         for text_doc in text_docs:
             if text_doc.metadata is not None:
                 text_doc.metadata["document_id"] = dataset_document.id
                 text_doc.metadata["dataset_id"] = dataset_document.dataset_id
 
-        return text_docs
-
     @staticmethod
     def filter_string(text):
         text = re.sub(r"<\|", "<", text)
@@ -517,7 +617,33 @@ class IndexingRunner:
         """
         insert index and update document/segment status to completed
         """
+        indexing_start_at = time.perf_counter()
+        tokens = self._index_documents(index_processor, dataset, dataset_document, documents)
+        indexing_end_at = time.perf_counter()
+
+        # update document status to completed
+        self._update_document_index_status(
+            document_id=dataset_document.id,
+            after_indexing_status="completed",
+            extra_update_params={
+                DatasetDocument.tokens: tokens,
+                DatasetDocument.completed_at: datetime.datetime.now(datetime.UTC).replace(tzinfo=None),
+                DatasetDocument.indexing_latency: indexing_end_at - indexing_start_at,
+                DatasetDocument.error: None,
+            },
+        )
 
+    def _index_documents(
+        self,
+        index_processor: BaseIndexProcessor,
+        dataset: Dataset,
+        dataset_document: DatasetDocument,
+        documents: list[Document],
+    ) -> int:
+        """
+        insert index and update segment status to completed
+        :return: number of embedding tokens
+        """
         embedding_model_instance = None
         if dataset.indexing_technique == "high_quality":
             embedding_model_instance = self.model_manager.get_model_instance(
@@ -528,7 +654,6 @@ class IndexingRunner:
             )
 
         # chunk nodes by chunk size
-        indexing_start_at = time.perf_counter()
         tokens = 0
         if dataset_document.doc_form != IndexType.PARENT_CHILD_INDEX:
             # create keyword index
@@ -570,19 +695,7 @@ class IndexingRunner:
                     tokens += future.result()
         if dataset_document.doc_form != IndexType.PARENT_CHILD_INDEX:
             create_keyword_thread.join()
-        indexing_end_at = time.perf_counter()
-
-        # update document status to completed
-        self._update_document_index_status(
-            document_id=dataset_document.id,
-            after_indexing_status="completed",
-            extra_update_params={
-                DatasetDocument.tokens: tokens,
-                DatasetDocument.completed_at: datetime.datetime.now(datetime.UTC).replace(tzinfo=None),
-                DatasetDocument.indexing_latency: indexing_end_at - indexing_start_at,
-                DatasetDocument.error: None,
-            },
-        )
+        return tokens
 
     @staticmethod
     def _process_keyword_index(flask_app, dataset_id, document_id, documents):
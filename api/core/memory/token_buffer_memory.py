@@ -1,8 +1,15 @@
+import hashlib
+import logging
+import threading
+from collections import defaultdict
 from collections.abc import Sequence
-from typing import Optional
+from typing import Any, Optional
+
+from cachetools import LRUCache
+from sqlalchemy.orm import load_only
 
 from core.app.app_config.features.file_upload.manager import FileUploadConfigManager
-from core.file import file_manager
+from core.file import FileUploadConfig, file_manager
 from core.model_manager import ModelInstance
 from core.model_runtime.entities import (
     AssistantPromptMessage,
@@ -15,9 +22,19 @@ from core.model_runtime.entities import (
 )
 from core.prompt.utils.extract_thread_messages import extract_thread_messages
 from extensions.ext_database import db
+from extensions.ext_redis import redis_client
 from factories import file_factory
 from models.model import AppMode, Conversation, Message, MessageFile
-from models.workflow import WorkflowRun
+from models.workflow import Workflow, WorkflowRun
+
+logger = logging.getLogger(__name__)
+
+# file upload configs converted from workflow features, keyed by (workflow_id, updated_at)
+_workflow_file_upload_config_cache: LRUCache = LRUCache(maxsize=1000)
+_workflow_file_upload_config_cache_lock = threading.Lock()
+
+# token counts of history messages never change for a given model, keep them for a day
+MESSAGE_TOKENS_CACHE_TTL = 86400
 
 
 class TokenBufferMemory:
@@ -69,22 +86,17 @@ class TokenBufferMemory:
         messages = list(reversed(thread_messages))
 
         prompt_messages: list[PromptMessage] = []
+        # identifies every prompt message by its source message, used to cache per-message token counts
+        prompt_message_keys: list[str] = []
+        message_files = self._get_message_files([message.id for message in messages])
+        file_extra_configs = self._get_file_extra_configs(
+            [message for message in messages if message.id in message_files]
+        )
         for message in messages:
-            files = db.session.query(MessageFile).filter(MessageFile.message_id == message.id).all()
+            query_key = f"{message.id}:query"
+            files = message_files.get(message.id)
             if files:
-                file_extra_config = None
-                if self.conversation.mode not in {AppMode.ADVANCED_CHAT, AppMode.WORKFLOW}:
-                    file_extra_config = FileUploadConfigManager.convert(self.conversation.model_config)
-                else:
-                    if message.workflow_run_id:
-                        workflow_run = (
-                            db.session.query(WorkflowRun).filter(WorkflowRun.id == message.workflow_run_id).first()
-                        )
-
-                        if workflow_run and workflow_run.workflow:
-                            file_extra_config = FileUploadConfigManager.convert(
-                                workflow_run.workflow.features_dict, is_vision=False
-                            )
+                file_extra_config = file_extra_configs.get(message.id)
 
                 detail = ImagePromptMessageContent.DETAIL.LOW
                 if file_extra_config and app_record:
@@ -93,6 +105,9 @@ class TokenBufferMemory:
                     )
                     if file_extra_config.image_config and file_extra_config.image_config.detail:
                         detail = file_extra_config.image_config.detail
+                    # the content of the query depends on the file upload config and image detail, which can change
+                    file_config_hash = hashlib.md5(file_extra_config.model_dump_json().encode()).hexdigest()[:8]
+                    query_key = f"{query_key}:{file_config_hash}:{detail.value}"
                 else:
                     file_objs = []
 
@@ -114,6 +129,7 @@ class TokenBufferMemory:
                 prompt_messages.append(UserPromptMessage(content=message.query))
 
             prompt_messages.append(AssistantPromptMessage(content=message.answer))
+            prompt_message_keys.extend([query_key, f"{message.id}:answer"])
 
         if not prompt_messages:
             return []
@@ -122,13 +138,133 @@ class TokenBufferMemory:
         curr_message_tokens = self.model_instance.get_llm_num_tokens(prompt_messages)
 
         if curr_message_tokens > max_token_limit:
-            pruned_memory = []
-            while curr_message_tokens > max_token_limit and len(prompt_messages) > 1:
-                pruned_memory.append(prompt_messages.pop(0))
-                curr_message_tokens = self.model_instance.get_llm_num_tokens(prompt_messages)
+            # prune oldest messages using per-message token counts instead of re-counting the remaining list.
+            # every count includes the per-request overhead of the tokenizer, which stays in curr_message_tokens
+            # and is subtracted from the count of each pruned message
+            message_tokens = self._get_prompt_message_tokens(prompt_message_keys, prompt_messages)
+            try:
+                request_overhead_tokens = self.model_instance.get_llm_num_tokens([])
+            except Exception:
+                # some providers count tokens remotely and reject an empty message list
+                logger.warning("Failed to count the request overhead tokens", exc_info=True)
+                request_overhead_tokens = 0
+            pruned_count = 0
+            while curr_message_tokens > max_token_limit and pruned_count < len(prompt_messages) - 1:
+                curr_message_tokens -= message_tokens[pruned_count] - request_overhead_tokens
+                pruned_count += 1
+            prompt_messages = prompt_messages[pruned_count:]
 
         return prompt_messages
 
+    @staticmethod
+    def _get_message_files(message_ids: list[str]) -> dict[str, list[MessageFile]]:
+        """
+        Get files of all history messages with a single query.
+        :param message_ids: message ids
+        :return: files grouped by message id
+        """
+        if not message_ids:
+            return {}
+
+        message_files: dict[str, list[MessageFile]] = defaultdict(list)
+        files = db.session.query(MessageFile).filter(MessageFile.message_id.in_(message_ids)).all()
+        for file in files:
+            message_files[file.message_id].append(file)
+        return message_files
+
+    def _get_file_extra_configs(self, messages: Sequence[Any]) -> dict[str, Optional[FileUploadConfig]]:
+        """
+        Get file upload config of every message that has files.
+        Workflow features are loaded with one query for all distinct workflows of the messages,
+        and the converted configs are memoized per workflow version.
+        :param messages: messages with files
+        :return: file upload config by message id
+        """
+        if not messages:
+            return {}
+
+        if self.conversation.mode not in {AppMode.ADVANCED_CHAT, AppMode.WORKFLOW}:
+            file_extra_config = FileUploadConfigManager.convert(self.conversation.model_config)
+            return {message.id: file_extra_config for message in messages}
+
+        workflow_run_ids = {message.workflow_run_id for message in messages if message.workflow_run_id}
+        if not workflow_run_ids:
+            return {}
+
+        workflow_versions = (
+            db.session.query(WorkflowRun.id, Workflow.id, Workflow.updated_at)
+            .join(Workflow, Workflow.id == WorkflowRun.workflow_id)
+            .filter(WorkflowRun.id.in_(workflow_run_ids))
+            .all()
+        )
+        run_workflow_keys = {run_id: (workflow_id, updated_at) for run_id, workflow_id, updated_at in workflow_versions}
+
+        workflow_configs: dict[tuple[str, Any], Optional[FileUploadConfig]] = {}
+        with _workflow_file_upload_config_cache_lock:
+            for key in set(run_workflow_keys.values()):
+                if key in _workflow_file_upload_config_cache:
+                    workflow_configs[key] = _workflow_file_upload_config_cache[key]
+
+        missing_workflow_ids = {key[0] for key in run_workflow_keys.values() if key not in workflow_configs}
+        if missing_workflow_ids:
+            workflows = (
+                db.session.query(Workflow)
+                .options(load_only(Workflow.id, Workflow.updated_at, Workflow._features))
+                .filter(Workflow.id.in_(missing_workflow_ids))
+                .all()
+            )
+            with _workflow_file_upload_config_cache_lock:
+                for workflow in workflows:
+                    key = (workflow.id, workflow.updated_at)
+                    workflow_configs[key] = FileUploadConfigManager.convert(workflow.features_dict, is_vision=False)
+                    _workflow_file_upload_config_cache[key] = workflow_configs[key]
+
+        return {
+            message.id: workflow_configs.get(run_workflow_keys[message.workflow_run_id])
+            for message in messages
+            if message.workflow_run_id in run_workflow_keys
+        }
+
+    def _get_prompt_message_tokens(self, keys: list[str], prompt_messages: list[PromptMessage]) -> list[int]:
+        """
+        Get token count of every prompt message, cached in redis by message id and model.
+        :param keys: cache keys of prompt messages
+        :param prompt_messages: prompt messages
+        :return: token count of each prompt message
+        """
+        cache_keys = [
+            f"memory_message_tokens:{self.model_instance.provider}:{self.model_instance.model}:{key}" for key in keys
+        ]
+        cached_tokens: list = [None] * len(cache_keys)
+        try:
+            pipeline = redis_client.pipeline(transaction=False)
+            for cache_key in cache_keys:
+                pipeline.get(cache_key)
+            cached_tokens = pipeline.execute()
+        except Exception:
+            logger.exception("Failed to get message tokens from redis")
+
+        message_tokens = []
+        new_tokens = {}
+        for cache_key, cached, prompt_message in zip(cache_keys, cached_tokens, prompt_messages):
+            if cached is not None:
+                message_tokens.append(int(cached))
+            else:
+                tokens = self.model_instance.get_llm_num_tokens([prompt_message])
+                message_tokens.append(tokens)
+                new_tokens[cache_key] = tokens
+
+        if new_tokens:
+            try:
+                pipeline = redis_client.pipeline(transaction=False)
+                for cache_key, tokens in new_tokens.items():
+                    pipeline.setex(cache_key, MESSAGE_TOKENS_CACHE_TTL, tokens)
+                pipeline.execute()
+            except Exception:
+                logger.exception("Failed to add message tokens to redis")
+
+        return message_tokens
+
     def get_history_prompt_text(
         self,
         human_prefix: str = "Human",
@@ -0,0 +1,119 @@
+import threading
+from collections import deque
+from collections.abc import Iterable
+
+from cachetools import LRUCache
+
+# matchers of the keywords configs in use, keyed by the config, so a changed config compiles a new matcher
+MATCHER_CACHE_SIZE = 1000
+
+_matcher_cache: LRUCache[str, "KeywordMatcher"] = LRUCache(maxsize=MATCHER_CACHE_SIZE)
+_matcher_cache_lock = threading.Lock()
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton of keywords.
+
+    It finds whether a text contains any of the keywords, case-insensitively, in a single pass over the text
+    whatever the number of keywords. Matchers are immutable and shared, scanners keep the state of a stream.
+    """
+
+    def __init__(self, keywords: Iterable[str]) -> None:
+        # trie of the lowercased keywords, with the longest proper suffix of every state which is also in the trie
+        self._transitions: list[dict[str, int]] = [{}]
+        self._fallbacks: list[int] = [0]
+        # whether a keyword ends at the state or at one of its suffixes
+        self._matches: list[bool] = [False]
+
+        for keyword in keywords:
+            if not keyword:
+                continue
+            state = 0
+            for char in keyword.lower():
+                next_state = self._transitions[state].get(char)
+                if next_state is None:
+                    next_state = len(self._transitions)
+                    self._transitions[state][char] = next_state
+                    self._transitions.append({})
+                    self._fallbacks.append(0)
+                    self._matches.append(False)
+                state = next_state
+            self._matches[state] = True
+
+        # the children of the root fall back to the root, deeper states to the state of their longest suffix
+        queue = deque(self._transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._transitions[state].items():
+                queue.append(next_state)
+                fallback = self._fallbacks[state]
+                while fallback and char not in self._transitions[fallback]:
+                    fallback = self._fallbacks[fallback]
+                fallback = self._transitions[fallback].get(char, 0)
+                self._fallbacks[next_state] = fallback
+                self._matches[next_state] = self._matches[next_state] or self._matches[fallback]
+
+    def search(self, text: str) -> bool:
+        """
+        Whether the text contains any of the keywords
+        """
+        return self.scanner().feed(text)
+
+    def scanner(self) -> "KeywordScanner":
+        return KeywordScanner(self)
+
+    def advance(self, state: int, text: str) -> tuple[int, bool]:
+        """
+        Run the automaton over a text from a state
+        :return: the state after the text, and whether a keyword matched
+        """
+        transitions = self._transitions
+        fallbacks = self._fallbacks
+        matches = self._matches
+        for char in text.lower():
+            while state and char not in transitions[state]:
+                state = fallbacks[state]
+            state = transitions[state].get(char, 0)
+            if matches[state]:
+                return state, True
+        return state, False
+
+
+class KeywordScanner:
+    """
+    Incremental scan of a stream, every chunk fed is scanned once and keywords spanning chunks are matched
+    """
+
+    def __init__(self, matcher: KeywordMatcher) -> None:
+        self._matcher = matcher
+        self._state = 0
+        self.matched = False
+
+    def feed(self, text: str) -> bool:
+        """
+        Scan the next chunk of the stream
+        :return: whether a keyword matched in the stream so far
+        """
+        if not self.matched and text:
+            self._state, self.matched = self._matcher.advance(self._state, text)
+        return self.matched
+
+    def restart(self) -> "KeywordScanner":
+        """
+        Get a scanner of a new stream with the same keywords
+        """
+        return KeywordScanner(self._matcher)
+
+
+def get_keyword_matcher(keywords: str) -> KeywordMatcher:
+    """
+    Get the matcher of a keywords config, one keyword per line
+    """
+    with _matcher_cache_lock:
+        matcher = _matcher_cache.get(keywords)
+    if matcher is None:
+        matcher = KeywordMatcher(keyword for keyword in keywords.split("\n") if keyword)
+        with _matcher_cache_lock:
+            _matcher_cache[keywords] = matcher
+    return matcher
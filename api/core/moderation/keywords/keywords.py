@@ -1,7 +1,7 @@
-from collections.abc import Sequence
-from typing import Any
+from typing import Optional
 
 from core.moderation.base import Moderation, ModerationAction, ModerationInputsResult, ModerationOutputsResult
+from core.moderation.keywords.keyword_matcher import KeywordMatcher, KeywordScanner, get_keyword_matcher
 
 
 class KeywordsModeration(Moderation):
@@ -40,10 +40,7 @@ class KeywordsModeration(Moderation):
             if query:
                 inputs["query__"] = query
 
-            # Filter out empty values
-            keywords_list = [keyword for keyword in self.config["keywords"].split("\n") if keyword]
-
-            flagged = self._is_violated(inputs, keywords_list)
+            flagged = self._is_violated(inputs, get_keyword_matcher(self.config["keywords"]))
 
         return ModerationInputsResult(
             flagged=flagged, action=ModerationAction.DIRECT_OUTPUT, preset_response=preset_response
@@ -56,18 +53,25 @@ class KeywordsModeration(Moderation):
             raise ValueError("The config is not set.")
 
         if self.config["outputs_config"]["enabled"]:
-            # Filter out empty values
-            keywords_list = [keyword for keyword in self.config["keywords"].split("\n") if keyword]
-
-            flagged = self._is_violated({"text": text}, keywords_list)
+            flagged = get_keyword_matcher(self.config["keywords"]).search(text)
             preset_response = self.config["outputs_config"]["preset_response"]
 
         return ModerationOutputsResult(
             flagged=flagged, action=ModerationAction.DIRECT_OUTPUT, preset_response=preset_response
         )
 
-    def _is_violated(self, inputs: dict, keywords_list: list) -> bool:
-        return any(self._check_keywords_in_value(keywords_list, value) for value in inputs.values())
+    def create_output_scanner(self) -> Optional[KeywordScanner]:
+        """
+        Create a scanner of streamed output, which moderates every chunk once instead of the whole output each time.
+
+        :return: the scanner, or None if outputs are not moderated
+        """
+        if self.config is None:
+            raise ValueError("The config is not set.")
+
+        if not self.config["outputs_config"]["enabled"]:
+            return None
+        return get_keyword_matcher(self.config["keywords"]).scanner()
 
-    def _check_keywords_in_value(self, keywords_list: Sequence[str], value: Any) -> bool:
-        return any(keyword.lower() in str(value).lower() for keyword in keywords_list)
+    def _is_violated(self, inputs: dict, matcher: KeywordMatcher) -> bool:
+        return any(matcher.search(str(value)) for value in inputs.values())
@@ -1,16 +1,17 @@
 import logging
 import threading
-import time
 from typing import Any, Optional
 
 from flask import Flask, current_app
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, PrivateAttr
 
 from configs import dify_config
 from core.app.apps.base_app_queue_manager import AppQueueManager, PublishFrom
 from core.app.entities.queue_entities import QueueMessageReplaceEvent
 from core.moderation.base import ModerationAction, ModerationOutputsResult
 from core.moderation.factory import ModerationFactory
+from core.moderation.keywords.keyword_matcher import KeywordScanner
+from core.moderation.keywords.keywords import KeywordsModeration
 
 logger = logging.getLogger(__name__)
 
@@ -34,6 +35,21 @@ class OutputModeration(BaseModel):
     final_output: Optional[str] = None
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
+    # wakes up the worker on new output
+    _condition: threading.Condition = PrivateAttr(default_factory=threading.Condition)
+    # serializes the checks of the worker and of the final completion
+    _moderation_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    # the checked output, and the moderated output standing for it
+    _checked_output: str = PrivateAttr(default="")
+    _moderated_output: str = PrivateAttr(default="")
+    _overridden: bool = PrivateAttr(default=False)
+
+    # keywords are scanned incrementally, the worker thread and the final completion share the scan
+    _keywords_moderation: Optional[KeywordsModeration] = PrivateAttr(default=None)
+    _keyword_scanner: Optional[KeywordScanner] = PrivateAttr(default=None)
+    _scanned_output: str = PrivateAttr(default="")
+    _keyword_scan_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
     def should_direct_output(self) -> bool:
         return self.final_output is not None
 
@@ -41,24 +57,33 @@ class OutputModeration(BaseModel):
         return self.final_output or ""
 
     def append_new_token(self, token: str) -> None:
-        self.buffer += token
+        with self._condition:
+            self.buffer += token
+            if len(self.buffer) - len(self._checked_output) >= dify_config.MODERATION_BUFFER_SIZE:
+                self._condition.notify()
 
         if not self.thread:
             self.thread = self.start_thread()
 
     def moderation_completion(self, completion: str, public_event: bool = False) -> str:
-        self.buffer = completion
-        self.is_final_chunk = True
+        with self._condition:
+            self.buffer = completion
+            self.is_final_chunk = True
+            self._condition.notify()
 
-        result = self.moderation(tenant_id=self.tenant_id, app_id=self.app_id, moderation_buffer=completion)
+        with self._moderation_lock:
+            if self.final_output is not None:
+                # the streamed output was already replaced by the preset response
+                return self.final_output
 
-        if not result or not result.flagged:
-            return completion
+            result = self._moderate_output(completion)
+            if not result or not result.flagged:
+                return self._moderated_output
 
-        if result.action == ModerationAction.DIRECT_OUTPUT:
-            final_output = result.preset_response
-        else:
-            final_output = result.text
+            if result.action == ModerationAction.DIRECT_OUTPUT:
+                final_output = result.preset_response
+            else:
+                final_output = self._moderated_output
 
         if public_event:
             self.queue_manager.publish(QueueMessageReplaceEvent(text=final_output), PublishFrom.TASK_PIPELINE)
@@ -81,34 +106,42 @@ class OutputModeration(BaseModel):
 
     def stop_thread(self):
         if self.thread and self.thread.is_alive():
-            self.thread_running = False
+            with self._condition:
+                self.thread_running = False
+                self._condition.notify()
 
     def worker(self, flask_app: Flask, buffer_size: int):
+        max_latency = dify_config.MODERATION_MAX_LATENCY_MS / 1000 or None
         with flask_app.app_context():
-            current_length = 0
-            while self.thread_running:
-                moderation_buffer = self.buffer
-                buffer_length = len(moderation_buffer)
-                if not self.is_final_chunk:
-                    chunk_length = buffer_length - current_length
-                    if 0 <= chunk_length < buffer_size:
-                        time.sleep(1)
+            while True:
+                with self._condition:
+                    # wake up on a full chunk, or once the latency budget expired with a partial one
+                    self._condition.wait_for(
+                        lambda: (
+                            not self.thread_running
+                            or self.is_final_chunk
+                            or len(self.buffer) - len(self._checked_output) >= buffer_size
+                        ),
+                        timeout=max_latency,
+                    )
+                    # the final completion is moderated by `moderation_completion`
+                    if not self.thread_running or self.is_final_chunk:
+                        break
+                    moderation_buffer = self.buffer
+
+                with self._moderation_lock:
+                    if len(moderation_buffer) <= len(self._checked_output):
                         continue
 
-                current_length = buffer_length
-
-                result = self.moderation(
-                    tenant_id=self.tenant_id, app_id=self.app_id, moderation_buffer=moderation_buffer
-                )
-
-                if not result or not result.flagged:
-                    continue
+                    result = self._moderate_output(moderation_buffer)
+                    if not result or not result.flagged:
+                        continue
 
-                if result.action == ModerationAction.DIRECT_OUTPUT:
-                    final_output = result.preset_response
-                    self.final_output = final_output
-                else:
-                    final_output = result.text + self.buffer[len(moderation_buffer) :]
+                    if result.action == ModerationAction.DIRECT_OUTPUT:
+                        final_output = result.preset_response
+                        self.final_output = final_output
+                    else:
+                        final_output = self._moderated_output + self.buffer[len(moderation_buffer) :]
 
                 # trigger replace event
                 if self.thread_running:
@@ -117,8 +150,50 @@ class OutputModeration(BaseModel):
                 if result.action == ModerationAction.DIRECT_OUTPUT:
                     break
 
+    def _moderate_output(self, moderation_buffer: str) -> Optional[ModerationOutputsResult]:
+        """
+        Moderate the output up to the end of the buffer and update the moderated output standing for it.
+
+        With MODERATION_INCREMENTAL_ENABLED only the output added since the previous check is sent, with
+        MODERATION_WINDOW_OVERLAP characters of checked output before it as context, so long answers cost linear
+        instead of quadratic moderation work. Keywords are always scanned incrementally and get the whole buffer.
+        The caller holds the moderation lock.
+        """
+        if not moderation_buffer.startswith(self._checked_output):
+            # the output is not the continuation of the checked one, e.g. a final completion differing from it
+            self._checked_output = ""
+            self._moderated_output = ""
+            self._overridden = False
+        checked_length = len(self._checked_output)
+
+        if not dify_config.MODERATION_INCREMENTAL_ENABLED or self.rule.type == KeywordsModeration.name:
+            start = 0
+        elif self._overridden:
+            # the overlap was replaced, the window can not be spliced into it
+            start = checked_length
+        else:
+            start = max(0, checked_length - dify_config.MODERATION_WINDOW_OVERLAP)
+
+        result = self.moderation(
+            tenant_id=self.tenant_id, app_id=self.app_id, moderation_buffer=moderation_buffer[start:]
+        )
+
+        if result and result.flagged and result.action == ModerationAction.OVERRIDDEN:
+            # replace the moderated output of the window, the overlap of the window is only sent while the moderated
+            # output is the output itself
+            kept_length = len(self._moderated_output) - (checked_length - start) if start else 0
+            self._moderated_output = self._moderated_output[:kept_length] + result.text
+            self._overridden = True
+        else:
+            self._moderated_output += moderation_buffer[checked_length:]
+        self._checked_output = moderation_buffer
+        return result
+
     def moderation(self, tenant_id: str, app_id: str, moderation_buffer: str) -> Optional[ModerationOutputsResult]:
         try:
+            if self.rule.type == KeywordsModeration.name:
+                return self._moderation_by_keywords(tenant_id, app_id, moderation_buffer)
+
             moderation_factory = ModerationFactory(
                 name=self.rule.type, app_id=app_id, tenant_id=tenant_id, config=self.rule.config
             )
@@ -129,3 +204,28 @@ class OutputModeration(BaseModel):
             logger.exception(f"Moderation Output error, app_id: {app_id}")
 
         return None
+
+    def _moderation_by_keywords(self, tenant_id: str, app_id: str, moderation_buffer: str) -> ModerationOutputsResult:
+        """
+        Moderate the output with keywords, only the text added since the previous call is scanned
+        """
+        with self._keyword_scan_lock:
+            if self._keywords_moderation is None:
+                self._keywords_moderation = KeywordsModeration(app_id, tenant_id, self.rule.config)
+                self._keyword_scanner = self._keywords_moderation.create_output_scanner()
+            scanner = self._keyword_scanner
+            if scanner is None:
+                return self._keywords_moderation.moderation_for_outputs(moderation_buffer)
+
+            if not moderation_buffer.startswith(self._scanned_output):
+                # the output is not the continuation of the scanned one, e.g. a final completion differing from it
+                scanner = self._keyword_scanner = scanner.restart()
+                self._scanned_output = ""
+            flagged = scanner.feed(moderation_buffer[len(self._scanned_output) :])
+            self._scanned_output = moderation_buffer
+
+        return ModerationOutputsResult(
+            flagged=flagged,
+            action=ModerationAction.DIRECT_OUTPUT,
+            preset_response=self.rule.config["outputs_config"]["preset_response"],
+        )
@@ -21,6 +21,8 @@ from core.entities.provider_entities import (
 from core.helper import encrypter
 from core.helper.model_provider_cache import ProviderCredentialsCache, ProviderCredentialsCacheType
 from core.helper.position_helper import is_filtered
+from core.helper.provider_configurations_cache import get_provider_configurations
+from core.helper.provider_usage import get_pending_quota_used
 from core.model_runtime.entities.model_entities import ModelType
 from core.model_runtime.entities.provider_entities import (
     ConfigurateMethod,
@@ -88,6 +90,15 @@ class ProviderManager:
         - Get provider instance
         - Switch selection priority
 
+        :param tenant_id:
+        :return:
+        """
+        return get_provider_configurations(tenant_id, lambda: self._build_configurations(tenant_id))
+
+    def _build_configurations(self, tenant_id: str) -> ProviderConfigurations:
+        """
+        Build model provider configurations from the database.
+
         :param tenant_id:
         :return:
         """
@@ -691,6 +702,12 @@ class ProviderManager:
             quota_type_to_provider_records_dict[ProviderQuotaType.value_of(provider_record.quota_type)] = (
                 provider_record
             )
+        # usage accumulated in redis and not written to the providers yet
+        pending_quota_used = get_pending_quota_used(
+            tenant_id=tenant_id,
+            provider_name=provider_entity.provider,
+            quota_types=[quota_type.value for quota_type in quota_type_to_provider_records_dict],
+        )
         quota_configurations = []
         for provider_quota in provider_hosting_configuration.quotas:
             if provider_quota.quota_type not in quota_type_to_provider_records_dict:
@@ -707,14 +724,14 @@ class ProviderManager:
                     continue
             else:
                 provider_record = quota_type_to_provider_records_dict[provider_quota.quota_type]
+                quota_used = provider_record.quota_used + pending_quota_used.get(provider_quota.quota_type.value, 0)
 
                 quota_configuration = QuotaConfiguration(
                     quota_type=provider_quota.quota_type,
                     quota_unit=provider_hosting_configuration.quota_unit or QuotaUnit.TOKENS,
-                    quota_used=provider_record.quota_used,
+                    quota_used=quota_used,
                     quota_limit=provider_record.quota_limit,
-                    is_valid=provider_record.quota_limit > provider_record.quota_used
-                    or provider_record.quota_limit == -1,
+                    is_valid=provider_record.quota_limit > quota_used or provider_record.quota_limit == -1,
                     restrict_models=provider_quota.restrict_models,
                 )
 
@@ -0,0 +1,23 @@
+import math
+
+# BM25 parameters. Segments are indexed as sets of keywords, so the term frequency is always 1
+# and the length of a segment is its number of keywords.
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def bm25_idf(segment_count: int, doc_count_containing_keyword: int) -> float:
+    return math.log(1 + (segment_count - doc_count_containing_keyword + 0.5) / (doc_count_containing_keyword + 0.5))
+
+
+def bm25_term_score(idf: float, segment_length: float, average_segment_length: float) -> float:
+    length_ratio = segment_length / average_segment_length if average_segment_length else 1.0
+    return idf * (BM25_K1 + 1) / (1 + BM25_K1 * (1 - BM25_B + BM25_B * length_ratio))
+
+
+def bm25_max_score(idfs: list[float]) -> float:
+    """
+    Upper bound of the score of a query, reached by a segment which contains every query keyword
+    and nothing else, used to normalize scores to [0, 1].
+    """
+    return sum(bm25_term_score(idf, 0, 1) for idf in idfs)
@@ -1,10 +1,12 @@
 import json
-from collections import defaultdict
+from collections import Counter, defaultdict
 from typing import Any, Optional
 
 from pydantic import BaseModel
+from sqlalchemy import update
 
 from configs import dify_config
+from core.rag.datasource.keyword.jieba.bm25 import bm25_idf, bm25_max_score, bm25_term_score
 from core.rag.datasource.keyword.jieba.jieba_keyword_table_handler import JiebaKeywordTableHandler
 from core.rag.datasource.keyword.keyword_base import BaseKeyword
 from core.rag.models.document import Document
@@ -13,6 +15,8 @@ from extensions.ext_redis import redis_client
 from extensions.ext_storage import storage
 from models.dataset import Dataset, DatasetKeywordTable, DocumentSegment
 
+SEGMENT_KEYWORDS_UPDATE_BATCH_SIZE = 1000
+
 
 class KeywordTableConfig(BaseModel):
     max_keywords_per_chunk: int = 10
@@ -28,16 +32,18 @@ class Jieba(BaseKeyword):
         with redis_client.lock(lock_name, timeout=600):
             keyword_table_handler = JiebaKeywordTableHandler()
             keyword_table = self._get_dataset_keyword_table()
+            node_keywords: dict[str, list[str]] = {}
             for text in texts:
                 keywords = keyword_table_handler.extract_keywords(
                     text.page_content, self._config.max_keywords_per_chunk
                 )
                 if text.metadata is not None:
-                    self._update_segment_keywords(self.dataset.id, text.metadata["doc_id"], list(keywords))
+                    node_keywords[text.metadata["doc_id"]] = list(keywords)
                     keyword_table = self._add_text_to_keyword_table(
                         keyword_table or {}, text.metadata["doc_id"], list(keywords)
                     )
 
+            self._update_segments_keywords(self.dataset.id, node_keywords)
             self._save_dataset_keyword_table(keyword_table)
 
             return self
@@ -49,6 +55,7 @@ class Jieba(BaseKeyword):
 
             keyword_table = self._get_dataset_keyword_table()
             keywords_list = kwargs.get("keywords_list")
+            node_keywords: dict[str, list[str]] = {}
             for i in range(len(texts)):
                 text = texts[i]
                 if keywords_list:
@@ -62,11 +69,12 @@ class Jieba(BaseKeyword):
                         text.page_content, self._config.max_keywords_per_chunk
                     )
                 if text.metadata is not None:
-                    self._update_segment_keywords(self.dataset.id, text.metadata["doc_id"], list(keywords))
+                    node_keywords[text.metadata["doc_id"]] = list(keywords)
                     keyword_table = self._add_text_to_keyword_table(
                         keyword_table or {}, text.metadata["doc_id"], list(keywords)
                     )
 
+            self._update_segments_keywords(self.dataset.id, node_keywords)
             self._save_dataset_keyword_table(keyword_table)
 
     def text_exists(self, id: str) -> bool:
@@ -85,32 +93,46 @@ class Jieba(BaseKeyword):
             self._save_dataset_keyword_table(keyword_table)
 
     def search(self, query: str, **kwargs: Any) -> list[Document]:
-        keyword_table = self._get_dataset_keyword_table()
+        keyword_table_data = self._get_dataset_keyword_table_data()
+        keyword_table = dict(keyword_table_data.get("table") or {})
+        # keyword tables saved before segment lengths were stored count them per search,
+        # until they are added by the migrate-keyword-inverted-index command or the next save
+        segment_lengths = keyword_table_data.get("segment_lengths")
 
         k = kwargs.get("top_k", 4)
 
-        sorted_chunk_indices = self._retrieve_ids_by_query(keyword_table or {}, query, k)
+        chunk_scores = self._retrieve_ids_by_query(keyword_table, query, k, segment_lengths)
 
-        documents = []
-        for chunk_index in sorted_chunk_indices:
-            segment = (
-                db.session.query(DocumentSegment)
-                .filter(DocumentSegment.dataset_id == self.dataset.id, DocumentSegment.index_node_id == chunk_index)
-                .first()
-            )
+        return self._get_documents_by_node_ids(list(chunk_scores.keys()), chunk_scores)
+
+    def _get_documents_by_node_ids(
+        self, node_ids: list[str], scores: Optional[dict[str, float]] = None
+    ) -> list[Document]:
+        if not node_ids:
+            return []
+
+        segments = (
+            db.session.query(DocumentSegment)
+            .filter(DocumentSegment.dataset_id == self.dataset.id, DocumentSegment.index_node_id.in_(node_ids))
+            .all()
+        )
+        segment_map = {segment.index_node_id: segment for segment in segments}
 
+        # keep the rank order of the node ids
+        documents = []
+        for chunk_index in node_ids:
+            segment = segment_map.get(chunk_index)
             if segment:
-                documents.append(
-                    Document(
-                        page_content=segment.content,
-                        metadata={
-                            "doc_id": chunk_index,
-                            "doc_hash": segment.index_node_hash,
-                            "document_id": segment.document_id,
-                            "dataset_id": segment.dataset_id,
-                        },
-                    )
-                )
+                metadata = {
+                    "doc_id": chunk_index,
+                    "doc_hash": segment.index_node_hash,
+                    "document_id": segment.document_id,
+                    "dataset_id": segment.dataset_id,
+                }
+                if scores is not None:
+                    # not "score", which rerankers read as the similarity of a vector search
+                    metadata["keyword_score"] = scores[chunk_index]
+                documents.append(Document(page_content=segment.content, metadata=metadata))
 
         return documents
 
@@ -126,9 +148,15 @@ class Jieba(BaseKeyword):
                     storage.delete(file_key)
 
     def _save_dataset_keyword_table(self, keyword_table):
+        # segment lengths are saved with the table, so searches do not count them over all postings
         keyword_table_dict = {
             "__type__": "keyword_table",
-            "__data__": {"index_id": self.dataset.id, "summary": None, "table": keyword_table},
+            "__data__": {
+                "index_id": self.dataset.id,
+                "summary": None,
+                "table": keyword_table,
+                "segment_lengths": self._count_segment_lengths(keyword_table or {}),
+            },
         }
         dataset_keyword_table = self.dataset.dataset_keyword_table
         keyword_data_source_type = dataset_keyword_table.data_source_type
@@ -142,11 +170,17 @@ class Jieba(BaseKeyword):
             storage.save(file_key, json.dumps(keyword_table_dict, cls=SetEncoder).encode("utf-8"))
 
     def _get_dataset_keyword_table(self) -> Optional[dict]:
+        return dict(self._get_dataset_keyword_table_data().get("table") or {})
+
+    def _get_dataset_keyword_table_data(self) -> dict:
+        """
+        Get the saved keyword table with its segment lengths, creating an empty one if the dataset has none
+        """
         dataset_keyword_table = self.dataset.dataset_keyword_table
         if dataset_keyword_table:
             keyword_table_dict = dataset_keyword_table.keyword_table_dict
             if keyword_table_dict:
-                return dict(keyword_table_dict["__data__"]["table"])
+                return dict(keyword_table_dict["__data__"])
         else:
             keyword_data_source_type = dify_config.KEYWORD_DATA_SOURCE_TYPE
             dataset_keyword_table = DatasetKeywordTable(
@@ -167,6 +201,18 @@ class Jieba(BaseKeyword):
 
         return {}
 
+    def _add_segment_lengths(self) -> None:
+        lock_name = "keyword_indexing_lock_{}".format(self.dataset.id)
+        with redis_client.lock(lock_name, timeout=600):
+            keyword_table = self._get_dataset_keyword_table_data().get("table")
+            if keyword_table is not None:
+                self._save_dataset_keyword_table(keyword_table)
+
+    @staticmethod
+    def _count_segment_lengths(keyword_table: dict) -> dict[str, int]:
+        # a chunk's length is its number of keywords
+        return dict(Counter(node_id for node_ids in keyword_table.values() for node_id in node_ids))
+
     def _add_text_to_keyword_table(self, keyword_table: dict, id: str, keywords: list[str]) -> dict:
         for keyword in keywords:
             if keyword not in keyword_table:
@@ -191,24 +237,38 @@ class Jieba(BaseKeyword):
 
         return keyword_table
 
-    def _retrieve_ids_by_query(self, keyword_table: dict, query: str, k: int = 4):
+    def _retrieve_ids_by_query(
+        self, keyword_table: dict, query: str, k: int = 4, segment_lengths: Optional[dict[str, int]] = None
+    ) -> dict[str, float]:
+        """
+        Rank text chunks by BM25, scores are normalized to [0, 1]
+        :param segment_lengths: number of keywords of every chunk, counted from the keyword table if not given
+        :return: scores of the top k chunk ids in rank order
+        """
         keyword_table_handler = JiebaKeywordTableHandler()
         keywords = keyword_table_handler.extract_keywords(query)
-
-        # go through text chunks in order of most matching keywords
-        chunk_indices_count: dict[str, int] = defaultdict(int)
-        keywords_list = [keyword for keyword in keywords if keyword in set(keyword_table.keys())]
+        keywords_list = [keyword for keyword in keywords if keyword in keyword_table]
+        if not keywords_list:
+            return {}
+
+        if segment_lengths is None:
+            segment_lengths = self._count_segment_lengths(keyword_table)
+        segment_count = len(segment_lengths)
+        average_segment_length = sum(segment_lengths.values()) / segment_count
+
+        # keywords missing from the table match no chunk, they must not lower the normalized scores
+        idfs = {keyword: bm25_idf(segment_count, len(keyword_table[keyword])) for keyword in keywords_list}
+        chunk_scores: dict[str, float] = defaultdict(float)
         for keyword in keywords_list:
             for node_id in keyword_table[keyword]:
-                chunk_indices_count[node_id] += 1
+                chunk_scores[node_id] += bm25_term_score(
+                    idfs[keyword], segment_lengths.get(node_id, 0), average_segment_length
+                )
 
-        sorted_chunk_indices = sorted(
-            chunk_indices_count.keys(),
-            key=lambda x: chunk_indices_count[x],
-            reverse=True,
-        )
+        max_score = bm25_max_score(list(idfs.values()))
+        sorted_chunk_indices = sorted(chunk_scores.keys(), key=lambda x: chunk_scores[x], reverse=True)
 
-        return sorted_chunk_indices[:k]
+        return {node_id: chunk_scores[node_id] / max_score for node_id in sorted_chunk_indices[:k]}
 
     def _update_segment_keywords(self, dataset_id: str, node_id: str, keywords: list[str]):
         document_segment = (
@@ -221,6 +281,27 @@ class Jieba(BaseKeyword):
             db.session.add(document_segment)
             db.session.commit()
 
+    def _update_segments_keywords(self, dataset_id: str, node_keywords: dict[str, list[str]]):
+        """
+        Update the keywords of many segments with bulk updates in a single transaction
+        """
+        node_ids = list(node_keywords.keys())
+        params: list[dict[str, Any]] = []
+        for i in range(0, len(node_ids), SEGMENT_KEYWORDS_UPDATE_BATCH_SIZE):
+            rows = (
+                db.session.query(DocumentSegment.id, DocumentSegment.index_node_id)
+                .filter(
+                    DocumentSegment.dataset_id == dataset_id,
+                    DocumentSegment.index_node_id.in_(node_ids[i : i + SEGMENT_KEYWORDS_UPDATE_BATCH_SIZE]),
+                )
+                .all()
+            )
+            params.extend({"id": row.id, "keywords": node_keywords[row.index_node_id]} for row in rows)
+
+        for i in range(0, len(params), SEGMENT_KEYWORDS_UPDATE_BATCH_SIZE):
+            db.session.execute(update(DocumentSegment), params[i : i + SEGMENT_KEYWORDS_UPDATE_BATCH_SIZE])
+        db.session.commit()
+
     def create_segment_keywords(self, node_id: str, keywords: list[str]):
         keyword_table = self._get_dataset_keyword_table()
         self._update_segment_keywords(self.dataset.id, node_id, keywords)
@@ -0,0 +1,211 @@
+from typing import Any
+
+from sqlalchemy import Float, case, cast, exists, func
+from sqlalchemy.dialects.postgresql import insert
+
+from core.rag.datasource.keyword.jieba.bm25 import BM25_B, BM25_K1, bm25_idf, bm25_max_score
+from core.rag.datasource.keyword.jieba.jieba import Jieba
+from core.rag.datasource.keyword.jieba.jieba_keyword_table_handler import JiebaKeywordTableHandler
+from core.rag.datasource.keyword.keyword_base import BaseKeyword
+from core.rag.models.document import Document
+from extensions.ext_database import db
+from models.dataset import DatasetKeywordPosting, DatasetKeywordStats
+
+# number of posting rows or segments handled per statement
+POSTINGS_INSERT_BATCH_SIZE = 1000
+MAX_KEYWORD_LENGTH = 255
+
+
+class JiebaInvertedIndex(Jieba):
+    """
+    Jieba keywords stored in the `dataset_keyword_postings` inverted index instead of a single keyword table.
+
+    Indexing only inserts or deletes the postings of the changed segments and search only reads the postings
+    of the query keywords, so neither needs the dataset-wide keyword indexing lock nor scales with the size
+    of the dataset. Search ranks segments by BM25, the corpus statistics are kept in `dataset_keyword_stats`
+    and the length of each segment on its postings.
+    """
+
+    def create(self, texts: list[Document], **kwargs) -> BaseKeyword:
+        self.add_texts(texts)
+        return self
+
+    def add_texts(self, texts: list[Document], **kwargs):
+        keyword_table_handler = JiebaKeywordTableHandler()
+        keywords_list = kwargs.get("keywords_list")
+        node_keywords: dict[str, list[str]] = {}
+        for i, text in enumerate(texts):
+            keywords = keywords_list[i] if keywords_list else None
+            if not keywords:
+                keywords = keyword_table_handler.extract_keywords(
+                    text.page_content, self._config.max_keywords_per_chunk
+                )
+            if text.metadata is not None:
+                node_keywords[text.metadata["doc_id"]] = list(keywords)
+
+        self._update_segments_keywords(self.dataset.id, node_keywords)
+        self._add_postings(node_keywords)
+
+    def text_exists(self, id: str) -> bool:
+        return bool(
+            db.session.query(
+                exists().where(
+                    DatasetKeywordPosting.dataset_id == self.dataset.id, DatasetKeywordPosting.index_node_id == id
+                )
+            ).scalar()
+        )
+
+    def delete_by_ids(self, ids: list[str]) -> None:
+        if not ids:
+            return
+        segment_lengths = (
+            db.session.query(DatasetKeywordPosting.index_node_id, func.max(DatasetKeywordPosting.length))
+            .filter(DatasetKeywordPosting.dataset_id == self.dataset.id, DatasetKeywordPosting.index_node_id.in_(ids))
+            .group_by(DatasetKeywordPosting.index_node_id)
+            .all()
+        )
+        db.session.query(DatasetKeywordPosting).filter(
+            DatasetKeywordPosting.dataset_id == self.dataset.id, DatasetKeywordPosting.index_node_id.in_(ids)
+        ).delete(synchronize_session=False)
+        if segment_lengths:
+            self._update_stats(-len(segment_lengths), -sum(length for _, length in segment_lengths))
+        db.session.commit()
+
+    def delete(self) -> None:
+        db.session.query(DatasetKeywordPosting).filter(DatasetKeywordPosting.dataset_id == self.dataset.id).delete(
+            synchronize_session=False
+        )
+        db.session.query(DatasetKeywordStats).filter(DatasetKeywordStats.dataset_id == self.dataset.id).delete(
+            synchronize_session=False
+        )
+        db.session.commit()
+        # drop the keyword table left over from before switching the keyword store
+        super().delete()
+
+    def search(self, query: str, **kwargs: Any) -> list[Document]:
+        k = kwargs.get("top_k", 4)
+
+        keyword_table_handler = JiebaKeywordTableHandler()
+        keywords = [keyword for keyword in keyword_table_handler.extract_keywords(query) if self._is_indexable(keyword)]
+        stats = db.session.get(DatasetKeywordStats, self.dataset.id)
+        if not keywords or not stats or not stats.segment_count:
+            return []
+
+        doc_counts = dict(
+            db.session.query(DatasetKeywordPosting.keyword, func.count())
+            .filter(DatasetKeywordPosting.dataset_id == self.dataset.id, DatasetKeywordPosting.keyword.in_(keywords))
+            .group_by(DatasetKeywordPosting.keyword)
+            .all()
+        )
+        if not doc_counts:
+            return []
+        # keywords missing from the index match no chunk, they must not lower the normalized scores
+        idfs = {keyword: bm25_idf(stats.segment_count, doc_count) for keyword, doc_count in doc_counts.items()}
+
+        # rank text chunks by BM25 of the matched keywords
+        average_segment_length = stats.total_length / stats.segment_count
+        length_ratio = cast(DatasetKeywordPosting.length, Float) / average_segment_length
+        score = func.sum(
+            case(idfs, value=DatasetKeywordPosting.keyword)
+            * (BM25_K1 + 1)
+            / (1 + BM25_K1 * (1 - BM25_B + BM25_B * length_ratio))
+        ).label("score")
+        rows = (
+            db.session.query(DatasetKeywordPosting.index_node_id, score)
+            .filter(
+                DatasetKeywordPosting.dataset_id == self.dataset.id,
+                DatasetKeywordPosting.keyword.in_(list(doc_counts.keys())),
+            )
+            .group_by(DatasetKeywordPosting.index_node_id)
+            .order_by(score.desc())
+            .limit(k)
+            .all()
+        )
+
+        max_score = bm25_max_score(list(idfs.values()))
+        chunk_scores = {row.index_node_id: row.score / max_score for row in rows}
+        return self._get_documents_by_node_ids(list(chunk_scores.keys()), chunk_scores)
+
+    def create_segment_keywords(self, node_id: str, keywords: list[str]):
+        self._update_segment_keywords(self.dataset.id, node_id, keywords)
+        self._add_postings({node_id: keywords})
+
+    def multi_create_segment_keywords(self, pre_segment_data_list: list):
+        keyword_table_handler = JiebaKeywordTableHandler()
+        node_keywords: dict[str, list[str]] = {}
+        for pre_segment_data in pre_segment_data_list:
+            segment = pre_segment_data["segment"]
+            if pre_segment_data["keywords"]:
+                segment.keywords = pre_segment_data["keywords"]
+            else:
+                keywords = keyword_table_handler.extract_keywords(segment.content, self._config.max_keywords_per_chunk)
+                segment.keywords = list(keywords)
+            node_keywords[segment.index_node_id] = segment.keywords
+        self._add_postings(node_keywords)
+
+    def update_segment_keywords_index(self, node_id: str, keywords: list[str]):
+        self._add_postings({node_id: keywords})
+
+    def _add_postings(self, node_keywords: dict[str, list[str]]) -> None:
+        """
+        Add keywords to the postings of segments and update the segment lengths and corpus statistics
+        """
+        node_ids = list(node_keywords.keys())
+        existing_keywords: dict[str, set[str]] = {}
+        for i in range(0, len(node_ids), POSTINGS_INSERT_BATCH_SIZE):
+            rows = (
+                db.session.query(DatasetKeywordPosting.index_node_id, DatasetKeywordPosting.keyword)
+                .filter(
+                    DatasetKeywordPosting.dataset_id == self.dataset.id,
+                    DatasetKeywordPosting.index_node_id.in_(node_ids[i : i + POSTINGS_INSERT_BATCH_SIZE]),
+                )
+                .all()
+            )
+            for row in rows:
+                existing_keywords.setdefault(row.index_node_id, set()).add(row.keyword)
+
+        merged_keywords = {
+            node_id: existing_keywords.get(node_id, set())
+            | {keyword for keyword in keywords if self._is_indexable(keyword)}
+            for node_id, keywords in node_keywords.items()
+        }
+        postings = [
+            {"dataset_id": self.dataset.id, "keyword": keyword, "index_node_id": node_id, "length": len(keywords)}
+            for node_id, keywords in merged_keywords.items()
+            for keyword in keywords
+        ]
+        for i in range(0, len(postings), POSTINGS_INSERT_BATCH_SIZE):
+            stmt = insert(DatasetKeywordPosting).values(postings[i : i + POSTINGS_INSERT_BATCH_SIZE])
+            db.session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=["dataset_id", "keyword", "index_node_id"], set_={"length": stmt.excluded.length}
+                )
+            )
+
+        segment_count_delta = sum(
+            1 for node_id, keywords in merged_keywords.items() if keywords and node_id not in existing_keywords
+        )
+        total_length_delta = sum(
+            len(keywords) - len(existing_keywords.get(node_id, ())) for node_id, keywords in merged_keywords.items()
+        )
+        if segment_count_delta or total_length_delta:
+            self._update_stats(segment_count_delta, total_length_delta)
+        db.session.commit()
+
+    def _update_stats(self, segment_count_delta: int, total_length_delta: int) -> None:
+        stmt = insert(DatasetKeywordStats).values(
+            dataset_id=self.dataset.id, segment_count=segment_count_delta, total_length=total_length_delta
+        )
+        db.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["dataset_id"],
+                set_={
+                    "segment_count": DatasetKeywordStats.segment_count + stmt.excluded.segment_count,
+                    "total_length": DatasetKeywordStats.total_length + stmt.excluded.total_length,
+                },
+            )
+        )
+
+    @staticmethod
+    def _is_indexable(keyword: str) -> bool:
+        return bool(keyword) and len(keyword) <= MAX_KEYWORD_LENGTH
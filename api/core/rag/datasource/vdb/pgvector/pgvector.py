@@ -1,8 +1,11 @@
+import hashlib
 import json
 import uuid
+from collections.abc import Sequence
 from contextlib import contextmanager
-from typing import Any
+from typing import Any, Optional
 
+import numpy as np
 import psycopg2.extras  # type: ignore
 import psycopg2.pool  # type: ignore
 from pydantic import BaseModel, model_validator
@@ -16,6 +19,14 @@ from core.rag.models.document import Document
 from extensions.ext_redis import redis_client
 from models.dataset import Dataset
 
+# PG hnsw index only support 2000 dimensions or less, 4000 for half precision vectors
+# ref: https://github.com/pgvector/pgvector?tab=readme-ov-file#indexing
+VECTOR_TYPE_MAX_INDEX_DIMENSIONS = {"vector": 2000, "halfvec": 4000}
+# pgvector rejects larger candidate lists
+MAX_HNSW_EF_SEARCH = 1000
+# pgvector 0.8.0 can continue scanning the HNSW index when filters remove candidates
+ITERATIVE_SCAN_MIN_VERSION = (0, 8)
+
 
 class PGVectorConfig(BaseModel):
     host: str
@@ -25,6 +36,10 @@ class PGVectorConfig(BaseModel):
     database: str
     min_connection: int
     max_connection: int
+    vector_type: str = "vector"
+    hnsw_m: int = 16
+    hnsw_ef_construction: int = 64
+    hnsw_ef_search: int = 40
 
     @model_validator(mode="before")
     @classmethod
@@ -45,6 +60,8 @@ class PGVectorConfig(BaseModel):
             raise ValueError("config PGVECTOR_MAX_CONNECTION is required")
         if values["min_connection"] > values["max_connection"]:
             raise ValueError("config PGVECTOR_MIN_CONNECTION should less than PGVECTOR_MAX_CONNECTION")
+        if values.get("vector_type", "vector") not in VECTOR_TYPE_MAX_INDEX_DIMENSIONS:
+            raise ValueError("config PGVECTOR_VECTOR_TYPE should be vector or halfvec")
         return values
 
 
@@ -53,21 +70,47 @@ CREATE TABLE IF NOT EXISTS {table_name} (
     id UUID PRIMARY KEY,
     text TEXT NOT NULL,
     meta JSONB NOT NULL,
-    embedding vector({dimension}) NOT NULL
+    embedding {vector_type}({dimension}) NOT NULL
 ) using heap;
 """
 
+# index names are unique per schema, so they are suffixed with the hash of the table name
 SQL_CREATE_INDEX = """
-CREATE INDEX IF NOT EXISTS embedding_cosine_v1_idx ON {table_name} 
-USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+CREATE INDEX IF NOT EXISTS embedding_cosine_v1_idx_{index_hash} ON {table_name}
+USING hnsw (embedding {vector_type}_cosine_ops) WITH (m = {m}, ef_construction = {ef_construction});
+"""
+
+SQL_CREATE_DOCUMENT_ID_INDEX = """
+CREATE INDEX IF NOT EXISTS embedding_document_id_idx_{index_hash} ON {table_name} ((meta->>'document_id'));
+"""
+
+SQL_GET_EMBEDDING_TYPE = """
+SELECT t.typname FROM pg_attribute a JOIN pg_type t ON t.oid = a.atttypid
+WHERE a.attrelid = to_regclass(%s) AND a.attname = 'embedding';
 """
 
+# whether the installed pgvector supports iterative index scans, checked on the first filtered search
+_iterative_scan_supported: Optional[bool] = None
+
+
+def _to_vector_literal(vector: Sequence[float]) -> str:
+    """
+    Format a vector as a pgvector literal. pgvector stores single precision floats, so the shortest
+    representation of the float32 values is exact and about half the size of the double precision one.
+    """
+    return "[" + ",".join(map(str, np.asarray(vector, dtype=np.float32))) + "]"
+
 
 class PGVector(BaseVector):
     def __init__(self, collection_name: str, config: PGVectorConfig):
         super().__init__(collection_name)
         self.pool = self._create_connection_pool(config)
         self.table_name = f"embedding_{collection_name}"
+        self.index_hash = hashlib.md5(self.table_name.encode()).hexdigest()[:8]
+        self.vector_type = config.vector_type
+        self.hnsw_m = config.hnsw_m
+        self.hnsw_ef_construction = config.hnsw_ef_construction
+        self.hnsw_ef_search = config.hnsw_ef_search
 
     def get_type(self) -> str:
         return VectorType.PGVECTOR
@@ -111,12 +154,14 @@ class PGVector(BaseVector):
                         doc_id,
                         doc.page_content,
                         json.dumps(doc.metadata),
-                        embeddings[i],
+                        _to_vector_literal(embeddings[i]),
                     )
                 )
         with self._get_cursor() as cur:
             psycopg2.extras.execute_values(
-                cur, f"INSERT INTO {self.table_name} (id, text, meta, embedding) VALUES %s", values
+                cur,
+                f"INSERT INTO {self.table_name} (id, text, meta, embedding) VALUES %s",
+                values,
             )
         return pks
 
@@ -151,39 +196,50 @@ class PGVector(BaseVector):
         Search the nearest neighbors to a vector.
 
         :param query_vector: The input vector to search for similar items.
-        :param top_k: The number of nearest neighbors to return, default is 5.
+        :param top_k: The number of nearest neighbors to return, default is 4.
+        :param score_threshold: The minimum score of the returned neighbors, exclusive.
+        :param document_ids_filter: The ids of the documents to search in, all documents if not set.
         :return: List of Documents that are nearest to the query vector.
         """
-        top_k = kwargs.get("top_k", 4)
+        top_k = int(kwargs.get("top_k", 4))
+        score_threshold = float(kwargs.get("score_threshold") or 0.0)
+        document_ids_condition, params = self._get_document_ids_filter(kwargs.get("document_ids_filter"))
 
         with self._get_cursor() as cur:
+            # the candidate list of the HNSW index bounds the number of results, it is reset by the commit
+            ef_search = min(max(self.hnsw_ef_search, top_k), MAX_HNSW_EF_SEARCH)
+            cur.execute("SET LOCAL hnsw.ef_search = %s", (ef_search,))
+            if params and self._iterative_scan_supported(cur):
+                # the filter is applied to the candidates of the index, keep scanning until top_k of them match
+                cur.execute("SET LOCAL hnsw.iterative_scan = strict_order")
+            # the query vector is an untyped literal, so it takes the type of the embedding column
             cur.execute(
+                f"SELECT meta, text, distance FROM ("
                 f"SELECT meta, text, embedding <=> %s AS distance FROM {self.table_name}"
-                f" ORDER BY distance LIMIT {top_k}",
-                (json.dumps(query_vector),),
+                f" WHERE {document_ids_condition} ORDER BY distance LIMIT {top_k}"
+                f") AS nearest WHERE distance < %s ORDER BY distance",
+                (_to_vector_literal(query_vector), *params, 1 - score_threshold),
             )
             docs = []
-            score_threshold = float(kwargs.get("score_threshold") or 0.0)
             for record in cur:
                 metadata, text, distance = record
-                score = 1 - distance
-                metadata["score"] = score
-                if score > score_threshold:
-                    docs.append(Document(page_content=text, metadata=metadata))
+                metadata["score"] = 1 - distance
+                docs.append(Document(page_content=text, metadata=metadata))
         return docs
 
     def search_by_full_text(self, query: str, **kwargs: Any) -> list[Document]:
         top_k = kwargs.get("top_k", 5)
+        document_ids_condition, params = self._get_document_ids_filter(kwargs.get("document_ids_filter"))
 
         with self._get_cursor() as cur:
             cur.execute(
                 f"""SELECT meta, text, ts_rank(to_tsvector(coalesce(text, '')), plainto_tsquery(%s)) AS score
                 FROM {self.table_name}
-                WHERE to_tsvector(text) @@ plainto_tsquery(%s)
+                WHERE to_tsvector(text) @@ plainto_tsquery(%s) AND {document_ids_condition}
                 ORDER BY score DESC
                 LIMIT {top_k}""",
                 # f"'{query}'" is required in order to account for whitespace in query
-                (f"'{query}'", f"'{query}'"),
+                (f"'{query}'", f"'{query}'", *params),
             )
 
             docs = []
@@ -199,6 +255,27 @@ class PGVector(BaseVector):
         with self._get_cursor() as cur:
             cur.execute(f"DROP TABLE IF EXISTS {self.table_name}")
 
+    @staticmethod
+    def _get_document_ids_filter(document_ids: Any) -> tuple[str, tuple]:
+        """
+        Build the condition restricting a search to documents.
+        Full text searches and selective filters can use the document_id index, otherwise vector searches
+        filter the candidates of the HNSW index, iteratively since pgvector 0.8.0.
+        """
+        if not document_ids:
+            return "TRUE", ()
+        return "meta->>'document_id' IN %s", (tuple(document_ids),)
+
+    @staticmethod
+    def _iterative_scan_supported(cur) -> bool:
+        global _iterative_scan_supported
+        if _iterative_scan_supported is None:
+            cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+            record = cur.fetchone()
+            version = tuple(int(part) for part in record[0].split(".")[:2]) if record else ()
+            _iterative_scan_supported = version >= ITERATIVE_SCAN_MIN_VERSION
+        return _iterative_scan_supported
+
     def _create_collection(self, dimension: int):
         cache_key = f"vector_indexing_{self._collection_name}"
         lock_name = f"{cache_key}_lock"
@@ -209,23 +286,40 @@ class PGVector(BaseVector):
 
             with self._get_cursor() as cur:
                 cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
-                cur.execute(SQL_CREATE_TABLE.format(table_name=self.table_name, dimension=dimension))
-                # PG hnsw index only support 2000 dimension or less
-                # ref: https://github.com/pgvector/pgvector?tab=readme-ov-file#indexing
-                if dimension <= 2000:
-                    cur.execute(SQL_CREATE_INDEX.format(table_name=self.table_name))
+                cur.execute(
+                    SQL_CREATE_TABLE.format(
+                        table_name=self.table_name, vector_type=self.vector_type, dimension=dimension
+                    )
+                )
+                # the table may have been created with another vector type, the index has to match its column
+                cur.execute(SQL_GET_EMBEDDING_TYPE, (self.table_name,))
+                vector_type = cur.fetchone()[0]
+                if dimension <= VECTOR_TYPE_MAX_INDEX_DIMENSIONS.get(vector_type, 0):
+                    cur.execute(
+                        SQL_CREATE_INDEX.format(
+                            table_name=self.table_name,
+                            index_hash=self.index_hash,
+                            vector_type=vector_type,
+                            m=self.hnsw_m,
+                            ef_construction=self.hnsw_ef_construction,
+                        )
+                    )
+                cur.execute(SQL_CREATE_DOCUMENT_ID_INDEX.format(table_name=self.table_name, index_hash=self.index_hash))
             redis_client.set(collection_exist_cache_key, 1, ex=3600)
 
 
 class PGVectorFactory(AbstractVectorFactory):
     def init_vector(self, dataset: Dataset, attributes: list, embeddings: Embeddings) -> PGVector:
         if dataset.index_struct_dict:
-            class_prefix: str = dataset.index_struct_dict["vector_store"]["class_prefix"]
+            vector_store = dataset.index_struct_dict["vector_store"]
+            class_prefix: str = vector_store["class_prefix"]
             collection_name = class_prefix
         else:
             dataset_id = dataset.id
             collection_name = Dataset.gen_collection_name_by_id(dataset_id)
-            dataset.index_struct = json.dumps(self.gen_index_struct_dict(VectorType.PGVECTOR, collection_name))
+            index_struct_dict = self.gen_index_struct_dict(VectorType.PGVECTOR, collection_name)
+            dataset.index_struct = json.dumps(index_struct_dict)
+            vector_store = index_struct_dict["vector_store"]
 
         return PGVector(
             collection_name=collection_name,
@@ -237,5 +331,13 @@ class PGVectorFactory(AbstractVectorFactory):
                 database=dify_config.PGVECTOR_DATABASE or "postgres",
                 min_connection=dify_config.PGVECTOR_MIN_CONNECTION,
                 max_connection=dify_config.PGVECTOR_MAX_CONNECTION,
+                # the vector type only applies to new tables, queries use the type of the existing column,
+                # HNSW parameters can be overridden per dataset in its index struct
+                vector_type=dify_config.PGVECTOR_VECTOR_TYPE,
+                hnsw_m=vector_store.get("hnsw_m", dify_config.PGVECTOR_HNSW_M),
+                hnsw_ef_construction=vector_store.get(
+                    "hnsw_ef_construction", dify_config.PGVECTOR_HNSW_EF_CONSTRUCTION
+                ),
+                hnsw_ef_search=vector_store.get("hnsw_ef_search", dify_config.PGVECTOR_HNSW_EF_SEARCH),
             ),
         )
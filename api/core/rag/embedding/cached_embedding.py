@@ -1,8 +1,11 @@
 import base64
 import logging
+import threading
 from typing import Any, Optional, cast
 
 import numpy as np
+from cachetools import LRUCache
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import IntegrityError
 
 from configs import dify_config
@@ -11,6 +14,7 @@ from core.model_manager import ModelInstance
 from core.model_runtime.entities.model_entities import ModelPropertyKey
 from core.model_runtime.model_providers.__base.text_embedding_model import TextEmbeddingModel
 from core.rag.embedding.embedding_base import Embeddings
+from core.rag.embedding.embedding_scheduler import EmbeddingScheduler
 from extensions.ext_database import db
 from extensions.ext_redis import redis_client
 from libs import helper
@@ -18,6 +22,12 @@ from models.dataset import Embedding
 
 logger = logging.getLogger(__name__)
 
+# process-wide cache of document embeddings keyed by (provider_name, model_name, hash)
+_local_embedding_cache: Optional[LRUCache] = (
+    LRUCache(maxsize=dify_config.EMBEDDING_CACHE_LOCAL_MAX_SIZE) if dify_config.EMBEDDING_CACHE_LOCAL_MAX_SIZE else None
+)
+_local_embedding_cache_lock = threading.Lock()
+
 
 class CacheEmbedding(Embeddings):
     def __init__(self, model_instance: ModelInstance, user: Optional[str] = None) -> None:
@@ -25,26 +35,19 @@ class CacheEmbedding(Embeddings):
         self._user = user
 
     def embed_documents(self, texts: list[str]) -> list[list[float]]:
-        """Embed search docs in batches of 10."""
+        """Embed search docs in batches packed by the embedding scheduler."""
         # use doc embedding cache or store if not exists
         text_embeddings: list[Any] = [None for _ in range(len(texts))]
+        text_hashes = [helper.generate_text_hash(text) for text in texts]
+        cached_embeddings = self._get_cached_document_embeddings(set(text_hashes))
         embedding_queue_indices = []
-        for i, text in enumerate(texts):
-            hash = helper.generate_text_hash(text)
-            embedding = (
-                db.session.query(Embedding)
-                .filter_by(
-                    model_name=self._model_instance.model, hash=hash, provider_name=self._model_instance.provider
-                )
-                .first()
-            )
-            if embedding:
-                text_embeddings[i] = embedding.get_embedding()
+        for i, hash in enumerate(text_hashes):
+            if hash in cached_embeddings:
+                text_embeddings[i] = cached_embeddings[hash]
             else:
                 embedding_queue_indices.append(i)
         if embedding_queue_indices:
             embedding_queue_texts = [texts[i] for i in embedding_queue_indices]
-            embedding_queue_embeddings = []
             try:
                 model_type_instance = cast(TextEmbeddingModel, self._model_instance.model_type_instance)
                 model_schema = model_type_instance.get_model_schema(
@@ -55,50 +58,147 @@ class CacheEmbedding(Embeddings):
                     if model_schema and ModelPropertyKey.MAX_CHUNKS in model_schema.model_properties
                     else 1
                 )
-                for i in range(0, len(embedding_queue_texts), max_chunks):
-                    batch_texts = embedding_queue_texts[i : i + max_chunks]
-
-                    embedding_result = self._model_instance.invoke_text_embedding(
-                        texts=batch_texts, user=self._user, input_type=EmbeddingInputType.DOCUMENT
-                    )
-
-                    for vector in embedding_result.embeddings:
-                        try:
-                            # FIXME: type ignore for numpy here
-                            normalized_embedding = (vector / np.linalg.norm(vector)).tolist()  # type: ignore
-                            # stackoverflow best way: https://stackoverflow.com/questions/20319813/how-to-check-list-containing-nan
-                            if np.isnan(normalized_embedding).any():
-                                # for issue #11827  float values are not json compliant
-                                logger.warning(f"Normalized embedding is nan: {normalized_embedding}")
-                                continue
-                            embedding_queue_embeddings.append(normalized_embedding)
-                        except IntegrityError:
-                            db.session.rollback()
-                        except Exception as e:
-                            logging.exception("Failed transform embedding")
-                cache_embeddings = []
-                try:
-                    for i, n_embedding in zip(embedding_queue_indices, embedding_queue_embeddings):
-                        text_embeddings[i] = n_embedding
-                        hash = helper.generate_text_hash(texts[i])
-                        if hash not in cache_embeddings:
-                            embedding_cache = Embedding(
-                                model_name=self._model_instance.model,
-                                hash=hash,
-                                provider_name=self._model_instance.provider,
-                            )
-                            embedding_cache.set_embedding(n_embedding)
-                            db.session.add(embedding_cache)
-                            cache_embeddings.append(hash)
-                    db.session.commit()
-                except IntegrityError:
-                    db.session.rollback()
+                embedding_scheduler = EmbeddingScheduler(self._model_instance, self._user, max_chunks=max_chunks)
+                embedding_queue_vectors = embedding_scheduler.embed(embedding_queue_texts)
+                new_embeddings: dict[str, np.ndarray] = {}
+                failed_indices = []
+                for i, vector in zip(embedding_queue_indices, embedding_queue_vectors):
+                    try:
+                        normalized_embedding = self._normalize(vector)
+                    except Exception:
+                        logging.exception("Failed transform embedding")
+                        failed_indices.append(i)
+                        continue
+                    # stackoverflow best way: https://stackoverflow.com/questions/20319813/how-to-check-list-containing-nan
+                    if np.isnan(normalized_embedding).any():
+                        # for issue #11827  float values are not json compliant
+                        logger.warning(f"Normalized embedding is nan: {normalized_embedding}")
+                        failed_indices.append(i)
+                        continue
+                    text_embeddings[i] = normalized_embedding
+                    new_embeddings.setdefault(text_hashes[i], normalized_embedding)
+                # the valid embeddings are cached, so a retry only embeds the failed texts again
+                self._save_document_embeddings(new_embeddings)
+                if failed_indices:
+                    raise ValueError(f"Failed to embed {len(failed_indices)} of {len(texts)} texts, please try again")
             except Exception as ex:
                 db.session.rollback()
                 logger.exception("Failed to embed documents: %s")
                 raise ex
 
-        return text_embeddings
+        # vectors stay float32 arrays until they are handed over to the vector store client
+        return [embedding.tolist() for embedding in text_embeddings]
+
+    def _get_cached_document_embeddings(self, hashes: set[str]) -> dict[str, np.ndarray]:
+        """
+        Resolve cached document embeddings for the given text hashes.
+        Lookups go through the in-process LRU cache, then Redis, then the embeddings table
+        with one query per batch of hashes.
+        """
+        provider_name = self._model_instance.provider
+        model_name = self._model_instance.model
+        embeddings: dict[str, np.ndarray] = {}
+        missing_hashes = list(hashes)
+
+        if _local_embedding_cache is not None:
+            with _local_embedding_cache_lock:
+                for hash in missing_hashes:
+                    embedding = _local_embedding_cache.get((provider_name, model_name, hash))
+                    if embedding is not None:
+                        embeddings[hash] = embedding
+            missing_hashes = [hash for hash in missing_hashes if hash not in embeddings]
+
+        if missing_hashes and dify_config.EMBEDDING_CACHE_REDIS_ENABLED:
+            try:
+                pipeline = redis_client.pipeline(transaction=False)
+                for hash in missing_hashes:
+                    pipeline.get(self._document_embedding_cache_key(hash))
+                for hash, value in zip(missing_hashes, pipeline.execute()):
+                    if value:
+                        embeddings[hash] = Embedding.decode_embedding(value)
+                missing_hashes = [hash for hash in missing_hashes if hash not in embeddings]
+            except Exception:
+                logger.exception("Failed to get document embeddings from redis")
+
+        batch_size = dify_config.EMBEDDING_CACHE_LOOKUP_BATCH_SIZE
+        for i in range(0, len(missing_hashes), batch_size):
+            batch_hashes = missing_hashes[i : i + batch_size]
+            rows = (
+                db.session.query(Embedding.hash, Embedding.embedding)
+                .filter(
+                    Embedding.provider_name == provider_name,
+                    Embedding.model_name == model_name,
+                    Embedding.hash.in_(batch_hashes),
+                )
+                .all()
+            )
+            db_embeddings = {row.hash: Embedding.decode_embedding(row.embedding) for row in rows}
+            embeddings.update(db_embeddings)
+            self._cache_document_embeddings(db_embeddings)
+
+        return embeddings
+
+    def _save_document_embeddings(self, embeddings: dict[str, np.ndarray]) -> None:
+        """
+        Persist newly computed document embeddings with a single bulk insert,
+        leaving rows written concurrently by other workers untouched.
+        """
+        if not embeddings:
+            return
+        items = list(embeddings.items())
+        batch_size = dify_config.EMBEDDING_CACHE_LOOKUP_BATCH_SIZE
+        try:
+            for i in range(0, len(items), batch_size):
+                stmt = (
+                    insert(Embedding)
+                    .values(
+                        [
+                            {
+                                "model_name": self._model_instance.model,
+                                "hash": hash,
+                                "provider_name": self._model_instance.provider,
+                                "embedding": Embedding.encode_embedding(embedding),
+                            }
+                            for hash, embedding in items[i : i + batch_size]
+                        ]
+                    )
+                    .on_conflict_do_nothing(index_elements=["model_name", "hash", "provider_name"])
+                )
+                db.session.execute(stmt)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+        self._cache_document_embeddings(embeddings)
+
+    def _cache_document_embeddings(self, embeddings: dict[str, np.ndarray]) -> None:
+        if not embeddings:
+            return
+        provider_name = self._model_instance.provider
+        model_name = self._model_instance.model
+        if _local_embedding_cache is not None:
+            with _local_embedding_cache_lock:
+                for hash, embedding in embeddings.items():
+                    _local_embedding_cache[(provider_name, model_name, hash)] = embedding
+        if dify_config.EMBEDDING_CACHE_REDIS_ENABLED:
+            try:
+                pipeline = redis_client.pipeline(transaction=False)
+                for hash, embedding in embeddings.items():
+                    pipeline.setex(
+                        self._document_embedding_cache_key(hash),
+                        dify_config.EMBEDDING_CACHE_REDIS_TTL,
+                        Embedding.encode_embedding(embedding),
+                    )
+                pipeline.execute()
+            except Exception:
+                logger.exception("Failed to add document embeddings to redis")
+
+    def _document_embedding_cache_key(self, hash: str) -> str:
+        return f"document_embedding_{self._model_instance.provider}_{self._model_instance.model}_{hash}"
+
+    @staticmethod
+    def _normalize(vector: list[float]) -> np.ndarray:
+        embedding = np.asarray(vector, dtype=np.float32)
+        return embedding / np.linalg.norm(embedding)
 
     def embed_query(self, text: str) -> list[float]:
         """Embed query text."""
@@ -108,16 +208,16 @@ class CacheEmbedding(Embeddings):
         embedding = redis_client.get(embedding_cache_key)
         if embedding:
             redis_client.expire(embedding_cache_key, 600)
-            decoded_embedding = np.frombuffer(base64.b64decode(embedding), dtype="float")
-            return [float(x) for x in decoded_embedding]
+            if Embedding.is_legacy_embedding(embedding):
+                # entries cached before the binary format was introduced are base64 encoded float64
+                return cast(list[float], np.frombuffer(base64.b64decode(embedding), dtype="float").tolist())
+            return cast(list[float], Embedding.decode_embedding(embedding).tolist())
         try:
             embedding_result = self._model_instance.invoke_text_embedding(
                 texts=[text], user=self._user, input_type=EmbeddingInputType.QUERY
             )
 
-            embedding_results = embedding_result.embeddings[0]
-            # FIXME: type ignore for numpy here
-            embedding_results = (embedding_results / np.linalg.norm(embedding_results)).tolist()  # type: ignore
+            embedding_results = self._normalize(embedding_result.embeddings[0])
             if np.isnan(embedding_results).any():
                 raise ValueError("Normalized embedding is nan please try again")
         except Exception as ex:
@@ -126,17 +226,10 @@ class CacheEmbedding(Embeddings):
             raise ex
 
         try:
-            # encode embedding to base64
-            embedding_vector = np.array(embedding_results)
-            vector_bytes = embedding_vector.tobytes()
-            # Transform to Base64
-            encoded_vector = base64.b64encode(vector_bytes)
-            # Transform to string
-            encoded_str = encoded_vector.decode("utf-8")
-            redis_client.setex(embedding_cache_key, 600, encoded_str)
+            redis_client.setex(embedding_cache_key, 600, Embedding.encode_embedding(embedding_results))
         except Exception as ex:
             if dify_config.DEBUG:
                 logging.exception(f"Failed to add embedding to redis for the text '{text[:10]}...({len(text)} chars)'")
             raise ex
 
-        return embedding_results
+        return cast(list[float], embedding_results.tolist())
@@ -0,0 +1,221 @@
+import contextvars
+import hashlib
+import json
+import logging
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from configs import dify_config
+from core.entities.embedding_type import EmbeddingInputType
+from core.model_manager import ModelInstance
+from core.model_runtime.errors.invoke import InvokeRateLimitError
+from core.model_runtime.model_providers.__base.tokenizers.gpt2_tokenzier import GPT2Tokenizer
+from extensions.ext_redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+# sorted set of the requests in flight per provider credential, scored by the time their slot expires
+SLOTS_KEY_PREFIX = "embedding_slots:"
+# concurrency limit per provider credential, lowered on rate limit errors and raised again on successes
+LIMIT_KEY_PREFIX = "embedding_concurrency_limit:"
+# set while a provider credential is rate limited, no worker starts a request until it expires
+COOLDOWN_KEY_PREFIX = "embedding_cooldown:"
+
+# a slot is released by its request, the expiration only frees slots of workers which died during a request
+SLOT_TTL_SECONDS = 600
+# the lowered limit is forgotten once no rate limit error happened for this long
+LIMIT_TTL_SECONDS = 600
+SLOT_POLL_INTERVAL_SECONDS = 0.1
+MAX_BACKOFF_SECONDS = 60.0
+
+# KEYS: slots, limit, cooldown. ARGV: now, slot expires at, default limit, slot id, slots ttl
+ACQUIRE_SLOT_SCRIPT = """
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    return 0
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+local limit = tonumber(redis.call('GET', KEYS[2]) or ARGV[3])
+if redis.call('ZCARD', KEYS[1]) >= limit then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[4])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+return 1
+"""
+
+# KEYS: limit, cooldown. ARGV: default limit, limit ttl, cooldown ms.
+# concurrent rate limit errors of the same cooldown only halve the limit once
+DECREASE_LIMIT_SCRIPT = """
+if not redis.call('SET', KEYS[2], 1, 'NX', 'PX', ARGV[3]) then
+    return 0
+end
+local limit = tonumber(redis.call('GET', KEYS[1]) or ARGV[1])
+limit = math.max(1, math.floor(limit / 2))
+redis.call('SET', KEYS[1], limit, 'EX', ARGV[2])
+return limit
+"""
+
+# KEYS: limit. ARGV: default limit, limit ttl
+INCREASE_LIMIT_SCRIPT = """
+local limit = redis.call('GET', KEYS[1])
+if not limit then
+    return tonumber(ARGV[1])
+end
+limit = math.min(tonumber(ARGV[1]), tonumber(limit) + 1)
+redis.call('SET', KEYS[1], limit, 'EX', ARGV[2])
+return limit
+"""
+
+
+class EmbeddingScheduler:
+    """
+    Embed documents with the text embedding model of a model instance.
+
+    Texts are packed into batches of at most `max_chunks` texts and `max_tokens` tokens, and the batches are
+    embedded concurrently. Requests take a slot of their provider credential in Redis, so the workers indexing
+    documents with the same credential share `max_concurrent_requests` in flight requests between them.
+    A rate limit error halves the limit of the credential and pauses all its requests for the backoff time,
+    every successful request raises it by one again, up to `max_concurrent_requests`.
+    """
+
+    def __init__(
+        self,
+        model_instance: ModelInstance,
+        user: Optional[str] = None,
+        *,
+        max_chunks: int,
+        max_tokens: int = dify_config.EMBEDDING_BATCH_MAX_TOKENS,
+        max_concurrent_requests: int = dify_config.EMBEDDING_MAX_CONCURRENT_REQUESTS,
+        max_retries: int = dify_config.EMBEDDING_RATE_LIMIT_MAX_RETRIES,
+    ) -> None:
+        self._model_instance = model_instance
+        self._user = user
+        self._max_chunks = max_chunks
+        self._max_tokens = max_tokens
+        self._max_concurrent_requests = max_concurrent_requests
+        self._max_retries = max_retries
+
+        credentials = json.dumps(model_instance.credentials or {}, sort_keys=True, default=str)
+        credential_key = f"{model_instance.provider}:{hashlib.sha256(credentials.encode()).hexdigest()[:16]}"
+        self._slots_key = f"{SLOTS_KEY_PREFIX}{credential_key}"
+        self._limit_key = f"{LIMIT_KEY_PREFIX}{credential_key}"
+        self._cooldown_key = f"{COOLDOWN_KEY_PREFIX}{credential_key}"
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embed texts, in the order of the texts
+        """
+        batches = self.pack(texts)
+        start_at = time.perf_counter()
+        if len(batches) == 1:
+            results = [self._embed_batch(batches[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(len(batches), self._max_concurrent_requests)) as executor:
+                # every task runs in its own copy of the context, so it sees the app context of the caller
+                futures = [
+                    executor.submit(contextvars.copy_context().run, self._embed_batch, batch) for batch in batches
+                ]
+                results = [future.result() for future in futures]
+
+        embeddings = [embedding for batch_embeddings, _ in results for embedding in batch_embeddings]
+        tokens = sum(batch_tokens for _, batch_tokens in results)
+        elapsed = max(time.perf_counter() - start_at, 1e-6)
+        logger.info(
+            f"Embedded {len(texts)} texts in {len(batches)} batches with {self._model_instance.provider}/"
+            f"{self._model_instance.model}: {tokens} tokens in {elapsed:.2f}s, {tokens / elapsed:.0f} tokens/s"
+        )
+        return embeddings
+
+    def pack(self, texts: list[str]) -> list[list[str]]:
+        """
+        Split texts into consecutive batches within the chunk and token limits,
+        a text longer than the token limit is sent alone
+        """
+        batches: list[list[str]] = []
+        batch: list[str] = []
+        batch_tokens = 0
+        for text in texts:
+            text_tokens = GPT2Tokenizer.get_num_tokens(text)
+            if batch and (len(batch) >= self._max_chunks or batch_tokens + text_tokens > self._max_tokens):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += text_tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _embed_batch(self, texts: list[str]) -> tuple[list[list[float]], int]:
+        retries = 0
+        while True:
+            slot_id = self._acquire_slot()
+            try:
+                embedding_result = self._model_instance.invoke_text_embedding(
+                    texts=texts, user=self._user, input_type=EmbeddingInputType.DOCUMENT
+                )
+            except InvokeRateLimitError:
+                if retries >= self._max_retries:
+                    raise
+                backoff = min(MAX_BACKOFF_SECONDS, 2**retries) * random.uniform(0.5, 1.0)
+                retries += 1
+                logger.warning(
+                    f"Embedding requests of {self._model_instance.provider} are rate limited, retrying in"
+                    f" {backoff:.1f}s ({retries}/{self._max_retries})"
+                )
+                self._decrease_limit(backoff)
+            else:
+                self._increase_limit()
+                return embedding_result.embeddings, embedding_result.usage.tokens
+            finally:
+                self._release_slot(slot_id)
+
+            # the slot is released while waiting, so it can be taken once the cooldown of the credential expires
+            time.sleep(backoff)
+
+    def _acquire_slot(self) -> Optional[str]:
+        """
+        Wait for a free request slot of the provider credential,
+        or return None to send the request without one if Redis is unavailable
+        """
+        slot_id = str(uuid.uuid4())
+        try:
+            acquire = redis_client.register_script(ACQUIRE_SLOT_SCRIPT)
+            while True:
+                now = time.time()
+                if acquire(
+                    keys=[self._slots_key, self._limit_key, self._cooldown_key],
+                    args=[now, now + SLOT_TTL_SECONDS, self._max_concurrent_requests, slot_id, SLOT_TTL_SECONDS],
+                ):
+                    return slot_id
+                time.sleep(SLOT_POLL_INTERVAL_SECONDS * random.uniform(0.5, 1.5))
+        except Exception:
+            logger.exception("Failed to acquire an embedding request slot from redis")
+            return None
+
+    def _release_slot(self, slot_id: Optional[str]) -> None:
+        if slot_id is None:
+            return
+        try:
+            redis_client.zrem(self._slots_key, slot_id)
+        except Exception:
+            logger.exception("Failed to release an embedding request slot")
+
+    def _decrease_limit(self, backoff: float) -> None:
+        try:
+            redis_client.register_script(DECREASE_LIMIT_SCRIPT)(
+                keys=[self._limit_key, self._cooldown_key],
+                args=[self._max_concurrent_requests, LIMIT_TTL_SECONDS, int(backoff * 1000)],
+            )
+        except Exception:
+            logger.exception("Failed to lower the embedding concurrency limit")
+
+    def _increase_limit(self) -> None:
+        try:
+            redis_client.register_script(INCREASE_LIMIT_SCRIPT)(
+                keys=[self._limit_key], args=[self._max_concurrent_requests, LIMIT_TTL_SECONDS]
+            )
+        except Exception:
+            logger.exception("Failed to raise the embedding concurrency limit")
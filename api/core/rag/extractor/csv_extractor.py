@@ -1,6 +1,7 @@
 """Abstract interface for document loader implementations."""
 
 import csv
+from collections.abc import Iterator
 from typing import Optional
 
 import pandas as pd
@@ -9,6 +10,11 @@ from core.rag.extractor.extractor_base import BaseExtractor
 from core.rag.extractor.helpers import detect_file_encodings
 from core.rag.models.document import Document
 
+# number of characters read at a time when checking the encoding of a file
+READ_CHUNK_SIZE = 1024 * 1024
+# number of rows parsed at a time
+CSV_CHUNK_ROWS = 1000
+
 
 class CSVExtractor(BaseExtractor):
     """Load CSV files.
@@ -35,44 +41,46 @@ class CSVExtractor(BaseExtractor):
 
     def extract(self) -> list[Document]:
         """Load data into document objects."""
-        docs = []
-        try:
-            with open(self._file_path, newline="", encoding=self._encoding) as csvfile:
-                docs = self._read_from_file(csvfile)
-        except UnicodeDecodeError as e:
-            if self._autodetect_encoding:
-                detected_encodings = detect_file_encodings(self._file_path)
-                for encoding in detected_encodings:
-                    try:
-                        with open(self._file_path, newline="", encoding=encoding.encoding) as csvfile:
-                            docs = self._read_from_file(csvfile)
-                        break
-                    except UnicodeDecodeError:
-                        continue
-            else:
-                raise RuntimeError(f"Error loading {self._file_path}") from e
+        return list(self.extract_iter())
 
-        return docs
+    def extract_iter(self) -> Iterator[Document]:
+        """Yield a document per row, reading the file in chunks of rows."""
+        # the encoding is checked on the whole file first, so no row is yielded before a decoding error
+        for encoding in self._get_candidate_encodings():
+            if self._can_decode(encoding):
+                with open(self._file_path, newline="", encoding=encoding) as csvfile:
+                    yield from self._read_from_file(csvfile)
+                return
 
-    def _read_from_file(self, csvfile) -> list[Document]:
-        docs = []
-        try:
-            # load csv file into pandas dataframe
-            df = pd.read_csv(csvfile, on_bad_lines="skip", **self.csv_args)
+    def _get_candidate_encodings(self) -> Iterator[Optional[str]]:
+        yield self._encoding
+        if not self._autodetect_encoding:
+            raise RuntimeError(f"Error loading {self._file_path}")
+        for detected_encoding in detect_file_encodings(self._file_path):
+            yield detected_encoding.encoding
 
-            # check source column exists
-            if self.source_column and self.source_column not in df.columns:
-                raise ValueError(f"Source column '{self.source_column}' not found in CSV file.")
+    def _can_decode(self, encoding: Optional[str]) -> bool:
+        try:
+            with open(self._file_path, newline="", encoding=encoding) as csvfile:
+                while csvfile.read(READ_CHUNK_SIZE):
+                    pass
+        except UnicodeDecodeError:
+            return False
+        return True
 
-            # create document objects
+    def _read_from_file(self, csvfile) -> Iterator[Document]:
+        try:
+            # load csv file into pandas dataframes of at most CSV_CHUNK_ROWS rows
+            for df in pd.read_csv(csvfile, on_bad_lines="skip", chunksize=CSV_CHUNK_ROWS, **self.csv_args):
+                # check source column exists
+                if self.source_column and self.source_column not in df.columns:
+                    raise ValueError(f"Source column '{self.source_column}' not found in CSV file.")
 
-            for i, row in df.iterrows():
-                content = ";".join(f"{col.strip()}: {str(row[col]).strip()}" for col in df.columns)
-                source = row[self.source_column] if self.source_column else ""
-                metadata = {"source": source, "row": i}
-                doc = Document(page_content=content, metadata=metadata)
-                docs.append(doc)
+                # create document objects
+                for i, row in df.iterrows():
+                    content = ";".join(f"{col.strip()}: {str(row[col]).strip()}" for col in df.columns)
+                    source = row[self.source_column] if self.source_column else ""
+                    metadata = {"source": source, "row": i}
+                    yield Document(page_content=content, metadata=metadata)
         except csv.Error as e:
             raise e
-
-        return docs
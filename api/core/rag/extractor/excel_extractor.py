@@ -1,6 +1,7 @@
 """Abstract interface for document loader implementations."""
 
 import os
+from collections.abc import Iterator
 from typing import Optional, cast
 
 import pandas as pd
@@ -26,7 +27,10 @@ class ExcelExtractor(BaseExtractor):
 
     def extract(self) -> list[Document]:
         """Load from Excel file in xls or xlsx format using Pandas and openpyxl."""
-        documents = []
+        return list(self.extract_iter())
+
+    def extract_iter(self) -> Iterator[Document]:
+        """Yield a document per row, sheet by sheet."""
         file_extension = os.path.splitext(self._file_path)[-1].lower()
 
         if file_extension == ".xlsx":
@@ -54,9 +58,7 @@ class ExcelExtractor(BaseExtractor):
                                 page_content.append(f'"{k}":"{value}"')
                             else:
                                 page_content.append(f'"{k}":"{v}"')
-                    documents.append(
-                        Document(page_content=";".join(page_content), metadata={"source": self._file_path})
-                    )
+                    yield Document(page_content=";".join(page_content), metadata={"source": self._file_path})
 
         elif file_extension == ".xls":
             excel_file = pd.ExcelFile(self._file_path, engine="xlrd")
@@ -69,10 +71,6 @@ class ExcelExtractor(BaseExtractor):
                     for k, v in row.items():
                         if pd.notna(v):
                             page_content.append(f'"{k}":"{v}"')
-                    documents.append(
-                        Document(page_content=";".join(page_content), metadata={"source": self._file_path})
-                    )
+                    yield Document(page_content=";".join(page_content), metadata={"source": self._file_path})
         else:
             raise ValueError(f"Unsupported file extension: {file_extension}")
-
-        return documents
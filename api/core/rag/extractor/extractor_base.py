@@ -1,6 +1,9 @@
 """Abstract interface for document loader implementations."""
 
 from abc import ABC, abstractmethod
+from collections.abc import Iterator
+
+from core.rag.models.document import Document
 
 
 class BaseExtractor(ABC):
@@ -9,3 +12,10 @@ class BaseExtractor(ABC):
     @abstractmethod
     def extract(self):
         raise NotImplementedError
+
+    def extract_iter(self) -> Iterator[Document]:
+        """
+        Yield the extracted documents as they are read.
+        Extractors which can read their source incrementally override it, the others extract everything first.
+        """
+        yield from self.extract()
@@ -1,6 +1,7 @@
 """Abstract interface for document loader implementations."""
 
 from abc import ABC, abstractmethod
+from collections.abc import Iterator
 from typing import Optional
 
 from configs import dify_config
@@ -22,10 +23,22 @@ class BaseIndexProcessor(ABC):
     def extract(self, extract_setting: ExtractSetting, **kwargs) -> list[Document]:
         raise NotImplementedError
 
+    def extract_iter(self, extract_setting: ExtractSetting, **kwargs) -> Iterator[Document]:
+        """
+        Yield the extracted documents as they are read, by default once all of them are extracted.
+        """
+        yield from self.extract(extract_setting, **kwargs)
+
     @abstractmethod
     def transform(self, documents: list[Document], **kwargs) -> list[Document]:
         raise NotImplementedError
 
+    def supports_incremental_transform(self, process_rule: dict) -> bool:
+        """
+        Whether transforming the extracted documents batch by batch gives the same result as all at once.
+        """
+        return True
+
     @abstractmethod
     def load(self, dataset: Dataset, documents: list[Document], with_keywords: bool = True, **kwargs):
         raise NotImplementedError
@@ -1,6 +1,6 @@
-import math
-from collections import Counter
-from typing import Optional
+import json
+import logging
+from typing import Optional, cast
 
 import numpy as np
 
@@ -11,6 +11,13 @@ from core.rag.embedding.cached_embedding import CacheEmbedding
 from core.rag.models.document import Document
 from core.rag.rerank.entity.weight import VectorSetting, Weights
 from core.rag.rerank.rerank_base import BaseRerankRunner
+from extensions.ext_redis import redis_client
+from libs import helper
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_KEYWORDS_CACHE_KEY_PREFIX = "weight_rerank_document_keywords"
+DOCUMENT_KEYWORDS_CACHE_TTL = 86400
 
 
 class WeightRerankRunner(BaseRerankRunner):
@@ -65,7 +72,32 @@ class WeightRerankRunner(BaseRerankRunner):
 
     def _calculate_keyword_score(self, query: str, documents: list[Document]) -> list[float]:
         """
-        Calculate BM25 scores
+        Calculate keyword scores, the BM25 score of documents from keyword search or a TF-IDF cosine score
+        :param query: search query
+        :param documents: documents for reranking
+
+        :return:
+        """
+        query_scores: list[float] = [0.0] * len(documents)
+
+        # documents from keyword search already carry their normalized BM25 score
+        indices_to_calculate = []
+        for i, document in enumerate(documents):
+            if document.metadata and "keyword_score" in document.metadata:
+                query_scores[i] = document.metadata["keyword_score"]
+            else:
+                indices_to_calculate.append(i)
+
+        if indices_to_calculate:
+            tfidf_scores = self._calculate_tfidf_score(query, [documents[i] for i in indices_to_calculate])
+            for i, tfidf_score in zip(indices_to_calculate, tfidf_scores):
+                query_scores[i] = tfidf_score
+
+        return query_scores
+
+    def _calculate_tfidf_score(self, query: str, documents: list[Document]) -> list[float]:
+        """
+        Calculate TF-IDF cosine scores
         :param query: search query
         :param documents: documents for reranking
 
@@ -73,72 +105,94 @@ class WeightRerankRunner(BaseRerankRunner):
         """
         keyword_table_handler = JiebaKeywordTableHandler()
         query_keywords = keyword_table_handler.extract_keywords(query, None)
-        documents_keywords = []
-        for document in documents:
-            # get the document keywords
-            document_keywords = keyword_table_handler.extract_keywords(document.page_content, None)
+        documents_keywords = self._get_documents_keywords(keyword_table_handler, documents)
+        for document, document_keywords in zip(documents, documents_keywords):
             if document.metadata is not None:
                 document.metadata["keywords"] = document_keywords
-                documents_keywords.append(document_keywords)
-
-        # Counter query keywords(TF)
-        query_keyword_counts = Counter(query_keywords)
-
-        # total documents
-        total_documents = len(documents)
-
-        # calculate all documents' keywords IDF
-        all_keywords = set()
-        for document_keywords in documents_keywords:
-            all_keywords.update(document_keywords)
-
-        keyword_idf = {}
-        for keyword in all_keywords:
-            # calculate include query keywords' documents
-            doc_count_containing_keyword = sum(1 for doc_keywords in documents_keywords if keyword in doc_keywords)
-            # IDF
-            keyword_idf[keyword] = math.log((1 + total_documents) / (1 + doc_count_containing_keyword)) + 1
-
-        query_tfidf = {}
-
-        for keyword, count in query_keyword_counts.items():
-            tf = count
-            idf = keyword_idf.get(keyword, 0)
-            query_tfidf[keyword] = tf * idf
-
-        # calculate all documents' TF-IDF
-        documents_tfidf = []
-        for document_keywords in documents_keywords:
-            document_keyword_counts = Counter(document_keywords)
-            document_tfidf = {}
-            for keyword, count in document_keyword_counts.items():
-                tf = count
-                idf = keyword_idf.get(keyword, 0)
-                document_tfidf[keyword] = tf * idf
-            documents_tfidf.append(document_tfidf)
-
-        def cosine_similarity(vec1, vec2):
-            intersection = set(vec1.keys()) & set(vec2.keys())
-            numerator = sum(vec1[x] * vec2[x] for x in intersection)
-
-            sum1 = sum(vec1[x] ** 2 for x in vec1)
-            sum2 = sum(vec2[x] ** 2 for x in vec2)
-            denominator = math.sqrt(sum1) * math.sqrt(sum2)
-
-            if not denominator:
-                return 0.0
-            else:
-                return float(numerator) / denominator
 
-        similarities = []
-        for document_tfidf in documents_tfidf:
-            similarity = cosine_similarity(query_tfidf, document_tfidf)
-            similarities.append(similarity)
+        if not documents_keywords:
+            return []
+
+        # build the sparse keyword incidence matrix of the documents in CSR layout,
+        # keywords are extracted as sets so every term frequency is 1
+        vocabulary: dict[str, int] = {}
+        indices = np.fromiter(
+            (
+                vocabulary.setdefault(keyword, len(vocabulary))
+                for document_keywords in documents_keywords
+                for keyword in document_keywords
+            ),
+            dtype=np.int64,
+        )
+        indptr = np.cumsum([0] + [len(document_keywords) for document_keywords in documents_keywords])
+
+        # IDF of all documents' keywords
+        total_documents = len(documents_keywords)
+        doc_count_containing_keyword = np.bincount(indices, minlength=len(vocabulary))
+        keyword_idf = np.log((1 + total_documents) / (1 + doc_count_containing_keyword)) + 1
+
+        # query TF-IDF, keywords which are not in any document have an IDF of 0
+        query_tfidf = np.zeros(len(vocabulary))
+        for keyword in query_keywords:
+            if keyword in vocabulary:
+                query_tfidf[vocabulary[keyword]] = keyword_idf[vocabulary[keyword]]
+
+        # per document sums over the CSR rows, empty rows sum to 0
+        def row_sums(values: np.ndarray) -> np.ndarray:
+            cumulative = np.concatenate(([0.0], np.cumsum(values)))
+            return cast(np.ndarray, cumulative[indptr[1:]] - cumulative[indptr[:-1]])
+
+        idf = keyword_idf[indices]
+        numerators = row_sums(query_tfidf[indices] * idf)
+        denominators = np.sqrt(row_sums(idf**2)) * np.linalg.norm(query_tfidf)
+        similarities = np.divide(numerators, denominators, out=np.zeros(total_documents), where=denominators != 0)
+
+        return cast(list[float], similarities.tolist())
+
+    @staticmethod
+    def _get_documents_keywords(
+        keyword_table_handler: JiebaKeywordTableHandler, documents: list[Document]
+    ) -> list[set[str]]:
+        """
+        Get the keywords of documents, keywords are cached by the hash of the document content
+        :param keyword_table_handler: jieba keyword table handler
+        :param documents: documents for reranking
 
-        # for idx, similarity in enumerate(similarities):
-        #     print(f"Document {idx + 1} similarity: {similarity}")
+        :return:
+        """
+        cache_keys = [
+            f"{DOCUMENT_KEYWORDS_CACHE_KEY_PREFIX}:{helper.generate_text_hash(document.page_content)}"
+            for document in documents
+        ]
+        cached_values: list[Optional[bytes]] = [None] * len(documents)
+        try:
+            pipeline = redis_client.pipeline(transaction=False)
+            for cache_key in cache_keys:
+                pipeline.get(cache_key)
+            cached_values = pipeline.execute()
+        except Exception:
+            logger.warning("Failed to get cached document keywords", exc_info=True)
+
+        documents_keywords: list[set[str]] = []
+        missed_cache: dict[str, list[str]] = {}
+        for document, cache_key, cached_value in zip(documents, cache_keys, cached_values):
+            if cached_value is not None:
+                documents_keywords.append(set(json.loads(cached_value)))
+                continue
+            document_keywords = keyword_table_handler.extract_keywords(document.page_content, None)
+            documents_keywords.append(document_keywords)
+            missed_cache[cache_key] = list(document_keywords)
 
-        return similarities
+        if missed_cache:
+            try:
+                pipeline = redis_client.pipeline(transaction=False)
+                for cache_key, keywords in missed_cache.items():
+                    pipeline.setex(cache_key, DOCUMENT_KEYWORDS_CACHE_TTL, json.dumps(keywords))
+                pipeline.execute()
+            except Exception:
+                logger.warning("Failed to cache document keywords", exc_info=True)
+
+        return documents_keywords
 
     def _calculate_cosine(
         self, tenant_id: str, query: str, documents: list[Document], vector_setting: VectorSetting
@@ -150,7 +204,7 @@ class WeightRerankRunner(BaseRerankRunner):
 
         :return:
         """
-        query_vector_scores = []
+        query_vector_scores: list[float] = [0.0] * len(documents)
 
         model_manager = ModelManager()
 
@@ -161,25 +215,23 @@ class WeightRerankRunner(BaseRerankRunner):
             model=vector_setting.embedding_model_name,
         )
         cache_embedding = CacheEmbedding(embedding_model)
-        query_vector = cache_embedding.embed_query(query)
-        for document in documents:
-            # calculate cosine similarity
-            if document.metadata and "score" in document.metadata:
-                query_vector_scores.append(document.metadata["score"])
-            else:
-                # transform to NumPy
-                vec1 = np.array(query_vector)
-                vec2 = np.array(document.vector)
+        query_vector = np.asarray(cache_embedding.embed_query(query), dtype=np.float64)
 
-                # calculate dot product
-                dot_product = np.dot(vec1, vec2)
-
-                # calculate norm
-                norm_vec1 = np.linalg.norm(vec1)
-                norm_vec2 = np.linalg.norm(vec2)
-
-                # calculate cosine similarity
-                cosine_sim = dot_product / (norm_vec1 * norm_vec2)
-                query_vector_scores.append(cosine_sim)
+        # documents from vector search already carry their cosine score,
+        # documents from keyword search have neither a score nor a vector and keep a score of 0
+        indices_to_calculate = []
+        for i, document in enumerate(documents):
+            if document.metadata and "score" in document.metadata:
+                query_vector_scores[i] = document.metadata["score"]
+            elif document.vector is not None:
+                indices_to_calculate.append(i)
+
+        if indices_to_calculate:
+            # calculate cosine similarity of all documents with a single matrix-vector product
+            document_vectors = np.asarray([documents[i].vector for i in indices_to_calculate], dtype=np.float64)
+            norms = np.linalg.norm(document_vectors, axis=1) * np.linalg.norm(query_vector)
+            cosine_sims = (document_vectors @ query_vector) / norms
+            for i, cosine_sim in zip(indices_to_calculate, cosine_sims.tolist()):
+                query_vector_scores[i] = cosine_sim
 
         return query_vector_scores
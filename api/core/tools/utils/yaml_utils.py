@@ -1,12 +1,33 @@
+import hashlib
+import json
 import logging
+import os
+import tempfile
+import threading
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional
 
 import yaml  # type: ignore
 from yaml import YAMLError
 
+from configs import dify_config
+
 logger = logging.getLogger(__name__)
 
+API_ROOT = Path(__file__).resolve().parents[3]
+# YAML files of the model providers and builtin tools, compiled into one bundle loaded by every process
+BUNDLE_SOURCE_DIRS = (
+    API_ROOT / "core" / "model_runtime" / "model_providers",
+    API_ROOT / "core" / "tools" / "provider" / "builtin",
+)
+# bump when the format of the bundle changes, bundles of other formats are rebuilt
+BUNDLE_FORMAT_VERSION = 1
+BUNDLE_FILE_PREFIX = "yaml_bundle_"
+
+# JSON documents of the bundled YAML files keyed by their absolute path, empty if the bundle is unavailable
+_bundle: Optional[dict[str, str]] = None
+_bundle_lock = threading.Lock()
+
 
 def load_yaml_file(file_path: str, ignore_error: bool = True, default_value: Any = {}) -> Any:
     """
@@ -18,6 +39,12 @@ def load_yaml_file(file_path: str, ignore_error: bool = True, default_value: Any
     :param default_value: the value returned when errors ignored
     :return: an object of the YAML content
     """
+    if file_path:
+        document = _get_bundled_document(file_path)
+        if document is not None:
+            # every call decodes its own copy, callers are free to modify it
+            return json.loads(document) or default_value
+
     if not file_path or not Path(file_path).exists():
         if ignore_error:
             return default_value
@@ -26,10 +53,133 @@ def load_yaml_file(file_path: str, ignore_error: bool = True, default_value: Any
 
     with open(file_path, encoding="utf-8") as yaml_file:
         try:
-            yaml_content = yaml.safe_load(yaml_file)
+            yaml_content = _safe_load(yaml_file)
             return yaml_content or default_value
         except Exception as e:
             if ignore_error:
                 return default_value
             else:
                 raise YAMLError(f"Failed to load YAML file {file_path}: {e}") from e
+
+
+def compile_yaml_bundle() -> str:
+    """
+    Parse the YAML files of the model providers and builtin tools and write them to the bundle of their source hash
+    :return: path of the bundle
+    """
+    source_files = _get_bundle_source_files()
+    bundle_path = _get_bundle_path(_hash_source_files(source_files))
+    _write_bundle(bundle_path, _compile_documents(source_files))
+    return bundle_path
+
+
+def _safe_load(stream: Any) -> Any:
+    # the libyaml based loader is several times faster than the pure python one
+    if yaml.__with_libyaml__:
+        return yaml.load(stream, Loader=yaml.CSafeLoader)
+    return yaml.safe_load(stream)
+
+
+def _get_bundled_document(file_path: str) -> Optional[str]:
+    if not dify_config.YAML_BUNDLE_ENABLED:
+        return None
+
+    real_path = os.path.realpath(file_path)
+    # files outside of the bundled directories never load the bundle
+    if not any(real_path.startswith(f"{source_dir}{os.sep}") for source_dir in BUNDLE_SOURCE_DIRS):
+        return None
+
+    global _bundle
+    if _bundle is None:
+        with _bundle_lock:
+            if _bundle is None:
+                _bundle = _load_bundle()
+    return _bundle.get(real_path)
+
+
+def _load_bundle() -> dict[str, str]:
+    """
+    Load the bundle of the current YAML files, or compile it if no process did yet.
+
+    The bundle is keyed by the hash of the YAML files, so a change of any of them compiles a new one.
+    """
+    try:
+        source_files = _get_bundle_source_files()
+        bundle_path = _get_bundle_path(_hash_source_files(source_files))
+        try:
+            with open(bundle_path, encoding="utf-8") as bundle_file:
+                documents = json.load(bundle_file)
+        except (OSError, ValueError):
+            documents = _compile_documents(source_files)
+            try:
+                _write_bundle(bundle_path, documents)
+            except OSError:
+                logger.warning(f"Failed to write the YAML bundle {bundle_path}, it is compiled by every process")
+    except Exception:
+        logger.exception("Failed to load the YAML bundle, parsing YAML files instead")
+        return {}
+
+    return {str(API_ROOT / name): document for name, document in documents.items()}
+
+
+def _get_bundle_source_files() -> list[Path]:
+    return sorted(
+        Path(root, file_name)
+        for source_dir in BUNDLE_SOURCE_DIRS
+        for root, _, file_names in os.walk(source_dir)
+        for file_name in file_names
+        if file_name.endswith(".yaml")
+    )
+
+
+def _hash_source_files(source_files: list[Path]) -> str:
+    source_hash = hashlib.sha256(str(BUNDLE_FORMAT_VERSION).encode())
+    for source_file in source_files:
+        source_hash.update(str(source_file.relative_to(API_ROOT)).encode())
+        source_hash.update(source_file.read_bytes())
+    return source_hash.hexdigest()
+
+
+def _get_bundle_path(source_hash: str) -> str:
+    return os.path.join(dify_config.YAML_BUNDLE_DIR or tempfile.gettempdir(), f"{BUNDLE_FILE_PREFIX}{source_hash}.json")
+
+
+def _compile_documents(source_files: list[Path]) -> dict[str, str]:
+    """
+    Parse YAML files to JSON documents keyed by their path relative to the api directory.
+
+    Files which fail to parse or hold values JSON can not represent are left out and parsed when loaded,
+    so they behave exactly as without the bundle.
+    """
+    documents = {}
+    for source_file in source_files:
+        try:
+            with open(source_file, encoding="utf-8") as yaml_file:
+                yaml_content = _safe_load(yaml_file)
+            document = json.dumps(yaml_content, ensure_ascii=False)
+            if json.loads(document) != yaml_content:
+                continue
+        except Exception:
+            continue
+        documents[str(source_file.relative_to(API_ROOT))] = document
+    return documents
+
+
+def _write_bundle(bundle_path: str, documents: dict[str, str]) -> None:
+    """
+    Write a bundle atomically, processes compiling the same bundle at the same time write the same content.
+    Bundles of older YAML files in the same directory are removed.
+    """
+    bundle_dir = os.path.dirname(bundle_path)
+    os.makedirs(bundle_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=bundle_dir, suffix=".tmp", delete=False) as temp_file:
+        json.dump(documents, temp_file, ensure_ascii=False)
+    os.replace(temp_file.name, bundle_path)
+
+    for file_name in os.listdir(bundle_dir):
+        stale_path = os.path.join(bundle_dir, file_name)
+        if file_name.startswith(BUNDLE_FILE_PREFIX) and file_name.endswith(".json") and stale_path != bundle_path:
+            try:
+                os.remove(stale_path)
+            except OSError:
+                pass
@@ -1,9 +1,9 @@
 import re
 from collections import defaultdict
 from collections.abc import Mapping, Sequence
-from typing import Any, Union
+from typing import Any, Optional, Union
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 
 from core.file import File, FileAttribute, file_manager
 from core.variables import Segment, SegmentGroup, Variable
@@ -43,6 +43,11 @@ class VariablePool(BaseModel):
         description="Conversation variables.",
         default_factory=list,
     )
+    # A child pool created by `create_child` only holds its own writes and reads through to its parent,
+    # removals in the child are recorded so that they hide the parent's variables.
+    _parent: Optional["VariablePool"] = PrivateAttr(default=None)
+    _removed_node_ids: set[str] = PrivateAttr(default_factory=set)
+    _removed_keys: set[tuple[str, int]] = PrivateAttr(default_factory=set)
 
     def __init__(
         self,
@@ -105,6 +110,7 @@ class VariablePool(BaseModel):
 
         hash_key = hash(tuple(selector[1:]))
         self.variable_dictionary[selector[0]][hash_key] = variable
+        self._removed_keys.discard((selector[0], hash_key))
 
     def get(self, selector: Sequence[str], /) -> Segment | None:
         """
@@ -123,7 +129,7 @@ class VariablePool(BaseModel):
             return None
 
         hash_key = hash(tuple(selector[1:]))
-        value = self.variable_dictionary[selector[0]].get(hash_key)
+        value = self._get_variable(selector[0], hash_key)
 
         if value is None:
             selector, attr = selector[:-1], selector[-1]
@@ -153,9 +159,42 @@ class VariablePool(BaseModel):
             return
         if len(selector) == 1:
             self.variable_dictionary[selector[0]] = {}
+            if self._parent is not None:
+                self._removed_node_ids.add(selector[0])
             return
         hash_key = hash(tuple(selector[1:]))
         self.variable_dictionary[selector[0]].pop(hash_key, None)
+        if self._parent is not None:
+            self._removed_keys.add((selector[0], hash_key))
+
+    def create_child(self) -> "VariablePool":
+        """
+        Create a copy-on-write child of the variable pool.
+
+        The child starts empty and reads through to this pool for variables it doesn't hold, so creating it
+        and writing to it costs O(writes) instead of copying the whole pool. This pool must not be changed
+        for variables the child still reads while the child is in use.
+
+        Returns:
+            VariablePool: The child variable pool.
+        """
+        child = VariablePool.model_construct(
+            variable_dictionary=defaultdict(dict),
+            user_inputs=self.user_inputs,
+            system_variables=self.system_variables,
+            environment_variables=self.environment_variables,
+            conversation_variables=self.conversation_variables,
+        )
+        child._parent = self
+        return child
+
+    def _get_variable(self, node_id: str, hash_key: int) -> Segment | None:
+        value = self.variable_dictionary.get(node_id, {}).get(hash_key)
+        if value is not None or self._parent is None:
+            return value
+        if node_id in self._removed_node_ids or (node_id, hash_key) in self._removed_keys:
+            return None
+        return self._parent._get_variable(node_id, hash_key)
 
     def convert_template(self, template: str, /):
         parts = VARIABLE_PATTERN.split(template)
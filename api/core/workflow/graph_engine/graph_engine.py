@@ -3,8 +3,8 @@ import queue
 import time
 import uuid
 from collections.abc import Generator, Mapping
-from concurrent.futures import ThreadPoolExecutor, wait
-from copy import copy, deepcopy
+from concurrent.futures import Future, wait
+from copy import copy
 from datetime import UTC, datetime
 from typing import Any, Optional, cast
 
@@ -38,6 +38,7 @@ from core.workflow.graph_engine.entities.graph import Graph, GraphEdge
 from core.workflow.graph_engine.entities.graph_init_params import GraphInitParams
 from core.workflow.graph_engine.entities.graph_runtime_state import GraphRuntimeState
 from core.workflow.graph_engine.entities.runtime_route_state import RouteNodeState
+from core.workflow.graph_engine.thread_pool import workflow_thread_pool
 from core.workflow.nodes import NodeType
 from core.workflow.nodes.answer.answer_stream_processor import AnswerStreamProcessor
 from core.workflow.nodes.answer.base_stream_processor import StreamProcessor
@@ -54,24 +55,32 @@ from models.workflow import WorkflowNodeExecutionStatus, WorkflowType
 logger = logging.getLogger(__name__)
 
 
-class GraphEngineThreadPool(ThreadPoolExecutor):
+class GraphEngineThreadPool:
+    """
+    Thread pool of a workflow run, tasks are executed by the process-wide workflow thread pool
+    """
+
     def __init__(
         self,
-        max_workers=None,
-        thread_name_prefix="",
-        initializer=None,
-        initargs=(),
-        max_submit_count=dify_config.MAX_SUBMIT_COUNT,
+        tenant_id: str,
+        max_workers: int = 10,
+        max_submit_count: int = dify_config.MAX_SUBMIT_COUNT,
     ) -> None:
-        super().__init__(max_workers, thread_name_prefix, initializer, initargs)
+        self.tenant_id = tenant_id
+        self.max_workers = max_workers
         self.max_submit_count = max_submit_count
         self.submit_count = 0
+        # updated by the workflow thread pool
+        self.running_count = 0
 
-    def submit(self, fn, /, *args, **kwargs):
+    def submit(self, fn, /, *args, **kwargs) -> Future:
         self.submit_count += 1
-        self.check_is_full()
-
-        return super().submit(fn, *args, **kwargs)
+        try:
+            self.check_is_full()
+            return workflow_thread_pool.submit(self, fn, *args, **kwargs)
+        except ValueError:
+            self.submit_count -= 1
+            raise
 
     def task_done_callback(self, future):
         self.submit_count -= 1
@@ -114,7 +123,9 @@ class GraphEngine:
             self.is_main_thread_pool = False
         else:
             self.thread_pool = GraphEngineThreadPool(
-                max_workers=thread_pool_max_workers, max_submit_count=thread_pool_max_submit_count
+                tenant_id=tenant_id,
+                max_workers=thread_pool_max_workers,
+                max_submit_count=thread_pool_max_submit_count,
             )
             self.thread_pool_id = str(uuid.uuid4())
             self.is_main_thread_pool = True
@@ -848,11 +859,11 @@ class GraphEngine:
     def create_copy(self):
         """
         create a graph engine copy
-        :return: with a new variable pool instance of graph engine
+        :return: with a copy-on-write child of the variable pool of graph engine
         """
         new_instance = copy(self)
         new_instance.graph_runtime_state = copy(self.graph_runtime_state)
-        new_instance.graph_runtime_state.variable_pool = deepcopy(self.graph_runtime_state.variable_pool)
+        new_instance.graph_runtime_state.variable_pool = self.graph_runtime_state.variable_pool.create_child()
         return new_instance
 
     def _handle_continue_on_error(
@@ -0,0 +1,200 @@
+import contextvars
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+from configs import dify_config
+
+if TYPE_CHECKING:
+    from core.workflow.graph_engine.graph_engine import GraphEngineThreadPool
+
+
+@dataclass
+class _WorkflowTask:
+    run_pool: "GraphEngineThreadPool"
+    fn: Callable
+    args: tuple
+    kwargs: dict
+    future: Future = field(default_factory=Future)
+    submitted_at: float = field(default_factory=time.perf_counter)
+    # tasks run in the context of their submitter, like the state scoped to the workflow run
+    context: contextvars.Context = field(default_factory=contextvars.copy_context)
+
+
+class WorkflowThreadPool:
+    """
+    Process-wide thread pool shared by all workflow runs.
+
+    Tasks are queued and dispatched with fair share between tenants: workers are handed out round-robin
+    over tenants, a tenant can't hold more than `max_workers_per_tenant` workers and a run can't hold more
+    than the `max_workers` of its GraphEngineThreadPool.
+
+    Tasks submitted from a worker of this pool, e.g. nested parallel branches or an iteration inside a
+    parallel branch, are never queued: their parent holds a worker while waiting on them, so waiting for
+    a free worker could deadlock the pool. They are started on a separate pool of `max_nested_workers`
+    threads when it and their run have a free worker, and run on the submitting thread otherwise.
+    """
+
+    def __init__(
+        self, max_workers: int, max_workers_per_tenant: int, max_queue_size: int, max_nested_workers: int
+    ) -> None:
+        self.max_workers = max_workers
+        self.max_workers_per_tenant = max_workers_per_tenant
+        self.max_queue_size = max_queue_size
+        self.max_nested_workers = max_nested_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="workflow_thread_pool")
+        self._nested_executor = ThreadPoolExecutor(
+            max_workers=max_nested_workers, thread_name_prefix="workflow_thread_pool_nested"
+        )
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # pending tasks per tenant, the order of tenants is the round-robin order
+        self._queues: OrderedDict[str, deque[_WorkflowTask]] = OrderedDict()
+        self._queued_count = 0
+        self._running_count = 0
+        self._nested_running_count = 0
+        self._nested_inline_count = 0
+        self._tenant_running_count: defaultdict[str, int] = defaultdict(int)
+        self._dispatched_count = 0
+        self._rejected_count = 0
+        self._total_wait_time = 0.0
+        self._max_wait_time = 0.0
+
+    def submit(self, run_pool: "GraphEngineThreadPool", fn: Callable, /, *args: Any, **kwargs: Any) -> Future:
+        """
+        Submit a task of a workflow run
+        :param run_pool: thread pool of the workflow run
+        :param fn: task function
+        :return: future of the task
+        """
+        task = _WorkflowTask(run_pool=run_pool, fn=fn, args=args, kwargs=kwargs)
+
+        if getattr(self._local, "in_worker", False):
+            self._submit_nested(task)
+            return task.future
+
+        with self._lock:
+            if self._queued_count >= self.max_queue_size:
+                self._rejected_count += 1
+                raise ValueError(f"Max queue size {self.max_queue_size} of workflow thread pool reached.")
+
+            self._queues.setdefault(run_pool.tenant_id, deque()).append(task)
+            self._queued_count += 1
+            self._dispatch()
+
+        return task.future
+
+    def _submit_nested(self, task: _WorkflowTask) -> None:
+        with self._lock:
+            start = (
+                self._nested_running_count < self.max_nested_workers
+                and task.run_pool.running_count < task.run_pool.max_workers
+            )
+            if start:
+                self._nested_running_count += 1
+                task.run_pool.running_count += 1
+            else:
+                self._nested_inline_count += 1
+
+        if start:
+            self._nested_executor.submit(self._run_task, task, True)
+        else:
+            # the submitting thread would only wait for the task, running it there adds no thread
+            self._run_inline(task)
+
+    def get_metrics(self) -> dict[str, Any]:
+        """
+        Get metrics of the thread pool
+        """
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "running": self._running_count,
+                "nested_running": self._nested_running_count,
+                "nested_inline": self._nested_inline_count,
+                "queue_depth": self._queued_count,
+                "tenants_queued": len(self._queues),
+                "dispatched": self._dispatched_count,
+                "rejected": self._rejected_count,
+                "avg_wait_time": self._total_wait_time / self._dispatched_count if self._dispatched_count else 0.0,
+                "max_wait_time": self._max_wait_time,
+            }
+
+    def _dispatch(self) -> None:
+        """
+        Start queued tasks while workers are available, must be called with the lock held
+        """
+        while self._running_count < self.max_workers and self._queues:
+            task: _WorkflowTask | None = self._next_task()
+            if task is None:
+                return
+
+            wait_time = time.perf_counter() - task.submitted_at
+            self._total_wait_time += wait_time
+            self._max_wait_time = max(self._max_wait_time, wait_time)
+            self._dispatched_count += 1
+            self._running_count += 1
+            self._tenant_running_count[task.run_pool.tenant_id] += 1
+            task.run_pool.running_count += 1
+            self._executor.submit(self._run_task, task, False)
+
+    def _next_task(self) -> _WorkflowTask | None:
+        for tenant_id in list(self._queues):
+            if self._tenant_running_count[tenant_id] >= self.max_workers_per_tenant:
+                continue
+
+            tasks = self._queues[tenant_id]
+            task = next((t for t in tasks if t.run_pool.running_count < t.run_pool.max_workers), None)
+            if task is None:
+                continue
+
+            tasks.remove(task)
+            self._queued_count -= 1
+            if tasks:
+                # let other tenants go first next time
+                self._queues.move_to_end(tenant_id)
+            else:
+                del self._queues[tenant_id]
+            return task
+
+        return None
+
+    def _run_inline(self, task: _WorkflowTask) -> None:
+        in_worker = getattr(self._local, "in_worker", False)
+        self._local.in_worker = True
+        try:
+            if task.future.set_running_or_notify_cancel():
+                try:
+                    task.future.set_result(task.context.run(task.fn, *task.args, **task.kwargs))
+                except BaseException as e:
+                    task.future.set_exception(e)
+        finally:
+            self._local.in_worker = in_worker
+
+    def _run_task(self, task: _WorkflowTask, nested: bool) -> None:
+        try:
+            self._run_inline(task)
+        finally:
+            with self._lock:
+                task.run_pool.running_count -= 1
+                if nested:
+                    self._nested_running_count -= 1
+                else:
+                    self._running_count -= 1
+                    tenant_id = task.run_pool.tenant_id
+                    self._tenant_running_count[tenant_id] -= 1
+                    if not self._tenant_running_count[tenant_id]:
+                        del self._tenant_running_count[tenant_id]
+                self._dispatch()
+
+
+workflow_thread_pool = WorkflowThreadPool(
+    max_workers=dify_config.WORKFLOW_THREAD_POOL_MAX_WORKERS,
+    max_workers_per_tenant=dify_config.WORKFLOW_THREAD_POOL_MAX_WORKERS_PER_TENANT,
+    max_queue_size=dify_config.WORKFLOW_THREAD_POOL_MAX_QUEUE_SIZE,
+    max_nested_workers=dify_config.WORKFLOW_THREAD_POOL_MAX_NESTED_WORKERS,
+)
@@ -10,6 +10,7 @@ from core.entities.provider_entities import QuotaUnit
 from core.errors.error import ModelCurrentlyNotSupportError, ProviderTokenNotInitError, QuotaExceededError
 from core.file import FileType, file_manager
 from core.helper.code_executor import CodeExecutor, CodeLanguage
+from core.helper.provider_usage import deduct_provider_quota
 from core.memory.token_buffer_memory import TokenBufferMemory
 from core.model_manager import ModelInstance, ModelManager
 from core.model_runtime.entities import (
@@ -58,7 +59,7 @@ from core.workflow.nodes.event import (
 from core.workflow.utils.variable_template_parser import VariableTemplateParser
 from extensions.ext_database import db
 from models.model import Conversation
-from models.provider import Provider, ProviderType
+from models.provider import ProviderType
 from models.workflow import WorkflowNodeExecutionStatus
 
 from .entities import (
@@ -738,14 +739,12 @@ class LLMNode(BaseNode[LLMNodeData]):
                 used_quota = 1
 
         if used_quota is not None and system_configuration.current_quota_type is not None:
-            db.session.query(Provider).filter(
-                Provider.tenant_id == tenant_id,
-                Provider.provider_name == model_instance.provider,
-                Provider.provider_type == ProviderType.SYSTEM.value,
-                Provider.quota_type == system_configuration.current_quota_type.value,
-                Provider.quota_limit > Provider.quota_used,
-            ).update({"quota_used": Provider.quota_used + used_quota})
-            db.session.commit()
+            deduct_provider_quota(
+                tenant_id=tenant_id,
+                provider_name=model_instance.provider,
+                quota_type=system_configuration.current_quota_type.value,
+                used_quota=used_quota,
+            )
 
     @classmethod
     def _extract_variable_selector_to_variable_mapping(
@@ -70,6 +70,8 @@ def init_app(app: DifyApp) -> Celery:
         "schedule.update_tidb_serverless_status_task",
         "schedule.clean_messages",
         "schedule.mail_clean_document_notify_task",
+        "schedule.recover_workflow_node_executions_task",
+        "schedule.flush_provider_usage_task",
     ]
     day = dify_config.CELERY_BEAT_SCHEDULER_TIME
     beat_schedule = {
@@ -99,6 +101,16 @@ def init_app(app: DifyApp) -> Celery:
             "schedule": crontab(minute="0", hour="10", day_of_week="1"),
         },
     }
+    if dify_config.PROVIDER_USAGE_BATCH_ACCOUNTING_ENABLED:
+        beat_schedule["flush_provider_usage_task"] = {
+            "task": "schedule.flush_provider_usage_task.flush_provider_usage_task",
+            "schedule": timedelta(seconds=dify_config.PROVIDER_USAGE_FLUSH_INTERVAL),
+        }
+    if dify_config.WORKFLOW_NODE_EXECUTION_PERSISTENCE_MODE == "buffered":
+        beat_schedule["recover_workflow_node_executions_task"] = {
+            "task": "schedule.recover_workflow_node_executions_task.recover_workflow_node_executions_task",
+            "schedule": timedelta(minutes=5),
+        }
     celery_app.conf.update(beat_schedule=beat_schedule, imports=imports)
 
     return celery_app
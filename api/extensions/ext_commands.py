@@ -4,9 +4,14 @@ from dify_app import DifyApp
 def init_app(app: DifyApp):
     from commands import (
         add_qdrant_doc_id_index,
+        clean_embedding_cache,
+        clean_messages,
+        compile_yaml_bundle,
         convert_to_agent_apps,
         create_tenant,
         fix_app_site_missing,
+        migrate_embedding_format,
+        migrate_keyword_inverted_index,
         reset_email,
         reset_encrypt_key_pair,
         reset_password,
@@ -24,6 +29,11 @@ def init_app(app: DifyApp):
         create_tenant,
         upgrade_db,
         fix_app_site_missing,
+        migrate_embedding_format,
+        migrate_keyword_inverted_index,
+        compile_yaml_bundle,
+        clean_messages,
+        clean_embedding_cache,
     ]
     for cmd in cmds_to_register:
         app.cli.add_command(cmd)
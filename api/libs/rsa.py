@@ -1,5 +1,8 @@
 import hashlib
+import threading
+import time
 
+from cachetools import LRUCache
 from Crypto.Cipher import AES
 from Crypto.PublicKey import RSA
 from Crypto.Random import get_random_bytes
@@ -8,6 +11,11 @@ from extensions.ext_redis import redis_client
 from extensions.ext_storage import storage
 from libs import gmpy2_pkcs10aep_cipher
 
+# private keys are kept for as long in process as in redis, as (expires_at, rsa_key, cipher_rsa) by tenant id
+PRIVATE_KEY_CACHE_TTL = 120
+_decrypt_decoding_cache: LRUCache = LRUCache(maxsize=1000)
+_decrypt_decoding_cache_lock = threading.Lock()
+
 
 def generate_key_pair(tenant_id):
     private_key = RSA.generate(2048)
@@ -19,6 +27,8 @@ def generate_key_pair(tenant_id):
     filepath = "privkeys/{tenant_id}".format(tenant_id=tenant_id) + "/private.pem"
 
     storage.save(filepath, pem_private)
+    with _decrypt_decoding_cache_lock:
+        _decrypt_decoding_cache.pop(tenant_id, None)
 
     return pem_public.decode()
 
@@ -46,6 +56,12 @@ def encrypt(text, public_key):
 
 
 def get_decrypt_decoding(tenant_id):
+    # importing the key is far slower than decrypting with it, reuse the parsed key
+    with _decrypt_decoding_cache_lock:
+        cached = _decrypt_decoding_cache.get(tenant_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1], cached[2]
+
     filepath = "privkeys/{tenant_id}".format(tenant_id=tenant_id) + "/private.pem"
 
     cache_key = "tenant_privkey:{hash}".format(hash=hashlib.sha3_256(filepath.encode()).hexdigest())
@@ -56,10 +72,12 @@ def get_decrypt_decoding(tenant_id):
         except FileNotFoundError:
             raise PrivkeyNotFoundError("Private key not found, tenant_id: {tenant_id}".format(tenant_id=tenant_id))
 
-        redis_client.setex(cache_key, 120, private_key)
+        redis_client.setex(cache_key, PRIVATE_KEY_CACHE_TTL, private_key)
 
     rsa_key = RSA.import_key(private_key)
     cipher_rsa = gmpy2_pkcs10aep_cipher.new(rsa_key)
+    with _decrypt_decoding_cache_lock:
+        _decrypt_decoding_cache[tenant_id] = (time.monotonic() + PRIVATE_KEY_CACHE_TTL, rsa_key, cipher_rsa)
 
     return rsa_key, cipher_rsa
 
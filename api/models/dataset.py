@@ -9,8 +9,9 @@ import pickle
 import re
 import time
 from json import JSONDecodeError
-from typing import Any, cast
+from typing import Any, Union
 
+import numpy as np
 from sqlalchemy import func
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped
@@ -749,6 +750,37 @@ class DatasetKeywordTable(db.Model):  # type: ignore[name-defined]
                 return None
 
 
+class DatasetKeywordPosting(db.Model):  # type: ignore[name-defined]
+    """
+    Inverted keyword index of a dataset, one row per keyword and segment.
+    """
+
+    __tablename__ = "dataset_keyword_postings"
+    __table_args__ = (
+        db.PrimaryKeyConstraint("dataset_id", "keyword", "index_node_id", name="dataset_keyword_posting_pkey"),
+        db.Index("dataset_keyword_posting_node_idx", "dataset_id", "index_node_id"),
+    )
+
+    dataset_id = db.Column(StringUUID, nullable=False)
+    keyword = db.Column(db.String(255), nullable=False)
+    index_node_id = db.Column(db.String(255), nullable=False)
+    # number of keywords of the segment, used for BM25 length normalization
+    length = db.Column(db.Integer, nullable=False, server_default=db.text("0"))
+
+
+class DatasetKeywordStats(db.Model):  # type: ignore[name-defined]
+    """
+    Corpus statistics of the inverted keyword index of a dataset, maintained incrementally.
+    """
+
+    __tablename__ = "dataset_keyword_stats"
+    __table_args__ = (db.PrimaryKeyConstraint("dataset_id", name="dataset_keyword_stats_pkey"),)
+
+    dataset_id = db.Column(StringUUID, nullable=False)
+    segment_count = db.Column(db.Integer, nullable=False, server_default=db.text("0"))
+    total_length = db.Column(db.BigInteger, nullable=False, server_default=db.text("0"))
+
+
 class Embedding(db.Model):  # type: ignore[name-defined]
     __tablename__ = "embeddings"
     __table_args__ = (
@@ -766,11 +798,37 @@ class Embedding(db.Model):  # type: ignore[name-defined]
     created_at = db.Column(db.DateTime, nullable=False, server_default=func.current_timestamp())
     provider_name = db.Column(db.String(255), nullable=False, server_default=db.text("''::character varying"))
 
-    def set_embedding(self, embedding_data: list[float]):
-        self.embedding = pickle.dumps(embedding_data, protocol=pickle.HIGHEST_PROTOCOL)
+    # binary layout: magic prefix, format version byte, then little-endian float32 values
+    EMBEDDING_FORMAT_MAGIC = b"\x00VEC"
+    EMBEDDING_FORMAT_VERSION = 1
+
+    def set_embedding(self, embedding_data: Union[list[float], np.ndarray]):
+        self.embedding = self.encode_embedding(embedding_data)
 
-    def get_embedding(self) -> list[float]:
-        return cast(list[float], pickle.loads(self.embedding))
+    def get_embedding(self) -> np.ndarray:
+        return self.decode_embedding(self.embedding)
+
+    @classmethod
+    def encode_embedding(cls, embedding_data: Union[list[float], np.ndarray]) -> bytes:
+        header = cls.EMBEDDING_FORMAT_MAGIC + bytes([cls.EMBEDDING_FORMAT_VERSION])
+        return header + np.asarray(embedding_data, dtype="<f4").tobytes()
+
+    @classmethod
+    def decode_embedding(cls, data: bytes) -> np.ndarray:
+        """
+        Decode a stored embedding into a read-only float32 array without copying the payload.
+        Rows written before the binary format was introduced are pickled lists and are decoded transparently.
+        """
+        if cls.is_legacy_embedding(data):
+            return np.asarray(pickle.loads(data), dtype=np.float32)
+        version = data[len(cls.EMBEDDING_FORMAT_MAGIC)]
+        if version != cls.EMBEDDING_FORMAT_VERSION:
+            raise ValueError(f"Unsupported embedding format version: {version}")
+        return np.frombuffer(data, dtype="<f4", offset=len(cls.EMBEDDING_FORMAT_MAGIC) + 1)
+
+    @classmethod
+    def is_legacy_embedding(cls, data: bytes) -> bool:
+        return bytes(data[: len(cls.EMBEDDING_FORMAT_MAGIC)]) != cls.EMBEDDING_FORMAT_MAGIC
 
 
 class DatasetCollectionBinding(db.Model):  # type: ignore[name-defined]
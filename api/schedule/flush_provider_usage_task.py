@@ -0,0 +1,20 @@
+import time
+
+import click
+
+import app
+from core.helper.provider_usage import flush_provider_usage
+
+
+@app.celery.task(queue="dataset")
+def flush_provider_usage_task():
+    start_at = time.perf_counter()
+    try:
+        updated = flush_provider_usage()
+    except Exception as e:
+        click.echo(click.style(f"Error: {e}", fg="red"))
+        return
+
+    if updated:
+        end_at = time.perf_counter()
+        click.echo(click.style(f"Flushed usage of {updated} providers, latency: {end_at - start_at}", fg="green"))
@@ -0,0 +1,22 @@
+import time
+
+import click
+
+import app
+from core.app.task_pipeline.workflow_node_execution_buffer import recover_orphaned_journals
+
+
+@app.celery.task(queue="dataset")
+def recover_workflow_node_executions_task():
+    click.echo(click.style("Start recover buffered workflow node executions.", fg="green"))
+    start_at = time.perf_counter()
+    try:
+        recovered = recover_orphaned_journals()
+    except Exception as e:
+        click.echo(click.style(f"Error: {e}", fg="red"))
+        return
+
+    end_at = time.perf_counter()
+    click.echo(
+        click.style(f"Recovered node executions of {recovered} workflow runs, latency: {end_at - start_at}", fg="green")
+    )
@@ -0,0 +1,176 @@
+import datetime
+import logging
+import time
+from typing import Optional
+
+from sqlalchemy import delete, func, select, tuple_
+
+from configs import dify_config
+from extensions.ext_database import db
+from extensions.ext_redis import redis_client
+from models.dataset import Embedding
+from models.model import (
+    App,
+    Message,
+    MessageAgentThought,
+    MessageAnnotation,
+    MessageChain,
+    MessageFeedback,
+    MessageFile,
+)
+from models.web import SavedMessage
+from services.feature_service import FeatureService
+
+logger = logging.getLogger(__name__)
+
+# rows referencing a message, deleted before the message
+MESSAGE_RELATED_MODELS = (
+    MessageFeedback,
+    MessageAnnotation,
+    MessageChain,
+    MessageAgentThought,
+    MessageFile,
+    SavedMessage,
+)
+PLAN_CACHE_TTL = 600
+
+
+class RetentionService:
+    """
+    Deletes the rows older than the retention of their plan, batch by batch.
+
+    Batches are paginated by (created_at, id), so every batch is one index range scan whatever the number of rows
+    already deleted or kept, and all the rows of a table in a batch are deleted with one statement. Batches are
+    committed one by one with RETENTION_BATCH_SLEEP_MS between them, to bound lock time and replication lag.
+    A dry run counts the rows which would be deleted instead of deleting them.
+    """
+
+    @classmethod
+    def clean_messages(
+        cls,
+        dry_run: bool = False,
+        batch_size: int = dify_config.RETENTION_BATCH_SIZE,
+        batch_sleep_ms: int = dify_config.RETENTION_BATCH_SLEEP_MS,
+    ) -> dict[str, int]:
+        """
+        Delete the messages of sandbox plan tenants older than PLAN_SANDBOX_CLEAN_MESSAGE_DAY_SETTING,
+        with the rows referencing them
+        :return: number of deleted rows, or rows to delete in a dry run, by table
+        """
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=dify_config.PLAN_SANDBOX_CLEAN_MESSAGE_DAY_SETTING)
+        stats = {model.__tablename__: 0 for model in (*MESSAGE_RELATED_MODELS, Message)}
+        # tenants of the apps and plans of the tenants seen in this run
+        app_tenants: dict[str, Optional[str]] = {}
+        tenant_plans: dict[str, str] = {}
+        scanned = 0
+        cursor: Optional[tuple[datetime.datetime, str]] = None
+        start_at = time.perf_counter()
+        while True:
+            stmt = select(Message.id, Message.app_id, Message.created_at).where(Message.created_at < cutoff)
+            if cursor:
+                stmt = stmt.where(tuple_(Message.created_at, Message.id) < cursor)
+            rows = db.session.execute(
+                stmt.order_by(Message.created_at.desc(), Message.id.desc()).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            cursor = (rows[-1].created_at, rows[-1].id)
+            scanned += len(rows)
+
+            missing_app_ids = {row.app_id for row in rows if row.app_id not in app_tenants}
+            if missing_app_ids:
+                app_tenants.update(dict.fromkeys(missing_app_ids))
+                apps = db.session.execute(select(App.id, App.tenant_id).where(App.id.in_(missing_app_ids)))
+                app_tenants.update({app.id: app.tenant_id for app in apps})
+
+            message_ids = []
+            for row in rows:
+                tenant_id = app_tenants[row.app_id]
+                # messages of deleted apps are removed with the app
+                if tenant_id and cls._get_plan(tenant_id, tenant_plans) == "sandbox":
+                    message_ids.append(row.id)
+
+            if message_ids:
+                for model in (*MESSAGE_RELATED_MODELS, Message):
+                    column = Message.id if model is Message else model.message_id
+                    stats[model.__tablename__] += cls._delete_rows(model, column.in_(message_ids), dry_run)
+                if not dry_run:
+                    db.session.commit()
+
+            cls._log_progress("messages", scanned, stats[Message.__tablename__], start_at, dry_run)
+            if batch_sleep_ms:
+                time.sleep(batch_sleep_ms / 1000)
+
+        return stats
+
+    @classmethod
+    def clean_embedding_cache(
+        cls,
+        dry_run: bool = False,
+        batch_size: int = dify_config.RETENTION_BATCH_SIZE,
+        batch_sleep_ms: int = dify_config.RETENTION_BATCH_SLEEP_MS,
+    ) -> dict[str, int]:
+        """
+        Delete the cached embeddings older than PLAN_SANDBOX_CLEAN_DAY_SETTING
+        :return: number of deleted rows, or rows to delete in a dry run, by table
+        """
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=dify_config.PLAN_SANDBOX_CLEAN_DAY_SETTING)
+        if dry_run:
+            count = db.session.scalar(select(func.count()).select_from(Embedding).where(Embedding.created_at < cutoff))
+            return {Embedding.__tablename__: count or 0}
+
+        deleted = 0
+        cursor: Optional[tuple[datetime.datetime, str]] = None
+        start_at = time.perf_counter()
+        while True:
+            stmt = select(Embedding.id, Embedding.created_at).where(Embedding.created_at < cutoff)
+            if cursor:
+                stmt = stmt.where(tuple_(Embedding.created_at, Embedding.id) < cursor)
+            rows = db.session.execute(
+                stmt.order_by(Embedding.created_at.desc(), Embedding.id.desc()).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            cursor = (rows[-1].created_at, rows[-1].id)
+
+            deleted += cls._delete_rows(Embedding, Embedding.id.in_([row.id for row in rows]), dry_run=False)
+            db.session.commit()
+
+            cls._log_progress("embeddings", deleted, deleted, start_at, dry_run=False)
+            if batch_sleep_ms:
+                time.sleep(batch_sleep_ms / 1000)
+
+        return {Embedding.__tablename__: deleted}
+
+    @staticmethod
+    def _delete_rows(model, condition, dry_run: bool) -> int:
+        if dry_run:
+            return db.session.scalar(select(func.count()).select_from(model).where(condition)) or 0
+        return db.session.execute(delete(model).where(condition)).rowcount
+
+    @staticmethod
+    def _get_plan(tenant_id: str, tenant_plans: dict[str, str]) -> str:
+        """
+        Get the plan of a tenant, cached for the run and in Redis for the other runs and workers
+        """
+        plan = tenant_plans.get(tenant_id)
+        if plan is not None:
+            return plan
+
+        features_cache_key = f"features:{tenant_id}"
+        plan_cache = redis_client.get(features_cache_key)
+        if plan_cache is None:
+            plan = FeatureService.get_features(tenant_id).billing.subscription.plan
+            redis_client.setex(features_cache_key, PLAN_CACHE_TTL, plan)
+        else:
+            plan = plan_cache.decode()
+        tenant_plans[tenant_id] = plan
+        return plan
+
+    @staticmethod
+    def _log_progress(name: str, scanned: int, deleted: int, start_at: float, dry_run: bool) -> None:
+        elapsed = time.perf_counter() - start_at
+        logger.info(
+            f"Retention of {name}: scanned {scanned} rows, {'would delete' if dry_run else 'deleted'} {deleted}"
+            f" in {elapsed:.1f}s ({deleted / max(elapsed, 1e-6):.0f} rows/s)"
+        )
@@ -0,0 +1,122 @@
+"""
+Recall and latency benchmark of PGVector searches by vector type, HNSW ef_search and document filter.
+
+Needs a local Postgres with the pgvector extension, e.g. the `pgvector` service of the docker compose file,
+connection settings are read from the PGVECTOR_* settings. Run from the `api` directory:
+
+    python -m tests.benchmarks.pgvector_benchmark
+"""
+
+import time
+import uuid
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+from configs import dify_config
+from core.rag.datasource.vdb.pgvector.pgvector import PGVector, PGVectorConfig
+from core.rag.models.document import Document
+
+VECTOR_COUNT = 20000
+QUERY_COUNT = 100
+EMBEDDING_DIMENSION = 768
+DOCUMENT_COUNT = 100
+TOP_K = 10
+BATCH_SIZE = 1000
+EF_SEARCH_VALUES = [10, 40, 100, 200]
+VECTOR_TYPES = ["vector", "halfvec"]
+
+
+def build_config(vector_type: str) -> PGVectorConfig:
+    return PGVectorConfig(
+        host=dify_config.PGVECTOR_HOST or "localhost",
+        port=dify_config.PGVECTOR_PORT,
+        user=dify_config.PGVECTOR_USER or "postgres",
+        password=dify_config.PGVECTOR_PASSWORD or "difyai123456",
+        database=dify_config.PGVECTOR_DATABASE or "dify",
+        min_connection=1,
+        max_connection=1,
+        vector_type=vector_type,
+    )
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def exact_neighbors(vectors: np.ndarray, query: np.ndarray, candidates: np.ndarray) -> set[int]:
+    scores = vectors[candidates] @ query
+    return set(candidates[np.argsort(-scores)[:TOP_K]].tolist())
+
+
+def measure(vector: PGVector, queries: np.ndarray, expected: list[set[int]], **kwargs) -> tuple[float, float, float]:
+    """
+    :return: mean and p95 latency in ms, and mean recall of the searches
+    """
+    latencies = []
+    recalls = []
+    for query, expected_neighbors in zip(queries, expected):
+        started_at = time.perf_counter()
+        docs = vector.search_by_vector(query.tolist(), top_k=TOP_K, **kwargs)
+        latencies.append((time.perf_counter() - started_at) * 1000)
+        found = {doc.metadata["index"] for doc in docs}
+        recalls.append(len(found & expected_neighbors) / len(expected_neighbors))
+    return float(np.mean(latencies)), float(np.percentile(latencies, 95)), float(np.mean(recalls))
+
+
+def benchmark(vector_type: str, vectors: np.ndarray, queries: np.ndarray) -> None:
+    vector = PGVector(f"benchmark_{uuid.uuid4().hex}", build_config(vector_type))
+    document_ids = np.arange(VECTOR_COUNT) % DOCUMENT_COUNT
+    documents = [
+        Document(
+            page_content=f"text {i}",
+            metadata={"doc_id": str(uuid.uuid4()), "document_id": f"document-{document_ids[i]}", "index": i},
+        )
+        for i in range(VECTOR_COUNT)
+    ]
+    try:
+        started_at = time.perf_counter()
+        vector.create(documents[:BATCH_SIZE], vectors[:BATCH_SIZE].tolist())
+        for start in range(BATCH_SIZE, VECTOR_COUNT, BATCH_SIZE):
+            vector.add_texts(documents[start : start + BATCH_SIZE], vectors[start : start + BATCH_SIZE].tolist())
+        print(f"{vector_type}: indexed {VECTOR_COUNT} vectors in {time.perf_counter() - started_at:.1f}s")
+
+        all_candidates = np.arange(VECTOR_COUNT)
+        expected = [exact_neighbors(vectors, query, all_candidates) for query in queries]
+        for ef_search in EF_SEARCH_VALUES:
+            vector.hnsw_ef_search = ef_search
+            mean_ms, p95_ms, recall = measure(vector, queries, expected)
+            print(f"{vector_type:>8} {ef_search:>10} {'-':>10} {mean_ms:>10.2f} {p95_ms:>10.2f} {recall:>10.3f}")
+
+        # searches restricted to one document, as when testing the retrieval of a single document
+        vector.hnsw_ef_search = dify_config.PGVECTOR_HNSW_EF_SEARCH
+        filtered_candidates = all_candidates[document_ids == 0]
+        expected = [exact_neighbors(vectors, query, filtered_candidates) for query in queries]
+        mean_ms, p95_ms, recall = measure(vector, queries, expected, document_ids_filter=["document-0"])
+        print(
+            f"{vector_type:>8} {vector.hnsw_ef_search:>10} {'1 doc':>10} {mean_ms:>10.2f} {p95_ms:>10.2f}"
+            f" {recall:>10.3f}"
+        )
+    finally:
+        vector.delete()
+
+
+def main():
+    rng = np.random.default_rng(0)
+    # clustered vectors are closer to real embeddings than uniformly random ones
+    centers = rng.standard_normal((100, EMBEDDING_DIMENSION))
+    vectors = centers[rng.integers(0, len(centers), VECTOR_COUNT)]
+    vectors = normalize(vectors + rng.standard_normal(vectors.shape) * 0.5).astype(np.float32)
+    queries = vectors[rng.integers(0, VECTOR_COUNT, QUERY_COUNT)]
+    queries = normalize(queries + rng.standard_normal(queries.shape) * 0.1).astype(np.float32)
+
+    redis_client = MagicMock()
+    redis_client.get.return_value = None
+    print(f"{'type':>8} {'ef_search':>10} {'filter':>10} {'mean ms':>10} {'p95 ms':>10} {'recall':>10}")
+    with patch("core.rag.datasource.vdb.pgvector.pgvector.redis_client", redis_client):
+        for vector_type in VECTOR_TYPES:
+            benchmark(vector_type, vectors, queries)
+
+
+if __name__ == "__main__":
+    main()
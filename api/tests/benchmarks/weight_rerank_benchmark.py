@@ -0,0 +1,203 @@
+"""
+Benchmark of the keyword and vector scoring of WeightRerankRunner against the previous per-document implementation.
+
+Run from the `api` directory:
+
+    python -m tests.benchmarks.weight_rerank_benchmark
+"""
+
+import math
+import random
+import time
+from collections import Counter
+from collections.abc import Callable
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+from core.rag.datasource.keyword.jieba.jieba_keyword_table_handler import JiebaKeywordTableHandler
+from core.rag.models.document import Document
+from core.rag.rerank.entity.weight import KeywordSetting, VectorSetting, Weights
+from core.rag.rerank.weight_rerank import WeightRerankRunner
+
+CANDIDATE_COUNTS = [50, 200, 1000]
+EMBEDDING_DIMENSION = 1536
+ROUNDS = 5
+
+WORDS = [
+    "retrieval",
+    "augmented",
+    "generation",
+    "knowledge",
+    "base",
+    "dataset",
+    "segment",
+    "document",
+    "keyword",
+    "embedding",
+    "vector",
+    "index",
+    "query",
+    "rerank",
+    "score",
+    "weight",
+    "model",
+    "provider",
+    "workflow",
+    "node",
+    "variable",
+    "iteration",
+    "parallel",
+    "branch",
+    "answer",
+    "question",
+    "context",
+    "知识库",
+    "检索",
+    "文档",
+    "分段",
+    "关键词",
+    "向量",
+    "模型",
+    "工作流",
+    "节点",
+    "变量",
+    "问题",
+    "答案",
+    "上下文",
+]
+
+
+class InMemoryRedis:
+    def __init__(self):
+        self.data: dict[str, bytes] = {}
+
+    def pipeline(self, transaction: bool = True):
+        redis = self
+        results: list = []
+
+        class Pipeline:
+            def get(self, key):
+                results.append(redis.data.get(key))
+
+            def setex(self, key, ttl, value):
+                redis.data[key] = value.encode()
+                results.append(True)
+
+            def execute(self):
+                return list(results)
+
+        return Pipeline()
+
+
+def legacy_keyword_score(query: str, documents: list[Document]) -> list[float]:
+    keyword_table_handler = JiebaKeywordTableHandler()
+    query_keywords = keyword_table_handler.extract_keywords(query, None)
+    documents_keywords = [keyword_table_handler.extract_keywords(d.page_content, None) for d in documents]
+    query_keyword_counts = Counter(query_keywords)
+    total_documents = len(documents)
+    all_keywords = set()
+    for document_keywords in documents_keywords:
+        all_keywords.update(document_keywords)
+    keyword_idf = {}
+    for keyword in all_keywords:
+        doc_count_containing_keyword = sum(1 for doc_keywords in documents_keywords if keyword in doc_keywords)
+        keyword_idf[keyword] = math.log((1 + total_documents) / (1 + doc_count_containing_keyword)) + 1
+    query_tfidf = {keyword: count * keyword_idf.get(keyword, 0) for keyword, count in query_keyword_counts.items()}
+    documents_tfidf = []
+    for document_keywords in documents_keywords:
+        document_keyword_counts = Counter(document_keywords)
+        documents_tfidf.append(
+            {keyword: count * keyword_idf.get(keyword, 0) for keyword, count in document_keyword_counts.items()}
+        )
+
+    def cosine_similarity(vec1, vec2):
+        intersection = set(vec1.keys()) & set(vec2.keys())
+        numerator = sum(vec1[x] * vec2[x] for x in intersection)
+        denominator = math.sqrt(sum(vec1[x] ** 2 for x in vec1)) * math.sqrt(sum(vec2[x] ** 2 for x in vec2))
+        return float(numerator) / denominator if denominator else 0.0
+
+    return [cosine_similarity(query_tfidf, document_tfidf) for document_tfidf in documents_tfidf]
+
+
+def legacy_cosine(query_vector: list[float], documents: list[Document]) -> list[float]:
+    scores = []
+    for document in documents:
+        vec1 = np.array(query_vector)
+        vec2 = np.array(document.vector)
+        scores.append(np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2)))
+    return scores
+
+
+def build_documents(count: int) -> list[Document]:
+    return [
+        Document(
+            page_content=" ".join(random.choices(WORDS, k=120)),
+            vector=np.random.rand(EMBEDDING_DIMENSION).tolist(),
+            metadata={"doc_id": str(i)},
+        )
+        for i in range(count)
+    ]
+
+
+def measure(func: Callable) -> float:
+    started_at = time.perf_counter()
+    for _ in range(ROUNDS):
+        func()
+    return (time.perf_counter() - started_at) / ROUNDS * 1000
+
+
+def benchmark(runner: WeightRerankRunner, query: str, query_vector: list[float], count: int) -> None:
+    documents = build_documents(count)
+
+    legacy_scores = legacy_keyword_score(query, documents)
+    with patch("core.rag.rerank.weight_rerank.redis_client", InMemoryRedis()):
+        scores = runner._calculate_keyword_score(query, documents)
+    max_diff = float(np.max(np.abs(np.array(scores) - np.array(legacy_scores))))
+    legacy_ms = measure(lambda: legacy_keyword_score(query, documents))
+
+    def cold():
+        with patch("core.rag.rerank.weight_rerank.redis_client", InMemoryRedis()):
+            runner._calculate_keyword_score(query, documents)
+
+    cold_ms = measure(cold)
+    with patch("core.rag.rerank.weight_rerank.redis_client", InMemoryRedis()):
+        runner._calculate_keyword_score(query, documents)
+        warm_ms = measure(lambda: runner._calculate_keyword_score(query, documents))
+    print(f"{count:>10} {'keyword':>8} {legacy_ms:>10.2f} {cold_ms:>10.2f} {warm_ms:>10.2f} {max_diff:>10.2e}")
+
+    legacy_scores = legacy_cosine(query_vector, documents)
+    scores = runner._calculate_cosine("", query, documents, runner.weights.vector_setting)
+    max_diff = float(np.max(np.abs(np.array(scores) - np.array(legacy_scores))))
+    legacy_ms = measure(lambda: legacy_cosine(query_vector, documents))
+    vector_ms = measure(lambda: runner._calculate_cosine("", query, documents, runner.weights.vector_setting))
+    print(f"{count:>10} {'vector':>8} {legacy_ms:>10.2f} {vector_ms:>10.2f} {'-':>10} {max_diff:>10.2e}")
+
+
+def main():
+    random.seed(0)
+    np.random.seed(0)
+    query = " ".join(random.choices(WORDS, k=8))
+    query_vector = np.random.rand(EMBEDDING_DIMENSION).tolist()
+    runner = WeightRerankRunner(
+        tenant_id="",
+        weights=Weights(
+            vector_setting=VectorSetting(vector_weight=0.5, embedding_provider_name="", embedding_model_name=""),
+            keyword_setting=KeywordSetting(keyword_weight=0.5),
+        ),
+    )
+    cache_embedding = MagicMock()
+    cache_embedding.embed_query.return_value = query_vector
+
+    # cold and warm refer to the document keywords cache
+    print(f"{'candidates':>10} {'scorer':>8} {'legacy ms':>10} {'cold ms':>10} {'warm ms':>10} {'max diff':>10}")
+    with (
+        patch("core.rag.rerank.weight_rerank.ModelManager"),
+        patch("core.rag.rerank.weight_rerank.CacheEmbedding", return_value=cache_embedding),
+    ):
+        for count in CANDIDATE_COUNTS:
+            benchmark(runner, query, query_vector, count)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,7 @@
+import uuid
+
+import pytest
+
 from core.rag.datasource.vdb.pgvector.pgvector import PGVector, PGVectorConfig
 from tests.integration_tests.vdb.test_vector_store import (
     AbstractVectorTest,
@@ -7,7 +11,7 @@ from tests.integration_tests.vdb.test_vector_store import (
 
 
 class PGVectorTest(AbstractVectorTest):
-    def __init__(self):
+    def __init__(self, vector_type: str = "vector"):
         super().__init__()
         self.vector = PGVector(
             collection_name=self.collection_name,
@@ -19,9 +23,18 @@ class PGVectorTest(AbstractVectorTest):
                 database="dify",
                 min_connection=1,
                 max_connection=5,
+                vector_type=vector_type,
             ),
         )
 
+    def search_by_vector(self):
+        super().search_by_vector()
+        hits_by_vector = self.vector.search_by_vector(
+            query_vector=self.example_embedding, document_ids_filter=[str(uuid.uuid4())]
+        )
+        assert not hits_by_vector
+
 
-def test_pgvector(setup_mock_redis):
-    PGVectorTest().run_all_tests()
+@pytest.mark.parametrize("vector_type", ["vector", "halfvec"])
+def test_pgvector(setup_mock_redis, vector_type):
+    PGVectorTest(vector_type).run_all_tests()
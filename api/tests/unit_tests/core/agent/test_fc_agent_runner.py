@@ -0,0 +1,70 @@
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from core.agent.fc_agent_runner import FunctionCallAgentRunner
+from core.tools.entities.tool_entities import ToolInvokeMeta
+
+
+@pytest.fixture
+def runner() -> FunctionCallAgentRunner:
+    runner = FunctionCallAgentRunner.__new__(FunctionCallAgentRunner)
+    runner.user_id = "user_id"
+    runner.tenant_id = "tenant_id"
+    runner.message = MagicMock()
+    runner.application_generate_entity = MagicMock()
+    runner.agent_callback = MagicMock()
+    return runner
+
+
+@pytest.fixture
+def sleeping_tools(monkeypatch) -> list[str]:
+    invoked: list[str] = []
+    lock = threading.Lock()
+
+    def agent_invoke(tool, tool_parameters, **kwargs):
+        time.sleep(tool_parameters["seconds"])
+        with lock:
+            invoked.append(tool.name)
+        return f"{tool.name} done", [], ToolInvokeMeta.empty()
+
+    monkeypatch.setattr("core.agent.fc_agent_runner.ToolEngine.agent_invoke", agent_invoke)
+    return invoked
+
+
+def _tool(name: str) -> MagicMock:
+    tool = MagicMock()
+    tool.name = name
+    return tool
+
+
+def test_tool_calls_run_concurrently_in_order(runner, sleeping_tools):
+    tool_instances = {"slow": _tool("slow"), "fast": _tool("fast")}
+    tool_calls = [
+        ("1", "slow", {"seconds": 0.3}),
+        ("2", "missing", {}),
+        ("3", "fast", {"seconds": 0.1}),
+        ("4", "fast", {"seconds": 0.1}),
+    ]
+
+    start = time.perf_counter()
+    results = runner._invoke_tools(tool_calls, tool_instances)
+
+    assert time.perf_counter() - start < 0.45
+    assert sleeping_tools[-1] == "slow"
+    assert results[1] is None
+    assert [result[0] for result in results if result] == ["slow done", "fast done", "fast done"]
+
+
+def test_tool_call_timeout(runner, sleeping_tools, monkeypatch):
+    monkeypatch.setattr("core.agent.fc_agent_runner.dify_config.AGENT_TOOL_CALL_TIMEOUT", 1)
+    tool_instances = {"hanging": _tool("hanging"), "fast": _tool("fast")}
+    tool_calls = [("1", "hanging", {"seconds": 1.5}), ("2", "fast", {"seconds": 0})]
+
+    results = runner._invoke_tools(tool_calls, tool_instances)
+
+    assert results[0][0] == "tool invoke error: timed out after 1 seconds"
+    assert results[0][2].error == results[0][0]
+    assert results[1][0] == "fast done"
@@ -0,0 +1,53 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from core.app.apps.base_app_queue_manager import AppQueueManager, PublishFrom
+from core.app.entities.app_invoke_entities import InvokeFrom
+from core.app.entities.queue_entities import QueuePingEvent
+
+
+class DummyQueueManager(AppQueueManager):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.published_events = []
+
+    def _publish(self, event, pub_from: PublishFrom) -> None:
+        self.published_events.append(event)
+
+
+@pytest.fixture
+def mock_redis(monkeypatch) -> MagicMock:
+    # the redis client wrapper raises on attribute access before init_app, which breaks `patch`
+    redis = MagicMock()
+    monkeypatch.setattr("core.app.apps.base_app_queue_manager.redis_client", redis)
+    return redis
+
+
+@patch("core.app.apps.base_app_queue_manager.stop_signal_subscriber")
+def test_stop_signal_is_handled_without_redis(mock_subscriber: MagicMock, mock_redis: MagicMock):
+    mock_subscriber.healthy = True
+    mock_redis.get.return_value = None
+    queue_manager = DummyQueueManager(task_id="task_id", user_id="user_id", invoke_from=InvokeFrom.WEB_APP)
+
+    # the first check polls the stop flag, later ones are served locally within the polling interval
+    assert not queue_manager._is_stopped()
+    assert not queue_manager._is_stopped()
+    assert mock_redis.get.call_count == 1
+
+    queue_manager.on_stop_signal()
+
+    assert queue_manager._is_stopped()
+    assert mock_redis.get.call_count == 1
+    assert isinstance(queue_manager.published_events[-1], QueuePingEvent)
+    mock_subscriber.register.assert_called_once_with("task_id", queue_manager)
+
+
+@patch("core.app.apps.base_app_queue_manager.stop_signal_subscriber")
+def test_stop_flag_is_polled_when_subscriber_is_down(mock_subscriber: MagicMock, mock_redis: MagicMock):
+    mock_subscriber.healthy = False
+    mock_redis.get.return_value = b"1"
+    queue_manager = DummyQueueManager(task_id="task_id", user_id="user_id", invoke_from=InvokeFrom.WEB_APP)
+
+    assert queue_manager._is_stopped()
+    mock_redis.get.assert_called_once_with("generate_task_stopped:task_id")
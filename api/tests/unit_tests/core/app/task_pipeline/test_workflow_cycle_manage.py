@@ -0,0 +1,31 @@
+from unittest.mock import MagicMock
+
+import pytest
+from sqlalchemy.orm import make_transient_to_detached
+
+from core.app.task_pipeline.workflow_cycle_manage import WorkflowCycleManage
+from models.workflow import WorkflowRun
+
+
+def _workflow_cycle_manage(workflow_run: WorkflowRun, buffered: bool) -> WorkflowCycleManage:
+    workflow_cycle_manage = WorkflowCycleManage(application_generate_entity=MagicMock(), workflow_system_variables={})
+    workflow_cycle_manage._workflow_run = workflow_run
+    if buffered:
+        workflow_cycle_manage._node_execution_buffer = MagicMock()
+    return workflow_cycle_manage
+
+
+@pytest.mark.parametrize(
+    ("buffered", "modified", "load"),
+    [(False, False, True), (True, False, False), (True, True, True)],
+)
+def test_cached_workflow_run_is_only_merged_without_load_when_clean(buffered, modified, load):
+    workflow_run = WorkflowRun(id="run_id", status="running")
+    make_transient_to_detached(workflow_run)
+    if modified:
+        workflow_run.status = "succeeded"
+    session = MagicMock()
+
+    _workflow_cycle_manage(workflow_run, buffered)._get_workflow_run(session=session, workflow_run_id="run_id")
+
+    session.merge.assert_called_once_with(workflow_run, load=load)
@@ -0,0 +1,98 @@
+import threading
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from core.app.task_pipeline.workflow_node_execution_buffer import (
+    WorkflowNodeExecutionBuffer,
+    _row_from_json,
+    write_node_executions,
+)
+from models.workflow import WorkflowNodeExecution, WorkflowNodeExecutionStatus
+
+
+@pytest.fixture
+def mock_redis(monkeypatch) -> MagicMock:
+    # the redis client wrapper raises on attribute access before init_app, which breaks `patch`
+    redis = MagicMock()
+    monkeypatch.setattr("core.app.task_pipeline.workflow_node_execution_buffer.redis_client", redis)
+    return redis
+
+
+@pytest.fixture
+def written_batches(monkeypatch) -> list[list[dict]]:
+    batches: list[list[dict]] = []
+    monkeypatch.setattr("core.app.task_pipeline.workflow_node_execution_buffer.Session", MagicMock())
+    monkeypatch.setattr(
+        "core.app.task_pipeline.workflow_node_execution_buffer.write_node_executions",
+        lambda session, rows: batches.append(rows),
+    )
+    return batches
+
+
+def _node_execution(node_id: str) -> WorkflowNodeExecution:
+    workflow_node_execution = WorkflowNodeExecution()
+    workflow_node_execution.id = f"{node_id}-execution"
+    workflow_node_execution.node_id = node_id
+    workflow_node_execution.status = WorkflowNodeExecutionStatus.RUNNING.value
+    workflow_node_execution.created_at = datetime(2024, 1, 1)
+    return workflow_node_execution
+
+
+def test_start_and_finish_are_written_once(mock_redis, written_batches):
+    buffer = WorkflowNodeExecutionBuffer(workflow_run_id="run", engine=MagicMock(), batch_size=10, flush_interval=60)
+    workflow_node_execution = _node_execution("llm")
+    buffer.add(workflow_node_execution)
+    workflow_node_execution.status = WorkflowNodeExecutionStatus.SUCCEEDED.value
+    buffer.add(workflow_node_execution)
+    buffer.close()
+
+    assert len(written_batches) == 1
+    assert [(row["id"], row["status"]) for row in written_batches[0]] == [("llm-execution", "succeeded")]
+    # both versions were journaled before being written
+    assert mock_redis.pipeline.return_value.hset.call_count == 2
+    mock_redis.pipeline.return_value.delete.assert_called_with("workflow_node_execution_journal:run")
+
+
+def test_flush_when_batch_is_full(mock_redis, written_batches):
+    buffer = WorkflowNodeExecutionBuffer(workflow_run_id="run", engine=MagicMock(), batch_size=2, flush_interval=60)
+    buffer.add(_node_execution("start"))
+    buffer.add(_node_execution("llm"))
+
+    for _ in range(100):
+        if written_batches:
+            break
+        threading.Event().wait(0.01)
+    assert len(written_batches) == 1
+    assert len(written_batches[0]) == 2
+    buffer.close()
+    mock_redis.hdel.assert_called_once()
+
+
+def test_failed_write_keeps_node_executions_pending(mock_redis, monkeypatch):
+    monkeypatch.setattr("core.app.task_pipeline.workflow_node_execution_buffer.Session", MagicMock())
+    write = MagicMock(side_effect=[Exception("database is down"), None])
+    monkeypatch.setattr("core.app.task_pipeline.workflow_node_execution_buffer.write_node_executions", write)
+    buffer = WorkflowNodeExecutionBuffer(workflow_run_id="run", engine=MagicMock(), batch_size=10, flush_interval=60)
+    buffer.add(_node_execution("llm"))
+
+    with pytest.raises(Exception, match="database is down"):
+        buffer.flush()
+    mock_redis.hdel.assert_not_called()
+
+    buffer.close()
+    assert write.call_count == 2
+    assert [row["id"] for row in write.call_args.args[1]] == ["llm-execution"]
+
+
+def test_write_node_executions_uses_server_default_for_unset_columns():
+    session = MagicMock()
+    rows = [_row_from_json('{"id": "1", "elapsed_time": null, "created_at": "2024-01-01T00:00:00"}')]
+    assert rows[0]["created_at"] == datetime(2024, 1, 1)
+
+    write_node_executions(session, rows)
+
+    sql = str(session.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+    assert "VALUES (%(id_m0)s::UUID, 0, %(created_at_m0)s) ON CONFLICT (id) DO UPDATE" in sql
@@ -0,0 +1,56 @@
+import json
+
+import httpx
+import pytest
+
+from core.helper.code_executor.code_executor import CodeExecutionError, CodeExecutor, CodeLanguage
+
+
+class FakeSandbox:
+    """A local stand-in for the sandbox service, `stdout` echoes the submitted code."""
+
+    def __init__(self):
+        self.requests: list[httpx.Request] = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        body = json.loads(request.content)
+        return httpx.Response(200, json={"code": 0, "message": "success", "data": self._run(body["code"])})
+
+    @staticmethod
+    def _run(code: str) -> dict:
+        if code == "fail":
+            return {"stdout": "", "error": "failed"}
+        return {"stdout": code, "error": None}
+
+
+@pytest.fixture
+def fake_sandbox(monkeypatch):
+    sandbox = FakeSandbox()
+    client = httpx.Client(transport=httpx.MockTransport(sandbox.handler))
+    monkeypatch.setattr(CodeExecutor, "_get_client", classmethod(lambda cls: client))
+    return sandbox
+
+
+def test_execute_code(fake_sandbox):
+    assert CodeExecutor.execute_code(CodeLanguage.PYTHON3, "", "print(1)") == "print(1)"
+
+    with pytest.raises(CodeExecutionError):
+        CodeExecutor.execute_code(CodeLanguage.PYTHON3, "", "fail")
+
+
+def test_executions_share_the_pooled_client(fake_sandbox):
+    CodeExecutor.execute_code(CodeLanguage.PYTHON3, "", "a")
+    CodeExecutor.execute_code(CodeLanguage.PYTHON3, "", "b")
+
+    assert [json.loads(request.content)["code"] for request in fake_sandbox.requests] == ["a", "b"]
+    assert all(request.url.path.endswith("/v1/sandbox/run") for request in fake_sandbox.requests)
+
+
+def test_pooled_client_is_recreated_after_fork(monkeypatch):
+    monkeypatch.setattr(CodeExecutor, "_client", None)
+    client = CodeExecutor._get_client()
+    assert CodeExecutor._get_client() is client
+
+    monkeypatch.setattr(CodeExecutor, "_client_pid", -1)
+    assert CodeExecutor._get_client() is not client
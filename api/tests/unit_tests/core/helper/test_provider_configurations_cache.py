@@ -0,0 +1,154 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from core.entities.provider_configuration import ProviderConfiguration, ProviderConfigurations
+from core.entities.provider_entities import (
+    CustomConfiguration,
+    CustomProviderConfiguration,
+    QuotaConfiguration,
+    QuotaUnit,
+    SystemConfiguration,
+)
+from core.helper import provider_configurations_cache
+from core.helper.provider_configurations_cache import (
+    CHANGED_TENANTS_INFO_KEY,
+    _collect_changed_tenants,
+    _invalidate_changed_tenants,
+    get_provider_configurations,
+    invalidate_provider_configurations,
+    provider_configurations_memo,
+)
+from core.model_runtime.entities.common_entities import I18nObject
+from core.model_runtime.entities.model_entities import ModelType
+from core.model_runtime.entities.provider_entities import ConfigurateMethod, ProviderEntity
+from models.provider import Provider, ProviderQuotaType, ProviderType
+
+PROVIDER_ENTITY = ProviderEntity(
+    provider="openai",
+    label=I18nObject(en_US="OpenAI"),
+    supported_model_types=[ModelType.LLM],
+    configurate_methods=[ConfigurateMethod.PREDEFINED_MODEL],
+)
+
+
+@pytest.fixture
+def mock_redis(monkeypatch) -> MagicMock:
+    # the redis client wrapper raises on attribute access before init_app, which breaks `patch`
+    store: dict[str, bytes] = {}
+    redis = MagicMock()
+    redis.get.side_effect = lambda key: store.get(key)
+    redis.set.side_effect = lambda key, value, nx=False: store.setdefault(key, str(value).encode())
+    redis.setex.side_effect = lambda key, ttl, value: store.__setitem__(key, value.encode())
+
+    def incr(key):
+        store[key] = str(int(store.get(key, b"0")) + 1).encode()
+
+    redis.pipeline.return_value.incr.side_effect = incr
+    monkeypatch.setattr(provider_configurations_cache, "redis_client", redis)
+    monkeypatch.setattr(
+        provider_configurations_cache.model_provider_factory, "get_providers", lambda: [PROVIDER_ENTITY]
+    )
+    provider_configurations_cache._local_cache.clear()
+    return redis
+
+
+def _build_configurations() -> ProviderConfigurations:
+    configurations = ProviderConfigurations(tenant_id="tenant")
+    configurations["openai"] = ProviderConfiguration(
+        tenant_id="tenant",
+        provider=PROVIDER_ENTITY,
+        preferred_provider_type=ProviderType.CUSTOM,
+        using_provider_type=ProviderType.CUSTOM,
+        system_configuration=SystemConfiguration(
+            enabled=True,
+            current_quota_type=ProviderQuotaType.TRIAL,
+            quota_configurations=[
+                QuotaConfiguration(
+                    quota_type=ProviderQuotaType.TRIAL,
+                    quota_unit=QuotaUnit.TOKENS,
+                    quota_limit=100,
+                    quota_used=10,
+                    is_valid=True,
+                )
+            ],
+        ),
+        custom_configuration=CustomConfiguration(
+            provider=CustomProviderConfiguration(credentials={"openai_api_key": "sk-test"})
+        ),
+        model_settings=[],
+    )
+    return configurations
+
+
+def test_configurations_are_built_once(mock_redis):
+    build = MagicMock(side_effect=_build_configurations)
+
+    first = get_provider_configurations("tenant", build)
+    second = get_provider_configurations("tenant", build)
+
+    build.assert_called_once()
+    assert second["openai"].custom_configuration.provider.credentials == {"openai_api_key": "sk-test"}
+    # callers get their own copy of the tenant specific parts
+    first["openai"].custom_configuration.provider.credentials["openai_api_key"] = "changed"
+    assert second["openai"].custom_configuration.provider.credentials == {"openai_api_key": "sk-test"}
+
+
+def test_configurations_are_loaded_from_redis(mock_redis):
+    get_provider_configurations("tenant", _build_configurations)
+    # another process only has the redis tier
+    provider_configurations_cache._local_cache.clear()
+    build = MagicMock(side_effect=_build_configurations)
+
+    configurations = get_provider_configurations("tenant", build)
+
+    build.assert_not_called()
+    assert configurations["openai"].provider is PROVIDER_ENTITY
+    assert configurations["openai"].system_configuration == _build_configurations()["openai"].system_configuration
+
+
+def test_invalidation_rebuilds_configurations(mock_redis):
+    build = MagicMock(side_effect=_build_configurations)
+    get_provider_configurations("tenant", build)
+
+    invalidate_provider_configurations(["tenant"])
+    get_provider_configurations("tenant", build)
+
+    assert build.call_count == 2
+
+
+def test_configurations_are_built_without_redis(mock_redis):
+    mock_redis.get.side_effect = ConnectionError()
+    build = MagicMock(side_effect=_build_configurations)
+
+    get_provider_configurations("tenant", build)
+    get_provider_configurations("tenant", build)
+
+    assert build.call_count == 2
+
+
+def test_committed_provider_changes_invalidate_tenants(mock_redis, monkeypatch):
+    invalidate = MagicMock()
+    monkeypatch.setattr(provider_configurations_cache, "invalidate_provider_configurations", invalidate)
+    session = MagicMock(info={}, new=[Provider(tenant_id="tenant")], dirty=[object()], deleted=[])
+
+    _collect_changed_tenants(session, None)
+    _invalidate_changed_tenants(session)
+
+    invalidate.assert_called_once_with({"tenant"})
+    assert CHANGED_TENANTS_INFO_KEY not in session.info
+
+
+def test_memo_shares_configurations_within_a_run(mock_redis):
+    build = MagicMock(side_effect=_build_configurations)
+
+    with provider_configurations_memo() as memo:
+        first = get_provider_configurations("tenant", build)
+        assert get_provider_configurations("tenant", build) is first
+
+        invalidate_provider_configurations(["tenant"])
+        assert get_provider_configurations("tenant", build) is not first
+    get_provider_configurations("tenant", build)
+
+    assert memo.load_count == 2
+    assert build.call_count == 2
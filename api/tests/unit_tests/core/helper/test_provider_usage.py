@@ -0,0 +1,125 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from core.helper.provider_usage import (
+    PENDING_LAST_USED_KEY,
+    PENDING_QUOTA_USED_KEY,
+    PERSISTED_QUOTA_USED_KEY,
+    QUOTA_LIMIT_KEY,
+    _parse_field,
+    deduct_provider_quota,
+    flush_provider_usage,
+    get_pending_quota_used,
+)
+
+
+@pytest.fixture
+def mock_redis(monkeypatch) -> MagicMock:
+    # the redis client wrapper raises on attribute access before init_app, which breaks `patch`
+    redis = MagicMock()
+    monkeypatch.setattr("core.helper.provider_usage.redis_client", redis)
+    monkeypatch.setattr("core.helper.provider_usage.dify_config.PROVIDER_USAGE_BATCH_ACCOUNTING_ENABLED", True)
+    return redis
+
+
+@pytest.fixture
+def mock_db(monkeypatch) -> MagicMock:
+    db = MagicMock()
+    monkeypatch.setattr("core.helper.provider_usage.db", db)
+    return db
+
+
+def test_deduct_accumulates_in_redis(mock_redis, mock_db, monkeypatch):
+    invalidate = MagicMock()
+    monkeypatch.setattr("core.helper.provider_usage.invalidate_provider_configurations", invalidate)
+    accumulate = mock_redis.register_script.return_value
+    accumulate.return_value = 900
+
+    deduct_provider_quota(tenant_id="tenant", provider_name="openai", quota_type="trial", used_quota=100)
+
+    accumulate.assert_called_once_with(
+        keys=[PENDING_QUOTA_USED_KEY, PENDING_QUOTA_USED_KEY + ":flushing", PERSISTED_QUOTA_USED_KEY, QUOTA_LIMIT_KEY],
+        args=["tenant:openai:trial", 100],
+    )
+    mock_db.session.commit.assert_not_called()
+    invalidate.assert_not_called()
+
+
+def test_deduct_loads_persisted_usage_and_invalidates_once_quota_is_exhausted(mock_redis, mock_db, monkeypatch):
+    invalidate = MagicMock()
+    monkeypatch.setattr("core.helper.provider_usage.invalidate_provider_configurations", invalidate)
+    accumulate = mock_redis.register_script.return_value
+    # the persisted usage is not cached yet
+    accumulate.side_effect = [None, -20]
+    mock_db.session.query.return_value.filter.return_value.first.return_value = MagicMock(
+        quota_used=80, quota_limit=100
+    )
+
+    deduct_provider_quota(tenant_id="tenant", provider_name="openai", quota_type="trial", used_quota=40)
+
+    assert accumulate.call_args.kwargs["args"] == ["tenant:openai:trial", 40, 80, 100]
+    mock_db.session.commit.assert_not_called()
+    invalidate.assert_called_once_with(["tenant"])
+
+
+def test_deduct_falls_back_to_database(mock_redis, mock_db):
+    mock_redis.register_script.return_value.side_effect = ConnectionError()
+
+    deduct_provider_quota(tenant_id="tenant", provider_name="openai", quota_type="trial", used_quota=100)
+
+    mock_db.session.commit.assert_called_once()
+
+
+def test_deduct_invalidates_configurations_once_quota_is_exhausted(mock_redis, mock_db, monkeypatch):
+    monkeypatch.setattr("core.helper.provider_usage.dify_config.PROVIDER_USAGE_BATCH_ACCOUNTING_ENABLED", False)
+    invalidate = MagicMock()
+    monkeypatch.setattr("core.helper.provider_usage.invalidate_provider_configurations", invalidate)
+    mock_db.session.execute.return_value.all.return_value = [MagicMock(quota_used=50, quota_limit=100)]
+
+    deduct_provider_quota(tenant_id="tenant", provider_name="openai", quota_type="trial", used_quota=40)
+    invalidate.assert_not_called()
+
+    mock_db.session.execute.return_value.all.return_value = [MagicMock(quota_used=100, quota_limit=100)]
+    deduct_provider_quota(tenant_id="tenant", provider_name="openai", quota_type="trial", used_quota=50)
+    invalidate.assert_called_once_with(["tenant"])
+
+
+def test_pending_quota_used_includes_flushing_snapshot(mock_redis):
+    mock_redis.pipeline.return_value.execute.return_value = [[b"10", None], [b"5", None]]
+
+    pending = get_pending_quota_used(tenant_id="tenant", provider_name="openai", quota_types=["trial", "paid"])
+
+    assert pending == {"trial": 15, "paid": 0}
+
+
+def test_flush_writes_snapshots(mock_redis, mock_db, monkeypatch):
+    invalidate = MagicMock()
+    monkeypatch.setattr("core.helper.provider_usage.invalidate_provider_configurations", invalidate)
+    existing_keys = {PENDING_QUOTA_USED_KEY, PENDING_LAST_USED_KEY}
+    mock_redis.exists.side_effect = lambda key: key in existing_keys
+    mock_redis.hgetall.side_effect = lambda key: {
+        PENDING_QUOTA_USED_KEY + ":flushing": {b"tenant:openai:trial": b"120"},
+        PENDING_LAST_USED_KEY + ":flushing": {b"tenant:openai": b"2024-01-01T00:00:00"},
+    }[key]
+
+    assert flush_provider_usage() == 2
+
+    mock_redis.rename.assert_any_call(PENDING_QUOTA_USED_KEY, PENDING_QUOTA_USED_KEY + ":flushing")
+    assert mock_db.session.query.return_value.filter.return_value.update.call_count == 2
+    mock_db.session.commit.assert_called_once()
+    # the cached persisted usage is dropped before the snapshots
+    assert [call.args for call in mock_redis.delete.call_args_list] == [
+        (PERSISTED_QUOTA_USED_KEY, QUOTA_LIMIT_KEY),
+        (PENDING_QUOTA_USED_KEY + ":flushing", PENDING_LAST_USED_KEY + ":flushing"),
+    ]
+    mock_redis.lock.return_value.release.assert_called_once()
+    assert list(invalidate.call_args.args[0]) == ["tenant"]
+
+
+def test_parse_field_with_colon_in_provider_name():
+    assert _parse_field("tenant:langgenius/openai:openai:trial", with_quota_type=True) == (
+        "tenant",
+        "langgenius/openai:openai",
+        "trial",
+    )
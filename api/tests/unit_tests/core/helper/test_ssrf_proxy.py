@@ -1,9 +1,19 @@
+import asyncio
 import random
 from unittest.mock import MagicMock, patch
 
+import httpx
 import pytest
 
-from core.helper.ssrf_proxy import SSRF_DEFAULT_MAX_RETRIES, STATUS_FORCELIST, make_request
+from core.helper import ssrf_proxy
+from core.helper.ssrf_proxy import (
+    SSRF_DEFAULT_MAX_RETRIES,
+    STATUS_FORCELIST,
+    get_client,
+    get_pool_metrics,
+    make_request,
+    make_request_async,
+)
 
 
 @patch("httpx.Client.request")
@@ -50,3 +60,60 @@ def test_retry_logic_success(mock_request):
     assert response.status_code == 200
     assert mock_request.call_count == SSRF_DEFAULT_MAX_RETRIES + 1
     assert mock_request.call_args_list[0][1].get("method") == "GET"
+
+
+@patch("httpx.Client.request")
+def test_client_is_reused_across_requests(mock_request):
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_request.return_value = mock_response
+
+    client = get_client()
+    make_request("GET", "http://example.com")
+    make_request("POST", "http://example.com")
+
+    assert get_client() is client
+    metrics = get_pool_metrics()
+    assert len(metrics) == 1
+    assert metrics[0]["in_flight"] == 0
+    assert metrics[0]["requests"] >= 2
+
+
+def _login_redirect(request: httpx.Request) -> httpx.Response:
+    if request.url.path == "/login":
+        return httpx.Response(302, headers={"Location": "/home", "Set-Cookie": "session=abc; Path=/"})
+    return httpx.Response(200, text=request.headers.get("Cookie", ""))
+
+
+def _pooled_client_kwargs(transport: httpx.BaseTransport | httpx.AsyncBaseTransport) -> dict:
+    kwargs = ssrf_proxy._get_client_kwargs((), httpx.HTTPTransport)
+    return {"cookies": kwargs["cookies"], "transport": transport}
+
+
+def test_redirects_keep_the_cookies_of_the_request(monkeypatch):
+    get_client()
+    client = httpx.Client(**_pooled_client_kwargs(httpx.MockTransport(_login_redirect)))
+    monkeypatch.setattr(ssrf_proxy, "get_client", lambda: client)
+
+    response = make_request("GET", "http://example.com/login", follow_redirects=True)
+
+    assert response.text == "session=abc"
+    assert len(response.history) == 1
+    # cookies are not shared with the next requests of the pooled client
+    assert make_request("GET", "http://example.com/home").text == ""
+    assert make_request("GET", "http://example.com/login").status_code == 302
+
+
+def test_async_redirects_keep_the_cookies_of_the_request(monkeypatch):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return _login_redirect(request)
+
+    async def run():
+        client = httpx.AsyncClient(**_pooled_client_kwargs(httpx.MockTransport(handler)))
+        monkeypatch.setattr(ssrf_proxy, "get_async_client", lambda: client)
+        response = await make_request_async("GET", "http://example.com/login", follow_redirects=True)
+        again = await make_request_async("GET", "http://example.com/home")
+        return response.text, again.text
+
+    get_client()
+    assert asyncio.run(run()) == ("session=abc", "")
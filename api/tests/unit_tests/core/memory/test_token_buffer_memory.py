@@ -0,0 +1,167 @@
+import datetime
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+from constants import UUID_NIL
+from core.file.models import FileUploadConfig, ImageConfig
+from core.memory import token_buffer_memory
+from core.memory.token_buffer_memory import TokenBufferMemory
+from core.model_runtime.entities import TextPromptMessageContent
+from models.model import AppMode
+
+# tokens the tokenizer adds to every request, whatever the number of messages
+REQUEST_OVERHEAD_TOKENS = 20
+
+
+@pytest.fixture
+def mock_db(monkeypatch) -> MagicMock:
+    db = MagicMock()
+    db.session.query.return_value.filter.return_value.all.return_value = []
+    monkeypatch.setattr(token_buffer_memory, "db", db)
+    return db
+
+
+@pytest.fixture
+def mock_redis(monkeypatch) -> dict:
+    store: dict = {}
+    results: list = []
+    pipeline = MagicMock()
+    pipeline.get.side_effect = lambda key: results.append(store.get(key))
+    pipeline.setex.side_effect = lambda key, ttl, value: store.__setitem__(key, value)
+
+    def execute():
+        executed = list(results)
+        results.clear()
+        return executed
+
+    pipeline.execute.side_effect = execute
+    redis = MagicMock()
+    redis.pipeline.return_value = pipeline
+    monkeypatch.setattr(token_buffer_memory, "redis_client", redis)
+    return store
+
+
+def _count_tokens(prompt_messages) -> int:
+    return REQUEST_OVERHEAD_TOKENS + sum(len(prompt_message.content) for prompt_message in prompt_messages)
+
+
+def _memory(mode: AppMode = AppMode.CHAT) -> TokenBufferMemory:
+    model_instance = MagicMock(provider="openai", model="gpt-4o")
+    model_instance.get_llm_num_tokens.side_effect = _count_tokens
+    return TokenBufferMemory(conversation=MagicMock(mode=mode), model_instance=model_instance)
+
+
+def _messages(count: int) -> list[SimpleNamespace]:
+    created_at = datetime.datetime(2025, 1, 1)
+    # newest first, as returned by the query
+    return [
+        SimpleNamespace(
+            id=f"message-{i}",
+            query="q" * 10,
+            answer="a" * 30,
+            created_at=created_at + datetime.timedelta(minutes=i),
+            workflow_run_id=None,
+            parent_message_id=UUID_NIL,
+        )
+        for i in reversed(range(count))
+    ]
+
+
+@pytest.mark.parametrize("max_token_limit", [60, 200, 333])
+def test_pruned_history_fits_the_token_limit(mock_db, mock_redis, max_token_limit):
+    mock_db.session.query.return_value.filter.return_value.order_by.return_value.limit.return_value.all.return_value = (
+        _messages(10)
+    )
+    memory = _memory()
+
+    prompt_messages = list(memory.get_history_prompt_messages(max_token_limit=max_token_limit))
+    # cached per-message counts are used the second time
+    assert list(memory.get_history_prompt_messages(max_token_limit=max_token_limit)) == prompt_messages
+
+    assert _count_tokens(prompt_messages) <= max_token_limit
+    # only the messages needed to fit the limit are pruned
+    all_prompt_messages = list(memory.get_history_prompt_messages(max_token_limit=10000))
+    kept_one_more = all_prompt_messages[len(all_prompt_messages) - len(prompt_messages) - 1 :]
+    assert _count_tokens(kept_one_more) > max_token_limit
+
+
+def test_message_files_are_loaded_with_one_query(mock_db):
+    files = [SimpleNamespace(message_id="message-1"), SimpleNamespace(message_id="message-1")]
+    files.append(SimpleNamespace(message_id="message-2"))
+    mock_db.session.query.return_value.filter.return_value.all.return_value = files
+
+    message_files = TokenBufferMemory._get_message_files(["message-1", "message-2", "message-3"])
+
+    assert message_files == {"message-1": files[:2], "message-2": files[2:]}
+    mock_db.session.query.return_value.filter.return_value.all.assert_called_once()
+    assert TokenBufferMemory._get_message_files([]) == {}
+
+
+def test_workflow_file_upload_configs_are_memoized(monkeypatch, mock_db):
+    monkeypatch.setattr(token_buffer_memory, "_workflow_file_upload_config_cache", token_buffer_memory.LRUCache(10))
+    convert = MagicMock(return_value="file upload config")
+    monkeypatch.setattr(token_buffer_memory.FileUploadConfigManager, "convert", convert)
+    updated_at = datetime.datetime(2025, 1, 1)
+    workflow_runs = mock_db.session.query.return_value.join.return_value.filter.return_value.all
+    workflow_runs.return_value = [("run-1", "workflow-1", updated_at), ("run-2", "workflow-1", updated_at)]
+    workflows = mock_db.session.query.return_value.options.return_value.filter.return_value.all
+    workflows.return_value = [SimpleNamespace(id="workflow-1", updated_at=updated_at, features_dict={})]
+    memory = _memory(AppMode.ADVANCED_CHAT)
+    messages = [SimpleNamespace(id="message-1", workflow_run_id="run-1")]
+    messages.append(SimpleNamespace(id="message-2", workflow_run_id="run-2"))
+
+    assert memory._get_file_extra_configs(messages) == {
+        "message-1": "file upload config",
+        "message-2": "file upload config",
+    }
+    assert memory._get_file_extra_configs(messages[:1]) == {"message-1": "file upload config"}
+
+    # runs are resolved per call, the features of a workflow version are loaded and converted once
+    assert workflow_runs.call_count == 2
+    workflows.assert_called_once()
+    convert.assert_called_once()
+
+
+def test_request_overhead_falls_back_to_zero(mock_db, mock_redis):
+    mock_db.session.query.return_value.filter.return_value.order_by.return_value.limit.return_value.all.return_value = (
+        _messages(10)
+    )
+    memory = _memory()
+
+    def count_tokens(prompt_messages):
+        if not prompt_messages:
+            raise ValueError("messages must not be empty")
+        return _count_tokens(prompt_messages)
+
+    memory.model_instance.get_llm_num_tokens.side_effect = count_tokens
+
+    prompt_messages = memory.get_history_prompt_messages(max_token_limit=200)
+
+    assert 0 < len(prompt_messages) < 20
+
+
+def test_query_token_counts_are_cached_per_file_upload_config(monkeypatch, mock_db, mock_redis):
+    mock_db.session.query.return_value.filter.return_value.order_by.return_value.limit.return_value.all.return_value = (
+        _messages(3)
+    )
+    monkeypatch.setattr(TokenBufferMemory, "_get_message_files", lambda self, ids: {"message-0": ["file"]})
+    monkeypatch.setattr(token_buffer_memory.file_factory, "build_from_message_files", lambda **kwargs: ["file"])
+    monkeypatch.setattr(
+        token_buffer_memory.file_manager,
+        "to_prompt_message_content",
+        lambda file, image_detail_config: TextPromptMessageContent(data=f"image {image_detail_config}"),
+    )
+    memory = _memory()
+
+    for detail in ("low", "high", "low"):
+        file_upload_configs = {"message-0": FileUploadConfig(image_config=ImageConfig(detail=detail))}
+        monkeypatch.setattr(
+            TokenBufferMemory, "_get_file_extra_configs", lambda self, messages, configs=file_upload_configs: configs
+        )
+        memory.get_history_prompt_messages(max_token_limit=60)
+
+    query_keys = [key for key in mock_redis if key.endswith(("low", "high"))]
+    assert len(query_keys) == 2
+    assert all(key.split(":")[3] == "message-0" for key in query_keys)
@@ -0,0 +1,76 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from core.app.apps.base_app_queue_manager import AppQueueManager
+from core.moderation.keywords.keyword_matcher import KeywordMatcher, get_keyword_matcher
+from core.moderation.keywords.keywords import KeywordsModeration
+from core.moderation.output_moderation import ModerationRule, OutputModeration
+
+CONFIG = {
+    "inputs_config": {"enabled": True, "preset_response": "inputs blocked"},
+    "outputs_config": {"enabled": True, "preset_response": "outputs blocked"},
+    "keywords": "hers\nShe\n\nhis",
+}
+
+
+@pytest.mark.parametrize(
+    ("text", "matched"),
+    [
+        ("ushers", True),
+        ("THIS", True),
+        ("a shell", True),
+        ("hi, he is here", False),
+        ("", False),
+    ],
+)
+def test_keywords_are_matched_case_insensitively(text, matched):
+    assert KeywordMatcher(["hers", "She", "his"]).search(text) is matched
+
+
+def test_keywords_spanning_chunks_are_matched():
+    scanner = KeywordMatcher(["hers"]).scanner()
+
+    assert not scanner.feed("us")
+    assert not scanner.feed("he")
+    assert scanner.feed("rs")
+    assert scanner.feed("")
+
+
+def test_matchers_are_cached_per_config():
+    assert get_keyword_matcher(CONFIG["keywords"]) is get_keyword_matcher(CONFIG["keywords"])
+    assert get_keyword_matcher(CONFIG["keywords"]) is not get_keyword_matcher("hers")
+
+
+def test_keywords_moderation():
+    moderation = KeywordsModeration("app", "tenant", CONFIG)
+
+    assert moderation.moderation_for_inputs({"name": "Bob"}, query="is this fine?").flagged
+    assert not moderation.moderation_for_inputs({"name": "Bob", "age": 30}, query="fine").flagged
+    result = moderation.moderation_for_outputs("she said")
+    assert result.flagged
+    assert result.preset_response == "outputs blocked"
+
+
+def test_streamed_output_is_scanned_incrementally(monkeypatch):
+    output_moderation = OutputModeration(
+        tenant_id="tenant",
+        app_id="app",
+        rule=ModerationRule(type="keywords", config=CONFIG),
+        queue_manager=MagicMock(spec=AppQueueManager),
+    )
+    scanned: list[str] = []
+    advance = KeywordMatcher.advance
+    monkeypatch.setattr(
+        KeywordMatcher, "advance", lambda self, state, text: scanned.append(text) or advance(self, state, text)
+    )
+
+    assert not output_moderation.moderation("tenant", "app", "Once upon a time t").flagged
+    assert not output_moderation.moderation("tenant", "app", "Once upon a time there was ").flagged
+    result = output_moderation.moderation("tenant", "app", "Once upon a time there was his")
+    assert result.flagged
+    assert result.preset_response == "outputs blocked"
+    assert scanned == ["Once upon a time t", "here was ", "his"]
+
+    # a final completion which does not continue the streamed output is scanned again
+    assert not output_moderation.moderation("tenant", "app", "Once upon a time").flagged
@@ -0,0 +1,91 @@
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+from flask import Flask
+
+from core.app.apps.base_app_queue_manager import AppQueueManager
+from core.moderation import output_moderation
+from core.moderation.base import ModerationAction, ModerationOutputsResult
+from core.moderation.output_moderation import ModerationRule, OutputModeration
+
+
+@pytest.fixture
+def moderated_texts(monkeypatch) -> list[str]:
+    """
+    Texts sent to a moderation provider which overrides "bad" words
+    """
+    texts: list[str] = []
+
+    def moderation(self, tenant_id: str, app_id: str, moderation_buffer: str) -> ModerationOutputsResult:
+        texts.append(moderation_buffer)
+        return ModerationOutputsResult(
+            flagged="bad" in moderation_buffer,
+            action=ModerationAction.OVERRIDDEN,
+            text=moderation_buffer.replace("bad", "***"),
+        )
+
+    monkeypatch.setattr(OutputModeration, "moderation", moderation)
+    monkeypatch.setattr(output_moderation.dify_config, "MODERATION_WINDOW_OVERLAP", 3)
+    return texts
+
+
+def _output_moderation() -> OutputModeration:
+    return OutputModeration(
+        tenant_id="tenant",
+        app_id="app",
+        rule=ModerationRule(type="api", config={}),
+        queue_manager=MagicMock(spec=AppQueueManager),
+    )
+
+
+def test_only_new_output_is_moderated(moderated_texts):
+    moderation = _output_moderation()
+
+    moderation._moderate_output("once upon ")
+    moderation._moderate_output("once upon a time")
+
+    assert moderated_texts == ["once upon ", "on a time"]
+    assert moderation.moderation_completion("once upon a time.") == "once upon a time."
+    assert moderated_texts[-1] == "ime."
+
+
+def test_overridden_windows_are_spliced_into_the_output(moderated_texts):
+    moderation = _output_moderation()
+
+    moderation._moderate_output("once upon ba")
+    moderation._moderate_output("once upon bad day")
+    moderation._moderate_output("once upon bad day, bad")
+
+    # the overlap is not sent again once it was overridden
+    assert moderated_texts[1:] == [" bad day", ", bad"]
+    assert moderation.moderation_completion("once upon bad day, bad.") == "once upon *** day, ***."
+
+
+def test_moderation_is_not_incremental_when_disabled(moderated_texts, monkeypatch):
+    monkeypatch.setattr(output_moderation.dify_config, "MODERATION_INCREMENTAL_ENABLED", False)
+    moderation = _output_moderation()
+
+    moderation._moderate_output("bad day")
+    result = moderation._moderate_output("bad day, bad")
+
+    assert moderated_texts == ["bad day", "bad day, bad"]
+    assert result.text == "*** day, ***"
+    assert moderation.moderation_completion("bad day, bad") == "*** day, ***"
+
+
+def test_worker_wakes_up_on_new_output(moderated_texts, monkeypatch):
+    monkeypatch.setattr(output_moderation.dify_config, "MODERATION_BUFFER_SIZE", 5)
+    moderation = _output_moderation()
+    published = threading.Event()
+    moderation.queue_manager.publish.side_effect = lambda event, publish_from: published.set()
+    moderation.thread = threading.Thread(target=moderation.worker, args=(Flask(__name__), 5))
+    moderation.thread.start()
+
+    moderation.append_new_token("a bad")
+
+    assert published.wait(timeout=5)
+    assert moderation.queue_manager.publish.call_args.args[0].text == "a ***"
+    moderation.stop_thread()
+    moderation.thread.join(timeout=5)
+    assert not moderation.thread.is_alive()
@@ -0,0 +1,137 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+from core.rag.datasource.keyword.jieba import jieba
+from core.rag.datasource.keyword.jieba.jieba import Jieba
+from core.rag.datasource.keyword.jieba.jieba_keyword_table_handler import JiebaKeywordTableHandler
+
+
+@pytest.fixture
+def mock_session(monkeypatch) -> MagicMock:
+    db = MagicMock()
+    monkeypatch.setattr(jieba, "db", db)
+    return db.session
+
+
+def _segment(index_node_id: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        id=f"segment_{index_node_id}",
+        index_node_id=index_node_id,
+        index_node_hash="hash",
+        content=f"content {index_node_id}",
+        document_id="document_id",
+        dataset_id="dataset_id",
+    )
+
+
+def test_get_documents_by_node_ids_keeps_rank_order(mock_session):
+    mock_session.query.return_value.filter.return_value.all.return_value = [_segment("b"), _segment("a")]
+
+    documents = Jieba(MagicMock(id="dataset_id"))._get_documents_by_node_ids(["a", "missing", "b"])
+
+    assert [document.metadata["doc_id"] for document in documents] == ["a", "b"]
+    assert documents[0].page_content == "content a"
+    mock_session.query.assert_called_once()
+
+
+def test_update_segments_keywords_in_one_transaction(mock_session, monkeypatch):
+    monkeypatch.setattr(jieba, "SEGMENT_KEYWORDS_UPDATE_BATCH_SIZE", 2)
+    mock_session.query.return_value.filter.return_value.all.side_effect = [
+        [_segment("a"), _segment("b")],
+        [_segment("c")],
+    ]
+
+    Jieba(MagicMock(id="dataset_id"))._update_segments_keywords("dataset_id", {"a": ["k1"], "b": ["k2"], "c": ["k3"]})
+
+    params = [param for call in mock_session.execute.call_args_list for param in call.args[1]]
+    assert params == [
+        {"id": "segment_a", "keywords": ["k1"]},
+        {"id": "segment_b", "keywords": ["k2"]},
+        {"id": "segment_c", "keywords": ["k3"]},
+    ]
+    assert mock_session.execute.call_count == 2
+    mock_session.commit.assert_called_once()
+
+
+def test_retrieve_ids_by_query_ranks_by_bm25(monkeypatch):
+    monkeypatch.setattr(JiebaKeywordTableHandler, "extract_keywords", lambda self, text: set(text.split()))
+    keyword_table = {
+        "common": {"a", "b", "c", "d"},
+        "rare": {"b"},
+        "other": {"a", "c", "d"},
+    }
+
+    scores = Jieba(MagicMock(id="dataset_id"))._retrieve_ids_by_query(keyword_table, "common rare", k=2)
+
+    # the chunk with the rare keyword ranks first
+    assert list(scores.keys())[0] == "b"
+    assert len(scores) == 2
+    assert all(0 < score <= 1 for score in scores.values())
+    assert Jieba(MagicMock(id="dataset_id"))._retrieve_ids_by_query(keyword_table, "missing", k=2) == {}
+
+
+def test_keywords_missing_from_the_table_do_not_lower_scores(monkeypatch):
+    monkeypatch.setattr(JiebaKeywordTableHandler, "extract_keywords", lambda self, text: set(text.split()))
+    keyword_table = {"common": {"a", "b", "c"}, "rare": {"b"}}
+    keyword = Jieba(MagicMock(id="dataset_id"))
+
+    scores = keyword._retrieve_ids_by_query(keyword_table, "common rare", k=3)
+
+    assert keyword._retrieve_ids_by_query(keyword_table, "common rare missing", k=3) == scores
+
+
+def _keyword_table_dataset(keyword_table_data: dict) -> MagicMock:
+    dataset = MagicMock(id="dataset_id")
+    dataset.dataset_keyword_table.data_source_type = "database"
+    dataset.dataset_keyword_table.keyword_table_dict = {"__type__": "keyword_table", "__data__": keyword_table_data}
+    return dataset
+
+
+def test_search_uses_saved_segment_lengths(mock_session, monkeypatch):
+    monkeypatch.setattr(JiebaKeywordTableHandler, "extract_keywords", lambda self, text: set(text.split()))
+    mock_session.query.return_value.filter.return_value.all.return_value = [_segment("a"), _segment("b")]
+    keyword_table = {"common": {"a", "b"}, "rare": {"b"}}
+    keyword = Jieba(MagicMock(id="dataset_id"))
+    keyword.dataset.dataset_keyword_table.data_source_type = "database"
+    keyword._save_dataset_keyword_table(keyword_table)
+    saved_data = json.loads(keyword.dataset.dataset_keyword_table.keyword_table)["__data__"]
+    assert saved_data["segment_lengths"] == {"a": 1, "b": 2}
+
+    keyword = Jieba(_keyword_table_dataset({**saved_data, "table": keyword_table}))
+    count_segment_lengths = MagicMock()
+    monkeypatch.setattr(keyword, "_count_segment_lengths", count_segment_lengths)
+    documents = keyword.search("rare")
+
+    count_segment_lengths.assert_not_called()
+    assert [document.metadata["doc_id"] for document in documents] == ["b"]
+    # rerankers read "score" as the similarity of a vector search
+    assert "score" not in documents[0].metadata
+    assert 0 < documents[0].metadata["keyword_score"] <= 1
+
+
+def test_search_counts_segment_lengths_of_legacy_tables(mock_session, monkeypatch):
+    monkeypatch.setattr(JiebaKeywordTableHandler, "extract_keywords", lambda self, text: set(text.split()))
+    mock_session.query.return_value.filter.return_value.all.return_value = [_segment("b")]
+    keyword = Jieba(_keyword_table_dataset({"index_id": "dataset_id", "summary": None, "table": {"rare": {"b"}}}))
+    save = MagicMock()
+    monkeypatch.setattr(keyword, "_save_dataset_keyword_table", save)
+
+    documents = keyword.search("rare")
+
+    assert [document.metadata["doc_id"] for document in documents] == ["b"]
+    # searches don't write, the segment lengths are added by the migrate-keyword-inverted-index command
+    save.assert_not_called()
+
+
+def test_add_segment_lengths_saves_the_table(monkeypatch):
+    monkeypatch.setattr(jieba, "redis_client", MagicMock())
+    keyword = Jieba(_keyword_table_dataset({"index_id": "dataset_id", "summary": None, "table": {"rare": {"b"}}}))
+    save = MagicMock()
+    monkeypatch.setattr(keyword, "_save_dataset_keyword_table", save)
+
+    keyword._add_segment_lengths()
+
+    save.assert_called_once_with({"rare": {"b"}})
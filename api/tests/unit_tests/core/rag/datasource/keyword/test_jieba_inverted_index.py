@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+from core.rag.datasource.keyword.jieba import jieba_inverted_index
+from core.rag.datasource.keyword.jieba.jieba_inverted_index import JiebaInvertedIndex
+from core.rag.datasource.keyword.jieba.jieba_keyword_table_handler import JiebaKeywordTableHandler
+from core.rag.datasource.keyword.keyword_factory import Keyword
+from core.rag.datasource.keyword.keyword_type import KeyWordType
+
+
+@pytest.fixture
+def mock_session(monkeypatch) -> MagicMock:
+    db = MagicMock()
+    monkeypatch.setattr(jieba_inverted_index, "db", db)
+    return db.session
+
+
+def test_keyword_factory():
+    assert Keyword.get_keyword_factory(KeyWordType.JIEBA_INVERTED_INDEX) is JiebaInvertedIndex
+
+
+def test_add_postings(mock_session, monkeypatch):
+    monkeypatch.setattr(jieba_inverted_index, "POSTINGS_INSERT_BATCH_SIZE", 2)
+    # node_2 is already indexed with keyword "d"
+    mock_session.query.return_value.filter.return_value.all.side_effect = [
+        [SimpleNamespace(index_node_id="node_2", keyword="d")],
+        [],
+    ]
+    keyword = JiebaInvertedIndex(MagicMock(id="dataset_id"))
+
+    keyword._add_postings({"node_1": ["a", "b", "b"], "node_2": ["c", "x" * 256], "node_3": ["a"]})
+
+    *posting_statements, stats_statement = [call.args[0] for call in mock_session.execute.call_args_list]
+    postings = []
+    for statement in posting_statements:
+        params = statement.compile().params
+        postings += [
+            (params[f"keyword_m{i}"], params[f"index_node_id_m{i}"], params[f"length_m{i}"])
+            for i in range(len(params) // 4)
+        ]
+    # duplicated and too long keywords are skipped, lengths count the existing keywords
+    assert sorted(postings) == [
+        ("a", "node_1", 2),
+        ("a", "node_3", 1),
+        ("b", "node_1", 2),
+        ("c", "node_2", 2),
+        ("d", "node_2", 2),
+    ]
+    stats_params = stats_statement.compile().params
+    assert stats_params["segment_count"] == 2
+    assert stats_params["total_length"] == 4
+    mock_session.commit.assert_called_once()
+
+
+def test_search_ranks_by_bm25(mock_session, monkeypatch):
+    monkeypatch.setattr(JiebaKeywordTableHandler, "extract_keywords", lambda self, text: {"a", "b"})
+    mock_session.get.return_value = SimpleNamespace(segment_count=10, total_length=40)
+    grouped_query = mock_session.query.return_value.filter.return_value.group_by.return_value
+    grouped_query.all.return_value = [("a", 5), ("b", 1)]
+    grouped_query.order_by.return_value.limit.return_value.all.return_value = [
+        SimpleNamespace(index_node_id="node_1", score=2.0)
+    ]
+    keyword = JiebaInvertedIndex(MagicMock(id="dataset_id"))
+    monkeypatch.setattr(keyword, "_get_documents_by_node_ids", lambda node_ids, scores: scores)
+
+    scores = keyword.search("query", top_k=2)
+
+    assert list(scores.keys()) == ["node_1"]
+    assert 0 < scores["node_1"] < 1
+
+
+def test_delete_by_ids_without_ids(mock_session):
+    JiebaInvertedIndex(MagicMock(id="dataset_id")).delete_by_ids([])
+
+    mock_session.query.assert_not_called()
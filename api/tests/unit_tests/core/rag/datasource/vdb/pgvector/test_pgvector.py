@@ -0,0 +1,101 @@
+import json
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+from pydantic import ValidationError
+
+from core.rag.datasource.vdb.pgvector import pgvector
+from core.rag.datasource.vdb.pgvector.pgvector import PGVector, PGVectorConfig, PGVectorFactory, _to_vector_literal
+
+VALID_CONFIG = {
+    "host": "localhost",
+    "port": 5433,
+    "user": "postgres",
+    "password": "difyai123456",
+    "database": "dify",
+    "min_connection": 1,
+    "max_connection": 5,
+}
+
+
+@pytest.fixture
+def cursor(monkeypatch) -> MagicMock:
+    cursor = MagicMock()
+    pool = MagicMock()
+    pool.getconn.return_value.cursor.return_value = cursor
+    monkeypatch.setattr(PGVector, "_create_connection_pool", lambda self, config: pool)
+    return cursor
+
+
+def test_vector_type_is_validated():
+    with pytest.raises(ValidationError) as e:
+        PGVectorConfig(**VALID_CONFIG, vector_type="sparsevec")
+    assert e.value.errors()[0]["msg"] == "Value error, config PGVECTOR_VECTOR_TYPE should be vector or halfvec"
+
+
+def test_vector_literal_is_exact_in_single_precision():
+    vector = np.random.default_rng(0).standard_normal(1536).tolist()
+
+    literal = _to_vector_literal(vector)
+
+    parsed = np.array([float(value) for value in literal[1:-1].split(",")], dtype=np.float32)
+    assert np.array_equal(parsed, np.asarray(vector, dtype=np.float32))
+
+
+@pytest.mark.parametrize(("extension_version", "iterative_scan"), [("0.7.4", False), ("0.8.0", True)])
+def test_search_by_vector_filters_in_sql(monkeypatch, cursor, extension_version, iterative_scan):
+    monkeypatch.setattr(pgvector, "_iterative_scan_supported", None)
+    vector = PGVector("collection", PGVectorConfig(**VALID_CONFIG, vector_type="halfvec", hnsw_ef_search=40))
+    cursor.fetchone.return_value = (extension_version,)
+    cursor.__iter__.return_value = iter([({"doc_id": "1"}, "text", 0.25)])
+
+    docs = vector.search_by_vector([0.5, 0.25], top_k=100, score_threshold=0.5, document_ids_filter=["a", "b"])
+
+    assert docs[0].metadata == {"doc_id": "1", "score": 0.75}
+    statements = [call.args for call in cursor.execute.call_args_list]
+    # the candidate list is raised to the number of results
+    assert statements[0] == ("SET LOCAL hnsw.ef_search = %s", (100,))
+    assert (("SET LOCAL hnsw.iterative_scan = strict_order",) in statements) == iterative_scan
+    search_sql, search_params = statements[-1]
+    # the query vector takes the type of the existing column
+    assert "<=> %s AS distance" in search_sql
+    assert "meta->>'document_id' IN %s" in search_sql
+    assert search_params == ("[0.5,0.25]", ("a", "b"), 0.5)
+
+
+def test_search_by_vector_without_filter_keeps_the_index_scan(monkeypatch, cursor):
+    monkeypatch.setattr(pgvector, "_iterative_scan_supported", None)
+    vector = PGVector("collection", PGVectorConfig(**VALID_CONFIG))
+    cursor.__iter__.return_value = iter([])
+
+    vector.search_by_vector([0.5, 0.25], top_k=4)
+
+    assert cursor.execute.call_count == 2
+    assert pgvector._iterative_scan_supported is None
+
+
+def test_index_is_created_for_the_existing_column_type(monkeypatch, cursor):
+    redis_client = MagicMock()
+    redis_client.get.return_value = None
+    monkeypatch.setattr(pgvector, "redis_client", redis_client)
+    vector = PGVector("collection", PGVectorConfig(**VALID_CONFIG, vector_type="halfvec"))
+    cursor.fetchone.return_value = ("vector",)
+
+    vector._create_collection(1536)
+
+    statements = [call.args[0] for call in cursor.execute.call_args_list]
+    assert any("embedding halfvec(1536)" in statement for statement in statements)
+    assert any("USING hnsw (embedding vector_cosine_ops)" in statement for statement in statements)
+
+
+def test_annotation_collections_use_the_configured_vector_type(monkeypatch, cursor):
+    monkeypatch.setattr(pgvector.dify_config, "PGVECTOR_PASSWORD", "difyai123456")
+    monkeypatch.setattr(pgvector.dify_config, "PGVECTOR_VECTOR_TYPE", "halfvec")
+    # annotation collections are searched through a dataset without index struct
+    dataset = MagicMock(id="app_id", index_struct_dict=None)
+
+    vector = PGVectorFactory().init_vector(dataset, [], MagicMock())
+
+    assert vector.vector_type == "halfvec"
+    assert "vector_type" not in json.loads(dataset.index_struct)["vector_store"]
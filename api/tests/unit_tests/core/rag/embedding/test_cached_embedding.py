@@ -0,0 +1,119 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+from cachetools import LRUCache
+from sqlalchemy.dialects import postgresql
+
+from core.rag.embedding import cached_embedding
+from core.rag.embedding.cached_embedding import CacheEmbedding
+from libs import helper
+from models.dataset import Embedding
+
+
+@pytest.fixture
+def mock_db(monkeypatch) -> MagicMock:
+    db = MagicMock()
+    db.session.query.return_value.filter.return_value.all.return_value = []
+    monkeypatch.setattr(cached_embedding, "db", db)
+    return db
+
+
+@pytest.fixture
+def mock_redis(monkeypatch) -> dict[str, bytes]:
+    store: dict[str, bytes] = {}
+    results: list = []
+    pipeline = MagicMock()
+    pipeline.get.side_effect = lambda key: results.append(store.get(key))
+    pipeline.setex.side_effect = lambda key, ttl, value: store.__setitem__(key, value)
+
+    def execute():
+        executed = list(results)
+        results.clear()
+        return executed
+
+    pipeline.execute.side_effect = execute
+    redis = MagicMock()
+    redis.pipeline.return_value = pipeline
+    monkeypatch.setattr(cached_embedding, "redis_client", redis)
+    monkeypatch.setattr(cached_embedding.dify_config, "EMBEDDING_CACHE_REDIS_ENABLED", True)
+    return store
+
+
+@pytest.fixture
+def local_cache(monkeypatch) -> LRUCache:
+    cache: LRUCache = LRUCache(maxsize=100)
+    monkeypatch.setattr(cached_embedding, "_local_embedding_cache", cache)
+    return cache
+
+
+def _model_instance() -> MagicMock:
+    model_instance = MagicMock(provider="openai", model="text-embedding-3-small")
+    model_instance.model_type_instance.get_model_schema.return_value = None
+    return model_instance
+
+
+def _mock_scheduler(monkeypatch, vectors: list[list[float]]) -> None:
+    scheduler = MagicMock()
+    scheduler.embed.return_value = vectors
+    monkeypatch.setattr(cached_embedding, "EmbeddingScheduler", MagicMock(return_value=scheduler))
+
+
+def _db_row(text: str, vector: list[float]) -> SimpleNamespace:
+    return SimpleNamespace(hash=helper.generate_text_hash(text), embedding=Embedding.encode_embedding(vector))
+
+
+def test_cached_embeddings_are_looked_up_in_batches(monkeypatch, mock_db):
+    monkeypatch.setattr(cached_embedding.dify_config, "EMBEDDING_CACHE_LOOKUP_BATCH_SIZE", 2)
+    texts = [f"text {i}" for i in range(5)]
+    mock_db.session.query.return_value.filter.return_value.all.side_effect = [
+        [_db_row(text, [1.0, 0.0])] for text in texts[:3]
+    ]
+    _mock_scheduler(monkeypatch, [[0.0, 2.0], [0.0, 2.0]])
+
+    embeddings = CacheEmbedding(_model_instance()).embed_documents(texts)
+
+    # 5 hashes in batches of 2
+    assert mock_db.session.query.return_value.filter.return_value.all.call_count == 3
+    assert sum(embedding == [1.0, 0.0] for embedding in embeddings) == 3
+    assert sum(embedding == [0.0, 1.0] for embedding in embeddings) == 2
+
+
+def test_new_embeddings_are_inserted_ignoring_conflicts(monkeypatch, mock_db):
+    _mock_scheduler(monkeypatch, [[3.0, 4.0], [3.0, 4.0]])
+
+    embeddings = CacheEmbedding(_model_instance()).embed_documents(["text", "text"])
+
+    assert embeddings == [[0.6000000238418579, 0.800000011920929]] * 2
+    (stmt,), _ = mock_db.session.execute.call_args
+    sql = str(stmt.compile(dialect=postgresql.dialect()))
+    assert "ON CONFLICT (model_name, hash, provider_name) DO NOTHING" in sql
+    # duplicated texts are inserted once
+    assert len(stmt.compile(dialect=postgresql.dialect()).params) == 4
+    mock_db.session.commit.assert_called_once()
+
+
+def test_cached_embeddings_are_served_from_memory_then_redis(monkeypatch, mock_db, mock_redis, local_cache):
+    mock_db.session.query.return_value.filter.return_value.all.return_value = [_db_row("text", [1.0, 0.0])]
+    cache_embedding = CacheEmbedding(_model_instance())
+
+    assert cache_embedding.embed_documents(["text"]) == [[1.0, 0.0]]
+    assert cache_embedding.embed_documents(["text"]) == [[1.0, 0.0]]
+    # another process only shares the redis tier
+    local_cache.clear()
+    assert cache_embedding.embed_documents(["text"]) == [[1.0, 0.0]]
+
+    mock_db.session.query.return_value.filter.return_value.all.assert_called_once()
+    assert len(mock_redis) == 1
+
+
+def test_nan_embeddings_fail_after_caching_the_valid_ones(monkeypatch, mock_db):
+    _mock_scheduler(monkeypatch, [[0.0, 0.0], [3.0, 4.0]])
+    save = MagicMock()
+    monkeypatch.setattr(CacheEmbedding, "_save_document_embeddings", save)
+
+    with pytest.raises(ValueError, match="Failed to embed 1 of 2 texts"):
+        CacheEmbedding(_model_instance()).embed_documents(["nan text", "valid text"])
+
+    (new_embeddings,), _ = save.call_args
+    assert list(new_embeddings) == [helper.generate_text_hash("valid text")]
@@ -0,0 +1,94 @@
+from decimal import Decimal
+from unittest.mock import MagicMock
+
+import pytest
+
+from core.model_runtime.entities.text_embedding_entities import EmbeddingUsage, TextEmbeddingResult
+from core.model_runtime.errors.invoke import InvokeRateLimitError
+from core.rag.embedding import embedding_scheduler
+from core.rag.embedding.embedding_scheduler import EmbeddingScheduler
+
+
+def _embedding_result(texts: list[str]) -> TextEmbeddingResult:
+    return TextEmbeddingResult(
+        model="text-embedding-3-small",
+        embeddings=[[float(len(text))] for text in texts],
+        usage=EmbeddingUsage(
+            tokens=len(texts),
+            total_tokens=len(texts),
+            unit_price=Decimal(0),
+            price_unit=Decimal(0),
+            total_price=Decimal(0),
+            currency="USD",
+            latency=0.1,
+        ),
+    )
+
+
+@pytest.fixture
+def model_instance() -> MagicMock:
+    model_instance = MagicMock(provider="openai", model="text-embedding-3-small", credentials={"api_key": "sk-test"})
+    model_instance.invoke_text_embedding.side_effect = lambda texts, user, input_type: _embedding_result(texts)
+    return model_instance
+
+
+@pytest.fixture
+def mock_redis(monkeypatch) -> MagicMock:
+    # the redis client wrapper raises on attribute access before init_app, which breaks `patch`
+    redis = MagicMock()
+    redis.register_script.return_value.return_value = 1
+    monkeypatch.setattr(embedding_scheduler, "redis_client", redis)
+    monkeypatch.setattr(embedding_scheduler.time, "sleep", lambda seconds: None)
+    return redis
+
+
+def test_batches_are_packed_by_chunks_and_tokens(model_instance, mock_redis):
+    scheduler = EmbeddingScheduler(model_instance, max_chunks=3, max_tokens=10)
+
+    batches = scheduler.pack(["a"] * 4 + ["a " * 12, "a " * 20, "a"])
+
+    assert [len(batch) for batch in batches] == [3, 1, 1, 1, 1]
+
+
+def test_embeddings_keep_the_order_of_the_texts(model_instance, mock_redis):
+    scheduler = EmbeddingScheduler(model_instance, max_chunks=2, max_concurrent_requests=3)
+    texts = ["a" * i for i in range(1, 8)]
+
+    embeddings = scheduler.embed(texts)
+
+    assert embeddings == [[float(i)] for i in range(1, 8)]
+    assert model_instance.invoke_text_embedding.call_count == 4
+    # every request released its slot
+    assert mock_redis.zrem.call_count == 4
+
+
+def test_rate_limited_requests_are_retried_with_a_lower_limit(model_instance, mock_redis):
+    model_instance.invoke_text_embedding.side_effect = [
+        InvokeRateLimitError("rate limited"),
+        _embedding_result(["a", "b"]),
+    ]
+    scheduler = EmbeddingScheduler(model_instance, max_chunks=2)
+
+    assert scheduler.embed(["a", "b"]) == [[1.0], [1.0]]
+
+    scripts = [call.args[0] for call in mock_redis.register_script.call_args_list]
+    assert embedding_scheduler.DECREASE_LIMIT_SCRIPT in scripts
+    assert scripts[-1] == embedding_scheduler.INCREASE_LIMIT_SCRIPT
+
+
+def test_rate_limit_errors_are_raised_after_the_retries(model_instance, mock_redis):
+    model_instance.invoke_text_embedding.side_effect = InvokeRateLimitError("rate limited")
+    scheduler = EmbeddingScheduler(model_instance, max_chunks=2, max_retries=2)
+
+    with pytest.raises(InvokeRateLimitError):
+        scheduler.embed(["a"])
+
+    assert model_instance.invoke_text_embedding.call_count == 3
+
+
+def test_requests_are_sent_without_redis(model_instance, mock_redis):
+    mock_redis.register_script.side_effect = ConnectionError()
+    scheduler = EmbeddingScheduler(model_instance, max_chunks=2)
+
+    assert scheduler.embed(["a"]) == [[1.0]]
+    mock_redis.zrem.assert_not_called()
@@ -0,0 +1,26 @@
+from core.rag.extractor import csv_extractor
+from core.rag.extractor.csv_extractor import CSVExtractor
+
+
+def test_extract_iter_reads_rows_in_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(csv_extractor, "CSV_CHUNK_ROWS", 2)
+    file_path = tmp_path / "data.csv"
+    file_path.write_text("name,age\nalice,30\nbob,40\ncarol,50\n")
+
+    documents = list(CSVExtractor(str(file_path)).extract_iter())
+
+    assert [document.page_content for document in documents] == [
+        "name: alice;age: 30",
+        "name: bob;age: 40",
+        "name: carol;age: 50",
+    ]
+    assert [document.metadata["row"] for document in documents] == [0, 1, 2]
+
+
+def test_extract_detects_encoding_before_reading_rows(tmp_path):
+    file_path = tmp_path / "data.csv"
+    file_path.write_bytes("name\ncafé\n".encode("latin-1"))
+
+    documents = CSVExtractor(str(file_path), encoding="utf-8", autodetect_encoding=True).extract()
+
+    assert [document.page_content for document in documents] == ["name: café"]
@@ -0,0 +1,101 @@
+import json
+import math
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+
+from core.rag.datasource.keyword.jieba.jieba_keyword_table_handler import JiebaKeywordTableHandler
+from core.rag.models.document import Document
+from core.rag.rerank.entity.weight import KeywordSetting, VectorSetting, Weights
+from core.rag.rerank.weight_rerank import WeightRerankRunner
+
+
+@pytest.fixture
+def runner() -> WeightRerankRunner:
+    return WeightRerankRunner(
+        tenant_id="tenant_id",
+        weights=Weights(
+            vector_setting=VectorSetting(
+                vector_weight=0.5, embedding_provider_name="provider", embedding_model_name="model"
+            ),
+            keyword_setting=KeywordSetting(keyword_weight=0.5),
+        ),
+    )
+
+
+@pytest.fixture
+def mock_redis(monkeypatch) -> MagicMock:
+    redis = MagicMock()
+    monkeypatch.setattr("core.rag.rerank.weight_rerank.redis_client", redis)
+    return redis
+
+
+@pytest.fixture
+def extract_keywords(monkeypatch) -> MagicMock:
+    extract = MagicMock(side_effect=lambda text, max_keywords_per_chunk: set(text.split()))
+    monkeypatch.setattr(JiebaKeywordTableHandler, "extract_keywords", lambda self, *args: extract(*args))
+    return extract
+
+
+def test_calculate_keyword_score(runner, mock_redis, extract_keywords):
+    mock_redis.pipeline.return_value.execute.return_value = [None, None, None]
+    documents = [
+        Document(page_content="a b", metadata={"doc_id": "1"}),
+        Document(page_content="b c", metadata={"doc_id": "2"}),
+        Document(page_content="d", metadata={"doc_id": "3"}),
+    ]
+
+    scores = runner._calculate_keyword_score("a b", documents)
+
+    idf_a = idf_c = math.log(4 / 2) + 1
+    idf_b = math.log(4 / 3) + 1
+    expected = idf_b**2 / (math.sqrt(idf_a**2 + idf_b**2) * math.sqrt(idf_b**2 + idf_c**2))
+    assert scores == pytest.approx([1.0, expected, 0.0])
+    assert documents[1].metadata["keywords"] == {"b", "c"}
+    # all missing keywords are cached in a single round trip
+    assert mock_redis.pipeline.return_value.setex.call_count == 3
+    assert mock_redis.pipeline.return_value.execute.call_count == 2
+
+
+def test_calculate_keyword_score_uses_cached_keywords(runner, mock_redis, extract_keywords):
+    mock_redis.pipeline.return_value.execute.return_value = [json.dumps(["a", "b"]).encode()]
+
+    scores = runner._calculate_keyword_score("a", [Document(page_content="a b", metadata={"doc_id": "1"})])
+
+    assert len(scores) == 1
+    # only the query is extracted
+    extract_keywords.assert_called_once_with("a", None)
+
+
+def test_calculate_keyword_score_uses_bm25_scores_of_keyword_search(runner, mock_redis, extract_keywords):
+    mock_redis.pipeline.return_value.execute.return_value = [None, None]
+    documents = [
+        Document(page_content="a b", metadata={"doc_id": "1", "keyword_score": 0.4}),
+        Document(page_content="a", metadata={"doc_id": "2"}),
+        Document(page_content="c", metadata={"doc_id": "3"}),
+    ]
+
+    scores = runner._calculate_keyword_score("a", documents)
+
+    assert scores == pytest.approx([0.4, 1.0, 0.0])
+    # only the query and the documents without a keyword score are extracted
+    assert [call.args[0] for call in extract_keywords.call_args_list] == ["a", "a", "c"]
+
+
+def test_calculate_cosine(runner, monkeypatch):
+    cache_embedding = MagicMock()
+    cache_embedding.embed_query.return_value = [1.0, 0.0]
+    monkeypatch.setattr("core.rag.rerank.weight_rerank.ModelManager", MagicMock())
+    monkeypatch.setattr("core.rag.rerank.weight_rerank.CacheEmbedding", MagicMock(return_value=cache_embedding))
+    documents = [
+        Document(page_content="a", vector=[1.0, 1.0], metadata={"doc_id": "1"}),
+        Document(page_content="b", vector=[0.0, 2.0], metadata={"doc_id": "2", "score": 0.3}),
+        Document(page_content="c", vector=[3.0, 0.0], metadata={"doc_id": "3"}),
+        Document(page_content="d", metadata={"doc_id": "4", "keyword_score": 0.8}),
+    ]
+
+    scores = runner._calculate_cosine("tenant_id", "query", documents, runner.weights.vector_setting)
+
+    # the keyword score of keyword search results is not a cosine
+    assert scores == pytest.approx([1 / np.sqrt(2), 0.3, 1.0, 0.0])
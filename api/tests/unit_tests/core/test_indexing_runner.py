@@ -0,0 +1,128 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from core.indexing_runner import DocumentIsPausedError, IndexingRunner
+from core.rag.models.document import Document
+from models.dataset import Document as DatasetDocument
+
+
+def test_pipeline_indexes_batches_while_extracting(monkeypatch):
+    events: list[str] = []
+
+    def extract_iter(extract_setting, **kwargs):
+        for page in range(5):
+            events.append(f"extract {page}")
+            yield Document(page_content=f"page {page}", metadata={})
+
+    def transform(index_processor, dataset, text_docs, doc_language, process_rule):
+        return [Document(page_content=doc.page_content, metadata={"doc_id": doc.page_content}) for doc in text_docs]
+
+    def index_documents(index_processor, dataset, dataset_document, documents):
+        events.append(f"index {len(documents)}")
+        return len(documents)
+
+    monkeypatch.setattr("core.indexing_runner.db", MagicMock())
+    monkeypatch.setattr("core.indexing_runner.DatasetDocumentStore", MagicMock())
+    monkeypatch.setattr("core.indexing_runner.DocumentSegment", MagicMock())
+    monkeypatch.setattr("core.indexing_runner.dify_config.INDEXING_EXTRACT_BATCH_SIZE", 2)
+    runner = IndexingRunner()
+    monkeypatch.setattr(runner, "_get_extract_setting", MagicMock())
+    monkeypatch.setattr(runner, "_transform", transform)
+    monkeypatch.setattr(runner, "_index_documents", index_documents)
+    update_status = MagicMock()
+    monkeypatch.setattr(runner, "_update_document_index_status", update_status)
+    index_processor = MagicMock()
+    index_processor.extract_iter.side_effect = extract_iter
+    dataset_document = MagicMock(data_source_type="upload_file", doc_form="text_model")
+
+    runner._extract_transform_load(index_processor, MagicMock(), dataset_document, {"mode": "automatic"})
+
+    # the first pages are indexed before the next ones are extracted
+    assert events == [
+        "extract 0",
+        "extract 1",
+        "index 2",
+        "extract 2",
+        "extract 3",
+        "index 2",
+        "extract 4",
+        "index 1",
+    ]
+    # the document is not indexing until the last batch is loaded
+    statuses = [call.kwargs["after_indexing_status"] for call in update_status.call_args_list]
+    assert statuses == ["splitting", "splitting", "splitting", "completed"]
+    completed = update_status.call_args_list[-1].kwargs
+    assert completed["extra_update_params"][DatasetDocument.tokens] == 5
+    assert completed["extra_update_params"][DatasetDocument.word_count] == len("page 0") * 5
+
+
+def test_paused_pipeline_is_recovered_from_splitting(monkeypatch):
+    indexed: list[str] = []
+    segments: list[MagicMock] = []
+
+    def extract_iter(extract_setting, **kwargs):
+        for page in range(5):
+            yield Document(page_content=f"page {page}", metadata={})
+
+    def transform(index_processor, dataset, text_docs, doc_language, process_rule):
+        return [Document(page_content=doc.page_content, metadata={"doc_id": doc.page_content}) for doc in text_docs]
+
+    def add_documents(docs, save_child):
+        segments.extend(MagicMock(index_node_id=doc.metadata["doc_id"]) for doc in docs)
+
+    def index_documents(index_processor, dataset, dataset_document, documents):
+        indexed.extend(document.metadata["doc_id"] for document in documents)
+        return len(documents)
+
+    def clean(dataset, node_ids, **kwargs):
+        for node_id in node_ids:
+            indexed.remove(node_id)
+
+    statuses: list[str] = []
+    paused = True
+
+    def update_status(document_id, after_indexing_status, extra_update_params=None):
+        if paused and len(indexed) == 2:
+            raise DocumentIsPausedError()
+        statuses.append(after_indexing_status)
+
+    db = MagicMock()
+    db.session.query.return_value.filter.return_value.first.return_value.to_dict.return_value = {"mode": "automatic"}
+    monkeypatch.setattr("core.indexing_runner.db", db)
+    monkeypatch.setattr("core.indexing_runner.Dataset", MagicMock())
+    doc_store = MagicMock()
+    doc_store.return_value.add_documents.side_effect = add_documents
+    monkeypatch.setattr("core.indexing_runner.DatasetDocumentStore", doc_store)
+    document_segment = MagicMock()
+    document_segment.query.filter_by.return_value.all.side_effect = lambda: list(segments)
+    monkeypatch.setattr("core.indexing_runner.DocumentSegment", document_segment)
+    index_processor = MagicMock()
+    index_processor.extract_iter.side_effect = extract_iter
+    index_processor.clean.side_effect = clean
+    monkeypatch.setattr(
+        "core.indexing_runner.IndexProcessorFactory",
+        MagicMock(return_value=MagicMock(init_index_processor=lambda: index_processor)),
+    )
+    monkeypatch.setattr("core.indexing_runner.dify_config.INDEXING_EXTRACT_BATCH_SIZE", 2)
+    runner = IndexingRunner()
+    monkeypatch.setattr(runner, "_get_extract_setting", MagicMock())
+    monkeypatch.setattr(runner, "_transform", transform)
+    monkeypatch.setattr(runner, "_index_documents", index_documents)
+    monkeypatch.setattr(runner, "_update_document_index_status", update_status)
+    dataset_document = MagicMock(data_source_type="upload_file", doc_form="text_model")
+
+    with pytest.raises(DocumentIsPausedError):
+        runner._extract_transform_load(index_processor, MagicMock(), dataset_document, {"mode": "automatic"})
+    # the recover task extracts the document again when it is in splitting
+    assert statuses[-1] == "splitting"
+    assert indexed == ["page 0", "page 1"]
+
+    paused = False
+    segments_before_recovery = list(segments)
+    runner.run_in_splitting_status(dataset_document)
+
+    # the batches loaded before the pause are removed from the index with their segments, then the file is loaded
+    assert [call.args[0] for call in db.session.delete.call_args_list] == segments_before_recovery
+    assert indexed == [f"page {page}" for page in range(5)]
+    assert statuses[-1] == "completed"
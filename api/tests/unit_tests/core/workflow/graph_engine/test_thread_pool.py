@@ -0,0 +1,106 @@
+import contextvars
+import threading
+
+import pytest
+
+from core.workflow.graph_engine.graph_engine import GraphEngineThreadPool
+from core.workflow.graph_engine.thread_pool import WorkflowThreadPool
+
+
+@pytest.fixture
+def workflow_thread_pool(monkeypatch):
+    pool = WorkflowThreadPool(max_workers=2, max_workers_per_tenant=1, max_queue_size=3, max_nested_workers=2)
+    monkeypatch.setattr("core.workflow.graph_engine.graph_engine.workflow_thread_pool", pool)
+    return pool
+
+
+def test_fair_share_between_tenants(workflow_thread_pool):
+    release = threading.Event()
+    started: list[str] = []
+    lock = threading.Lock()
+
+    def task(name: str):
+        with lock:
+            started.append(name)
+        release.wait(timeout=5)
+
+    run_a = GraphEngineThreadPool(tenant_id="a", max_workers=10)
+    run_b = GraphEngineThreadPool(tenant_id="b", max_workers=10)
+    futures = [run_a.submit(task, "a1"), run_a.submit(task, "a2"), run_b.submit(task, "b1")]
+
+    # tenant a is limited to one worker, so tenant b gets the second one
+    for _ in range(100):
+        if len(started) == 2:
+            break
+        threading.Event().wait(0.01)
+    assert sorted(started) == ["a1", "b1"]
+    assert workflow_thread_pool.get_metrics()["queue_depth"] == 1
+
+    release.set()
+    for future in futures:
+        future.result(timeout=5)
+    assert sorted(started) == ["a1", "a2", "b1"]
+    assert workflow_thread_pool.get_metrics()["dispatched"] == 3
+
+
+def test_reject_when_queue_is_full(workflow_thread_pool):
+    release = threading.Event()
+    run = GraphEngineThreadPool(tenant_id="a", max_workers=1)
+    futures = [run.submit(release.wait, 5) for _ in range(4)]
+
+    with pytest.raises(ValueError):
+        run.submit(release.wait, 5)
+    assert run.submit_count == 4
+    assert workflow_thread_pool.get_metrics()["rejected"] == 1
+
+    release.set()
+    for future in futures:
+        future.result(timeout=5)
+
+
+def test_nested_submit_does_not_wait_for_workers(workflow_thread_pool):
+    run = GraphEngineThreadPool(tenant_id="a", max_workers=10)
+
+    def parent():
+        # the only worker of tenant a is held by this task
+        children = [run.submit(lambda i=i: i * 2) for i in range(3)]
+        return [child.result(timeout=5) for child in children]
+
+    assert run.submit(parent).result(timeout=5) == [0, 2, 4]
+    # only the parent went through the queue
+    assert workflow_thread_pool.get_metrics()["dispatched"] == 1
+
+
+def test_nested_tasks_run_on_the_submitting_thread_when_saturated(workflow_thread_pool):
+    run = GraphEngineThreadPool(tenant_id="a", max_workers=10)
+    release = threading.Event()
+    threads: list[str] = []
+
+    def child():
+        threads.append(threading.current_thread().name)
+        release.wait(timeout=5)
+
+    def parent():
+        children = [run.submit(child) for _ in range(2)]
+        # both nested workers are busy, the next task runs before submit returns
+        inline = run.submit(threading.current_thread)
+        assert inline.done()
+        release.set()
+        for future in children:
+            future.result(timeout=5)
+        return inline.result() is threading.current_thread()
+
+    assert run.submit(parent).result(timeout=5)
+
+    assert all(name.startswith("workflow_thread_pool_nested") for name in threads)
+    metrics = workflow_thread_pool.get_metrics()
+    assert metrics["nested_inline"] == 1
+    assert metrics["nested_running"] == 0
+
+
+def test_tasks_run_in_the_context_of_their_submitter(workflow_thread_pool):
+    run_id: contextvars.ContextVar[str] = contextvars.ContextVar("run_id")
+    run_id.set("run")
+    run = GraphEngineThreadPool(tenant_id="a", max_workers=1)
+
+    assert run.submit(run_id.get).result(timeout=5) == "run"
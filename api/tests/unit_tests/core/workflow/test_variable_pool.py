@@ -44,3 +44,46 @@ def test_use_long_selector(pool):
     result = pool.get(("node_1", "part_1", "part_2"))
     assert result is not None
     assert result.value == "test_value"
+
+
+def test_child_pool_reads_through_to_parent(pool):
+    pool.add(("node_1", "var"), StringSegment(value="parent"))
+    pool.add(("node_2", "var"), StringSegment(value="parent"))
+    child = pool.create_child()
+
+    child.add(("node_1", "var"), StringSegment(value="child"))
+    child.add(("node_3", "var"), StringSegment(value="child"))
+
+    assert child.get(("node_1", "var")).value == "child"
+    assert child.get(("node_2", "var")).value == "parent"
+    assert child.get(("node_3", "var")).value == "child"
+    # writes to the child don't leak into the parent
+    assert pool.get(("node_1", "var")).value == "parent"
+    assert pool.get(("node_3", "var")) is None
+    assert "node_2" not in child.variable_dictionary
+
+
+def test_child_pool_removal_hides_parent_variables(pool):
+    pool.add(("node_1", "var"), StringSegment(value="parent"))
+    pool.add(("node_2", "var_1"), StringSegment(value="parent"))
+    pool.add(("node_2", "var_2"), StringSegment(value="parent"))
+    child = pool.create_child()
+
+    child.remove(("node_1", "var"))
+    child.remove(("node_2",))
+    assert child.get(("node_1", "var")) is None
+    assert child.get(("node_2", "var_1")) is None
+
+    child.add(("node_2", "var_1"), StringSegment(value="child"))
+    assert child.get(("node_2", "var_1")).value == "child"
+    assert child.get(("node_2", "var_2")) is None
+    assert pool.get(("node_2", "var_2")).value == "parent"
+
+
+def test_child_pool_get_file_attribute(pool, file):
+    pool.add(("node_1", "file_var"), FileSegment(value=file))
+    child = pool.create_child().create_child()
+
+    result = child.get(("node_1", "file_var", "name"))
+    assert result is not None
+    assert result.value == file.filename
@@ -1,7 +1,9 @@
+from unittest.mock import MagicMock
+
 import rsa as pyrsa
 from Crypto.PublicKey import RSA
 
-from libs import gmpy2_pkcs10aep_cipher
+from libs import gmpy2_pkcs10aep_cipher, rsa
 
 
 def test_gmpy2_pkcs10aep_cipher() -> None:
@@ -27,3 +29,21 @@ def test_gmpy2_pkcs10aep_cipher() -> None:
     encrypted_by_private_key = private_cipher_rsa.encrypt(message=raw_text_bytes)
     decrypted_by_private_key = private_cipher_rsa.decrypt(encrypted_by_private_key)
     assert decrypted_by_private_key == raw_text_bytes
+
+
+def test_get_decrypt_decoding_reuses_parsed_key(monkeypatch) -> None:
+    private_key = RSA.generate(2048).export_key()
+    storage = MagicMock()
+    storage.load.return_value = private_key
+    redis = MagicMock()
+    redis.get.return_value = None
+    monkeypatch.setattr(rsa, "storage", storage)
+    monkeypatch.setattr(rsa, "redis_client", redis)
+    rsa._decrypt_decoding_cache.clear()
+
+    rsa_key, cipher_rsa = rsa.get_decrypt_decoding("tenant")
+    assert rsa.get_decrypt_decoding("tenant") == (rsa_key, cipher_rsa)
+    storage.load.assert_called_once()
+
+    encrypted = rsa.encrypt("secret", rsa_key.publickey().export_key())
+    assert rsa.decrypt_token_with_decoding(encrypted, rsa_key, cipher_rsa) == "secret"
@@ -0,0 +1,35 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from models.dataset import Embedding
+
+
+def test_encode_and_decode_embedding():
+    vector = [0.1, -0.2, 0.3, 0.4]
+
+    data = Embedding.encode_embedding(vector)
+
+    assert data.startswith(Embedding.EMBEDDING_FORMAT_MAGIC)
+    assert len(data) == len(Embedding.EMBEDDING_FORMAT_MAGIC) + 1 + 4 * len(vector)
+    assert not Embedding.is_legacy_embedding(data)
+    decoded = Embedding.decode_embedding(data)
+    assert decoded.dtype == np.float32
+    assert np.allclose(decoded, vector)
+
+
+def test_decode_legacy_pickled_embedding():
+    vector = [0.1, -0.2, 0.3, 0.4]
+
+    data = pickle.dumps(vector, protocol=pickle.HIGHEST_PROTOCOL)
+
+    assert Embedding.is_legacy_embedding(data)
+    assert np.allclose(Embedding.decode_embedding(data), vector)
+
+
+def test_decode_unsupported_embedding_version():
+    data = Embedding.EMBEDDING_FORMAT_MAGIC + bytes([Embedding.EMBEDDING_FORMAT_VERSION + 1])
+
+    with pytest.raises(ValueError):
+        Embedding.decode_embedding(data)
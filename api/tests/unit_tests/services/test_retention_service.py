@@ -0,0 +1,94 @@
+import datetime
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+from sqlalchemy.sql.dml import Delete
+
+from models.model import App, Message
+from services import retention_service
+from services.retention_service import MESSAGE_RELATED_MODELS, RetentionService
+
+
+@pytest.fixture
+def mock_redis(monkeypatch) -> MagicMock:
+    store: dict[str, bytes] = {}
+    redis = MagicMock()
+    redis.get.side_effect = lambda key: store.get(key)
+    redis.setex.side_effect = lambda key, ttl, value: store.__setitem__(key, value.encode())
+    monkeypatch.setattr(retention_service, "redis_client", redis)
+    return redis
+
+
+@pytest.fixture
+def mock_plans(monkeypatch) -> MagicMock:
+    plans = {"sandbox-tenant": "sandbox", "paid-tenant": "professional"}
+    get_features = MagicMock(
+        side_effect=lambda tenant_id: SimpleNamespace(
+            billing=SimpleNamespace(subscription=SimpleNamespace(plan=plans[tenant_id]))
+        )
+    )
+    monkeypatch.setattr(retention_service.FeatureService, "get_features", get_features)
+    return get_features
+
+
+def _message(message_id: str, app_id: str, days_ago: int):
+    created_at = datetime.datetime.now() - datetime.timedelta(days=days_ago)
+    return SimpleNamespace(id=message_id, app_id=app_id, created_at=created_at)
+
+
+def test_plans_are_fetched_once(mock_redis, mock_plans):
+    tenant_plans: dict[str, str] = {}
+
+    assert RetentionService._get_plan("sandbox-tenant", tenant_plans) == "sandbox"
+    assert RetentionService._get_plan("sandbox-tenant", tenant_plans) == "sandbox"
+    # another run only has the redis cache
+    assert RetentionService._get_plan("sandbox-tenant", {}) == "sandbox"
+
+    mock_plans.assert_called_once_with("sandbox-tenant")
+    assert mock_redis.get.call_count == 2
+
+
+@pytest.mark.parametrize("dry_run", [False, True])
+def test_clean_messages_deletes_messages_of_sandbox_tenants(monkeypatch, mock_redis, mock_plans, dry_run):
+    batches = [
+        [
+            _message("m1", "sandbox-app", 40),
+            _message("m2", "paid-app", 41),
+            _message("m3", "deleted-app", 42),
+        ],
+        [_message("m4", "sandbox-app", 43)],
+        [],
+    ]
+    deleted_conditions = []
+
+    def execute(stmt):
+        if isinstance(stmt, Delete):
+            deleted_conditions.append((stmt.table.name, stmt.whereclause.right.value))
+            return MagicMock(rowcount=len(stmt.whereclause.right.value))
+        if stmt.column_descriptions[0]["entity"] is App:
+            return [
+                SimpleNamespace(id="sandbox-app", tenant_id="sandbox-tenant"),
+                SimpleNamespace(id="paid-app", tenant_id="paid-tenant"),
+            ]
+        return MagicMock(all=MagicMock(return_value=batches.pop(0)))
+
+    session = MagicMock()
+    session.execute.side_effect = execute
+    session.scalar.side_effect = lambda stmt: 1
+    monkeypatch.setattr(retention_service, "db", MagicMock(session=session))
+
+    stats = RetentionService.clean_messages(dry_run=dry_run, batch_size=3, batch_sleep_ms=0)
+
+    assert stats[Message.__tablename__] == 2
+    assert len(stats) == len(MESSAGE_RELATED_MODELS) + 1
+    # apps and plans are looked up once per run
+    assert mock_plans.call_count == 2
+    if dry_run:
+        assert not deleted_conditions
+        session.commit.assert_not_called()
+    else:
+        assert (Message.__tablename__, ["m1"]) in deleted_conditions
+        assert (Message.__tablename__, ["m4"]) in deleted_conditions
+        assert len(deleted_conditions) == 2 * (len(MESSAGE_RELATED_MODELS) + 1)
+        assert session.commit.call_count == 2
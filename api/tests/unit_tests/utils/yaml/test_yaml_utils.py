@@ -3,6 +3,7 @@ from textwrap import dedent
 import pytest
 from yaml import YAMLError  # type: ignore
 
+from core.tools.utils import yaml_utils
 from core.tools.utils.yaml_utils import load_yaml_file
 
 EXAMPLE_YAML_FILE = "example_yaml.yaml"
@@ -33,6 +34,20 @@ def prepare_example_yaml_file(tmp_path, monkeypatch) -> str:
     return str(file_path)
 
 
+@pytest.fixture
+def yaml_bundle_sources(tmp_path, monkeypatch) -> tuple:
+    source_dir = tmp_path.joinpath("model_providers")
+    source_dir.mkdir()
+    source_dir.joinpath("openai.yaml").write_text("provider: openai\nsupported_model_types:\n  - llm\n")
+    # dates are not JSON, the file is parsed when loaded
+    source_dir.joinpath("released.yaml").write_text("released: 2024-01-01\n")
+    monkeypatch.setattr(yaml_utils, "API_ROOT", tmp_path)
+    monkeypatch.setattr(yaml_utils, "BUNDLE_SOURCE_DIRS", (source_dir,))
+    monkeypatch.setattr(yaml_utils.dify_config, "YAML_BUNDLE_DIR", str(tmp_path.joinpath("bundle")))
+    monkeypatch.setattr(yaml_utils, "_bundle", None)
+    return source_dir, tmp_path.joinpath("bundle")
+
+
 @pytest.fixture
 def prepare_invalid_yaml_file(tmp_path, monkeypatch) -> str:
     monkeypatch.chdir(tmp_path)
@@ -81,3 +96,34 @@ def test_load_invalid_yaml_file(prepare_invalid_yaml_file):
 
     # ignore error
     assert load_yaml_file(file_path=prepare_invalid_yaml_file) == {}
+
+
+def test_load_yaml_file_from_bundle(yaml_bundle_sources, monkeypatch):
+    source_dir, bundle_dir = yaml_bundle_sources
+    file_path = str(source_dir.joinpath("openai.yaml"))
+
+    yaml_data = load_yaml_file(file_path)
+    yaml_data["supported_model_types"].append("text-embedding")
+
+    assert len(list(bundle_dir.iterdir())) == 1
+    # every call gets its own copy
+    assert load_yaml_file(file_path) == {"provider": "openai", "supported_model_types": ["llm"]}
+    assert str(load_yaml_file(str(source_dir.joinpath("released.yaml")))["released"]) == "2024-01-01"
+
+    # another process loads the compiled bundle instead of parsing the files
+    monkeypatch.setattr(yaml_utils, "_bundle", None)
+    monkeypatch.setattr(yaml_utils, "_compile_documents", None)
+    assert load_yaml_file(file_path)["provider"] == "openai"
+
+
+def test_changed_yaml_files_compile_a_new_bundle(yaml_bundle_sources, monkeypatch):
+    source_dir, bundle_dir = yaml_bundle_sources
+    file_path = str(source_dir.joinpath("openai.yaml"))
+    first_bundle_path = yaml_utils.compile_yaml_bundle()
+
+    source_dir.joinpath("openai.yaml").write_text("provider: openai\nsupported_model_types: []\n")
+    monkeypatch.setattr(yaml_utils, "_bundle", None)
+
+    assert load_yaml_file(file_path)["supported_model_types"] == []
+    assert [str(path) for path in bundle_dir.iterdir()] != [first_bundle_path]
+    assert len(list(bundle_dir.iterdir())) == 1